@@ -5,13 +5,14 @@ import uuid, os
 from datetime import datetime
 
 from fastapi.responses import FileResponse
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Query
+from fastapi import APIRouter, BackgroundTasks, UploadFile, File, HTTPException, Depends, Query
 from sqlalchemy import select, func
 from app.core.auth import require_user
 from app.db.session import async_session
 from app.db.models import MfgFile
 from app.core.logger import get_logger
 from app.core.config import settings
+from app.services.pipeline import media_meta, pretranscode
 
 log = get_logger(__name__)
 router = APIRouter()
@@ -19,8 +20,14 @@ router = APIRouter()
 def _safe_name(name: str) -> str:
     return "".join(c for c in name if c.isalnum() or c in " .-_").strip() or "file"
 
+def _media_fields(r: MfgFile) -> dict:
+    return {
+        "duration_s": r.duration_s, "codec": r.codec, "channels": r.channels,
+        "sample_rate": r.sample_rate, "bitrate": r.bitrate,
+    }
+
 @router.post("/", status_code=201)
-async def upload_file(f: UploadFile = File(...), user=Depends(require_user)):
+async def upload_file(background: BackgroundTasks, f: UploadFile = File(...), user=Depends(require_user)):
     now = datetime.utcnow()
     subdir = Path(settings.upload_dir) / f"{now.year:04d}" / f"{now.month:02d}"
     subdir.mkdir(parents=True, exist_ok=True)
@@ -49,6 +56,10 @@ async def upload_file(f: UploadFile = File(...), user=Depends(require_user)):
         s.add(row)
         await s.commit()
         await s.refresh(row)
+        # метаданные (codec/длительность/...) — один ffprobe в фоне, дальше их читают из mfg_file
+        background.add_task(media_meta.probe_file, row.id)
+        if settings.pretranscode_on_upload:
+            background.add_task(pretranscode.enqueue, row.id)
         return {
             "id": row.id,
             "filename": row.filename,
@@ -76,7 +87,7 @@ async def list_files(
         return {"items": [
             {
                 "id": r.id, "filename": r.filename, "size_bytes": r.size_bytes,
-                "mimetype": r.mimetype, "created_at": r.created_at
+                "mimetype": r.mimetype, "created_at": r.created_at, **_media_fields(r),
             } for r in rows
         ], "total": total}
 
@@ -90,7 +101,7 @@ async def get_file(file_id: int, user=Depends(require_user)):
             raise HTTPException(404, "File not found")
         return {
             "id": r.id, "filename": r.filename, "size_bytes": r.size_bytes,
-            "mimetype": r.mimetype, "created_at": r.created_at
+            "mimetype": r.mimetype, "created_at": r.created_at, **_media_fields(r),
         }
 
 
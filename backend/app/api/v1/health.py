@@ -11,6 +11,9 @@ from sqlalchemy.ext.asyncio import AsyncEngine
 from app.core.logger import get_logger
 from app.core.config import settings
 from app.db.session import async_engine
+from app.services import ollama
+from app.services.pipeline import asr_cache, asr_pool, diar_cache, ffmpeg, media_cache, executor as inference_executor
+from app.services.pipeline.registry import whisper_registry
 
 log = get_logger(__name__)
 router = APIRouter()
@@ -28,12 +31,12 @@ async def _check_db(engine: AsyncEngine) -> tuple[bool, str]:
 
 async def _check_ollama() -> tuple[bool, str]:
     try:
-        async with httpx.AsyncClient(timeout=2.0) as client:
-            url = settings.ollama_url.rstrip("/") + "/api/tags"
-            r = await client.get(url)
-            if r.status_code == 200:
-                return True, "ok"
-            return False, f"http {r.status_code}"
+        r = await ollama.get("/api/tags", "health")
+        if r.status_code == 200:
+            return True, "ok"
+        return False, f"http {r.status_code}"
+    except httpx.HTTPStatusError as e:
+        return False, f"http {e.response.status_code}"
     except Exception as e:
         return False, f"error: {type(e).__name__}"
 
@@ -85,6 +88,14 @@ async def healthz() -> Dict[str, Any]:
             "ffmpeg": {"ok": ff_ok, "msg": ff_msg},
             "cuda": cuda,
         },
+        "inference": inference_executor.stats(),
+        "asr_models": whisper_registry.stats(),
+        "asr_pool": asr_pool.stats(),
+        "asr_cache": asr_cache.stats(),
+        "diar_cache": diar_cache.stats(),
+        "media_cache": media_cache.stats(),
+        "transcode": ffmpeg.stats(),
+        "ollama_client": ollama.stats(),
     }
 
 @router.get("/readyz")
@@ -9,6 +9,7 @@ from app.services.jobs.api import process_protokol
 from app.core.logger import get_logger
 from app.core.auth import require_user
 from app.services.audit import audit_log
+from app.services.pipeline.registry import whisper_registry
 
 log = get_logger(__name__)
 router = APIRouter()
@@ -28,6 +29,11 @@ async def upload_and_run_protokol(
     if not mfg_file:
         raise HTTPException(status_code=404, detail="File not found")
 
+    try:
+        asr_model = whisper_registry.resolve(data.asr_model)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     try:
         tmp_path.write_bytes(await file.read())
         log.info("Saved upload to %s", tmp_path)
@@ -68,6 +74,7 @@ async def upload_and_run_protokol(
         "ru",
         "json",
         data.seg,
+        asr_model,
     )
 
     await audit_log(
@@ -75,7 +82,7 @@ async def upload_and_run_protokol(
         "start_protokol",
         "transcript",
         transcript.id,
-        {"lang": "ru", "format": "json", "seg": data.seg},
+        {"lang": "ru", "format": "json", "seg": data.seg, "asr_model": asr_model},
     )
 
     return ProtokolResponse(
@@ -1,3 +1,5 @@
+from typing import Optional
+
 from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
 from sqlalchemy import select, func, asc, delete
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -10,18 +12,17 @@ from app.schemas.v2 import SegmentStartIn, SegmentStartOut, SegmentStateOut, Tra
 from app.schemas.v2 import TranscriptV2Result, SpeakerItem as SP, DiarItem as DI, SegmentTextItem as STI
 from app.services.jobs.api import process_diarization, process_segmentation, process_pipeline
 from app.services.jobs.steps import pipeline as pipeline_step
+from app.services.pipeline import media_meta, pcm
+from app.services.pipeline.registry import whisper_registry
 
 log = get_logger(__name__)
 router = APIRouter()
 
 async def _run_full_segmentation(transcript_id: int, audio_path: str, file_id: int, mode: str) -> int:
-    import torchaudio
-    try:
-        info = torchaudio.info(audio_path)
-        dur = max(0.0, float(info.num_frames) / float(info.sample_rate))
-    except Exception:
-        log.exception("Cannot probe duration; use 0s")
-        dur = 0.0
+    meta = await media_meta.get(audio_path)
+    dur = max(0.0, float((meta or {}).get("duration_s") or 0.0))
+    if not dur:
+        log.warning("Cannot get duration for %s; use 0s", audio_path)
     async with async_session() as s:
         s.add(MfgDiarization(
             transcript_id=transcript_id, mode=mode, speaker="SPEECH",
@@ -55,12 +56,13 @@ async def _wrap_segmentation_and_mark_done(mode: str, transcript_id: int) -> Non
             raise RuntimeError("Audio file path is not set")
 
         # 2) Запустим нужный шаг
-        if mode == "diarize":
-            from app.services.jobs.steps import diarization as diar_step
-            chunks = await diar_step.run(transcript_id, audio_path)
-        else:
-            from app.services.jobs.steps import segmentation as seg_step
-            chunks = await seg_step.run(transcript_id, audio_path, mode=mode)
+        with pcm.job_scope():
+            if mode == "diarize":
+                from app.services.jobs.steps import diarization as diar_step
+                chunks = await diar_step.run(transcript_id, audio_path)
+            else:
+                from app.services.jobs.steps import segmentation as seg_step
+                chunks = await seg_step.run(transcript_id, audio_path, mode=mode)
 
         log.info("Segmentation done: tid=%s mode=%s chunks=%s", transcript_id, mode, chunks)
 
@@ -171,6 +173,7 @@ async def start_transcription_from_segments(
     transcript_id: int,
     background_tasks: BackgroundTasks,
     mode: SegmentMode = "diarize",
+    model: Optional[str] = None,
     session: AsyncSession = Depends(get_session),
     user = Depends(require_user),
 ) -> TranscriptionStartOut:
@@ -178,6 +181,12 @@ async def start_transcription_from_segments(
     if not tr or tr.user_id != user.id:
         raise HTTPException(status_code=404, detail="Transcript not found")
 
+    # тир Whisper (ASR_MODELS); None → ASR_DEFAULT_MODEL
+    try:
+        model = whisper_registry.resolve(model)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     # Можно валидировать наличие чанков в этом режиме
     exists = (await session.execute(
         select(func.count(MfgDiarization.id))
@@ -186,7 +195,7 @@ async def start_transcription_from_segments(
     if exists == 0:
         raise HTTPException(status_code=400, detail=f"No segments for mode={mode}")
 
-    background_tasks.add_task(pipeline_step.run, transcript_id, "ru", mode)
+    background_tasks.add_task(pipeline_step.run, transcript_id, "ru", mode, model)
     tr.status = "transcription_processing"
     session.add(tr); await session.commit()
     return TranscriptionStartOut(transcript_id=transcript_id, status="transcription_processing")
@@ -0,0 +1,104 @@
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.auth import require_user
+from app.core.logger import get_logger
+from app.db.session import get_session
+from app.db.models import MfgTranscript, MfgSpeakerProfile
+from app.schemas.v2 import SpeakerProfileOut, SpeakerEnrollIn, SpeakerMatchItem
+from app.services import speakers
+from app.services.audit import audit_log
+
+log = get_logger(__name__)
+router = APIRouter()
+
+
+def _profile_out(p: MfgSpeakerProfile) -> SpeakerProfileOut:
+    return SpeakerProfileOut(id=p.id, display_name=p.display_name, color=p.color, n_samples=p.n_samples or 1)
+
+
+async def _own_transcript(session: AsyncSession, transcript_id: int, user) -> MfgTranscript:
+    tr = await session.get(MfgTranscript, transcript_id)
+    if not tr or tr.user_id != user.id:
+        raise HTTPException(status_code=404, detail="Transcript not found")
+    return tr
+
+
+@router.get("/profiles", response_model=List[SpeakerProfileOut])
+async def list_profiles(
+    session: AsyncSession = Depends(get_session),
+    user=Depends(require_user),
+):
+    rows = (await session.execute(
+        select(MfgSpeakerProfile)
+        .where(MfgSpeakerProfile.user_id == user.id)
+        .order_by(MfgSpeakerProfile.display_name.asc())
+    )).scalars().all()
+    return [_profile_out(p) for p in rows]
+
+
+@router.delete("/profiles/{profile_id}")
+async def delete_profile(
+    profile_id: int,
+    session: AsyncSession = Depends(get_session),
+    user=Depends(require_user),
+):
+    p = await session.get(MfgSpeakerProfile, profile_id)
+    if not p or p.user_id != user.id:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    await session.delete(p)
+    await session.commit()
+    await audit_log(user.id, "delete", "speaker_profile", profile_id)
+    return {"deleted": profile_id}
+
+
+@router.post("/enroll", response_model=SpeakerProfileOut)
+async def enroll_speaker(
+    payload: SpeakerEnrollIn,
+    session: AsyncSession = Depends(get_session),
+    user=Depends(require_user),
+):
+    await _own_transcript(session, payload.transcript_id, user)
+    try:
+        profile = await speakers.enroll(
+            session,
+            payload.transcript_id,
+            payload.speaker,
+            display_name=payload.display_name,
+            color=payload.color,
+            profile_id=payload.profile_id,
+            user_id=user.id,
+        )
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    await audit_log(user.id, "enroll", "speaker_profile", profile.id,
+                    {"transcript_id": payload.transcript_id, "speaker": payload.speaker})
+    return _profile_out(profile)
+
+
+@router.get("/transcripts/{transcript_id}/matches", response_model=List[SpeakerMatchItem])
+async def get_matches(
+    transcript_id: int,
+    session: AsyncSession = Depends(get_session),
+    user=Depends(require_user),
+):
+    """Текущее сопоставление спикеров транскрипта с профилями (только чтение)."""
+    await _own_transcript(session, transcript_id, user)
+    return [SpeakerMatchItem(**m) for m in await speakers.list_matches(session, transcript_id)]
+
+
+@router.post("/transcripts/{transcript_id}/match", response_model=List[SpeakerMatchItem])
+async def rematch(
+    transcript_id: int,
+    threshold: Optional[float] = Query(None, ge=0.0, le=2.0),
+    session: AsyncSession = Depends(get_session),
+    user=Depends(require_user),
+):
+    """Пересчитать сопоставление спикеров транскрипта с профилями (и автозаполнить MfgSpeaker)."""
+    await _own_transcript(session, transcript_id, user)
+    return [SpeakerMatchItem(**m) for m in await speakers.match_transcript(session, transcript_id, threshold)]
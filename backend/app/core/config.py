@@ -8,10 +8,37 @@ class Settings(BaseSettings):
     hf_token: str = Field(..., description="Токен Hugging Face для pyannote (HF_TOKEN)")
     device: str = Field(..., description="Устройство инференса: 'cuda' или 'cpu' (DEVICE)")
 
+    # ───────── ASR (Whisper) ─────────
+    asr_models: str = Field("tiny:int8,medium:int8,large-v3:auto", description="Тиры Whisper 'модель:compute_type,...'; auto = float16 на CUDA / int8 на CPU (ASR_MODELS)")
+    asr_default_model: str = Field("large-v3", description="Тир по умолчанию (ASR_DEFAULT_MODEL)")
+    asr_max_loaded_models: int = Field(1, description="Сколько моделей держать в памяти одновременно, LRU (ASR_MAX_LOADED_MODELS)")
+    asr_model_idle_ttl_sec: int = Field(1800, description="Выгружать модель после простоя, сек; 0 = никогда (ASR_MODEL_IDLE_TTL_SEC)")
+    asr_cpu_threads: int = Field(0, description="cpu_threads для CTranslate2; 0 = по умолчанию (ASR_CPU_THREADS)")
+    asr_batch_size: int = Field(1, description="Окон в одном батче Whisper; 1 = по одному (ASR_BATCH_SIZE)")
+    asr_workers: int = Field(0, description="Процессов ASR со своей моделью (CPU-ноды); 0 = выкл (ASR_WORKERS)")
+    asr_worker_cpu_threads: int = Field(0, description="cpu_threads на процесс ASR; 0 = cpu_count // ASR_WORKERS (ASR_WORKER_CPU_THREADS)")
+    asr_worker_shard_size: int = Field(8, description="Окон в одном задании воркеру ASR (ASR_WORKER_SHARD_SIZE)")
+    asr_cache_enabled: bool = Field(True, description="Кэш результатов ASR по хэшу PCM окна, таблица mfg_asr_cache (ASR_CACHE_ENABLED)")
+    asr_flush_every_windows: int = Field(16, description="Сохранять сегменты в БД каждые N окон (ASR_FLUSH_EVERY_WINDOWS)")
+    asr_flush_every_sec: float = Field(30.0, description="...или не реже чем раз в N секунд работы; 0 = только по окнам (ASR_FLUSH_EVERY_SEC)")
+    asr_prefetch_depth: int = Field(2, description="Порций окон, нарезанных заранее для декодера (ASR_PREFETCH_DEPTH)")
+    asr_write_queue_depth: int = Field(4, description="Порций результатов в очереди на запись в БД (ASR_WRITE_QUEUE_DEPTH)")
+    asr_longform_enabled: bool = Field(True, description="Режим full: long-form с таймстемпами Whisper, сегмент на фразу (ASR_LONGFORM_ENABLED)")
+    asr_longform_block_sec: float = Field(300.0, description="Длина блока long-form в памяти, сек (ASR_LONGFORM_BLOCK_SEC)")
+    asr_longform_carry_sec: float = Field(5.0, description="Сегменты ближе этого к концу блока переносятся в следующий, сек (ASR_LONGFORM_CARRY_SEC)")
+    asr_cache_max_entries: int = Field(200000, description="Макс. записей в кэше ASR, старые по last_hit_at удаляются; 0 = без лимита (ASR_CACHE_MAX_ENTRIES)")
+
+    # ───────── Пул инференса ─────────
+    inference_threads: int = Field(2, description="Потоки пула инференса Whisper/pyannote/VAD (INFERENCE_THREADS)")
+    inference_processes: int = Field(0, description="Процессы для CPU-задач без моделей; 0 = только потоки (INFERENCE_PROCESSES)")
+    inference_max_pending: int = Field(64, description="Макс. задач в работе+очереди, дальше — ожидание (INFERENCE_MAX_PENDING)")
+
     # ───────── Ollama ─────────
     ollama_url: str = Field(..., description="URL Ollama, напр. http://localhost:11434 (OLLAMA_URL)")
     embedding_model: str = Field(..., description="Модель эмбеддингов (EMBEDDING_MODEL)")
     summarize_model: str = Field(..., description="Модель суммаризации (SUMMARIZE_MODEL)")
+    embed_batch_max_items: int = Field(64, description="Макс. текстов в одном запросе /api/embed (EMBED_BATCH_MAX_ITEMS)")
+    embed_batch_max_chars: int = Field(16000, description="Макс. суммарная длина текстов батча эмбеддингов, символов (EMBED_BATCH_MAX_CHARS)")
 
     # Таймауты Ollama (секунды; 0 = без per-IO лимита)
     ollama_chat_timeout: int = Field(..., description="Общий guard-таймаут шага суммаризации (OLLAMA_CHAT_TIMEOUT)")
@@ -19,6 +46,14 @@ class Settings(BaseSettings):
     ollama_read_timeout: int = Field(..., description="Per-read таймаут; 0 = без лимита (OLLAMA_READ_TIMEOUT)")
     ollama_write_timeout: int = Field(..., description="Per-write таймаут; 0 = без лимита (OLLAMA_WRITE_TIMEOUT)")
     ollama_keep_alive: str = Field(..., description="Держать модель в памяти, напр. '30m' (OLLAMA_KEEP_ALIVE)")
+    ollama_embed_timeout: float = Field(60.0, description="Таймаут запроса /api/embed (батч); 0 = без лимита (OLLAMA_EMBED_TIMEOUT)")
+    ollama_health_timeout: float = Field(2.0, description="Таймаут проверки Ollama в /healthz (OLLAMA_HEALTH_TIMEOUT)")
+    ollama_pool_timeout: float = Field(30.0, description="Ожидание свободного соединения пула; 0 = без лимита (OLLAMA_POOL_TIMEOUT)")
+
+    # Пул соединений общего клиента Ollama
+    ollama_max_connections: int = Field(16, description="Макс. одновременных соединений к Ollama (OLLAMA_MAX_CONNECTIONS)")
+    ollama_max_keepalive: int = Field(8, description="Сколько простаивающих keep-alive соединений держать (OLLAMA_MAX_KEEPALIVE)")
+    ollama_keepalive_expiry: float = Field(60.0, description="Закрывать простаивающее соединение через N сек (OLLAMA_KEEPALIVE_EXPIRY)")
 
     # ───────── Параметры суммаризации ─────────
     summarize_num_ctx: int = Field(..., description="Макс. длина контекста LLM (SUMMARIZE_NUM_CTX)")
@@ -37,6 +72,18 @@ class Settings(BaseSettings):
     rag_top_k: int = Field(..., description="Сколько ближайших сегментов брать (RAG_TOP_K)")
     rag_min_score: float = Field(..., description="Минимальный скор сходства (RAG_MIN_SCORE)")
 
+    # ───────── Диаризация ─────────
+    diar_chunk_min_file_sec: float = Field(1800.0, description="Записи длиннее — диаризация окнами; 0 = всегда целиком. Целиком pyannote держит float32 всей записи, ~230 МБ/ч (DIAR_CHUNK_MIN_FILE_SEC)")
+    diar_chunk_sec: float = Field(600.0, description="Длина окна чанкованной диаризации, сек (DIAR_CHUNK_SEC)")
+    diar_chunk_overlap_sec: float = Field(30.0, description="Перекрытие окон, сек (DIAR_CHUNK_OVERLAP_SEC)")
+    diar_parallel_chunks: int = Field(1, description="Окон диаризации одновременно в пуле инференса; у каждого свой экземпляр pyannote (память × N) (DIAR_PARALLEL_CHUNKS)")
+    diar_stitch_threshold: float = Field(0.5, description="Порог косинусного расстояния при связывании спикеров между окнами (DIAR_STITCH_THRESHOLD)")
+
+    diar_cache_enabled: bool = Field(True, description="Кэш диаризации по хэшу PCM и параметрам пайплайна (DIAR_CACHE_ENABLED)")
+    diar_cache_max_entries: int = Field(5000, description="Макс. записей в кэше диаризации; 0 = без лимита (DIAR_CACHE_MAX_ENTRIES)")
+    speaker_match_threshold: float = Field(0.35, description="Макс. косинусное расстояние до голосового профиля для автоподстановки имени (SPEAKER_MATCH_THRESHOLD)")
+    speaker_autofill: bool = Field(True, description="Заполнять MfgSpeaker из профилей после диаризации (SPEAKER_AUTOFILL)")
+
     # ───────── Сегментация ─────────
     vad_aggressiveness: int = Field(..., description="Агрессивность VAD 0..3 (VAD_AGGRESSIVENESS)")
     vad_frame_ms: int = Field(..., description="Фрейм VAD: 10/20/30 мс (VAD_FRAME_MS)")
@@ -45,16 +92,41 @@ class Settings(BaseSettings):
     vad_merge_max_gap_sec: float = Field(..., description="Склейка пауз короче этого, сек (VAD_MERGE_MAX_GAP_SEC)")
     vad_max_segment_sec: float = Field(..., description="Макс. длина сегмента, сек (VAD_MAX_SEGMENT_SEC)")
     seg_overlap_sec: float = Field(..., description="Overlap при резке, сек (SEG_OVERLAP_SEC)")
+    vad_backend: str = Field("webrtc", description="Движок VAD: webrtc | energy (NumPy: энергия + ZCR) (VAD_BACKEND)")
+    vad_energy_high_db: float = Field(-35.0, description="energy-VAD: верхний порог гистерезиса, dBFS (VAD_ENERGY_HIGH_DB)")
+    vad_energy_low_db: float = Field(-45.0, description="energy-VAD: нижний порог гистерезиса, dBFS (VAD_ENERGY_LOW_DB)")
+    vad_energy_zcr_max: float = Field(0.35, description="energy-VAD: макс. доля пересечений нуля у речевого кадра (VAD_ENERGY_ZCR_MAX)")
+    vad_energy_hangover_ms: int = Field(100, description="energy-VAD: продление речи после последнего активного кадра, мс (VAD_ENERGY_HANGOVER_MS)")
+    vad_shard_min_file_sec: float = Field(1800, description="VAD по шардам в пуле процессов для файлов не короче, сек; 0 = выкл; нужен INFERENCE_PROCESSES>0 (VAD_SHARD_MIN_FILE_SEC)")
+    vad_shard_sec: float = Field(300, description="Длина шарда VAD, сек (VAD_SHARD_SEC)")
+    vad_shard_warmup_sec: float = Field(1.0, description="Перекрытие-прогрев webrtcvad перед шардом, сек (VAD_SHARD_WARMUP_SEC)")
 
     fixed_window_sec: float = Field(..., description="Длина окна в режиме fixed, сек (FIXED_WINDOW_SEC)")
     fixed_overlap_sec: float = Field(..., description="Overlap в режиме fixed, сек (FIXED_OVERLAP_SEC)")
+    fixed_snap_sec: float = Field(2.0, description="Сдвиг реза fixed-окна к самой тихой точке в пределах ±N сек; 0 = ровные окна (FIXED_SNAP_SEC)")
+
+    # Пред-гейт тишины перед ASR
+    asr_gate_modes: str = Field("fixed,full", description="Режимы с гейтом тишины/не-речи перед Whisper; пусто = выкл (ASR_GATE_MODES)")
+    asr_gate_rms_db: float = Field(-45.0, description="Порог громкости кадра, dBFS (ASR_GATE_RMS_DB)")
+    asr_gate_flatness_max: float = Field(0.6, description="Кадр со спектральной плоскостностью выше — шум (ASR_GATE_FLATNESS_MAX)")
+    asr_gate_min_speech_ratio: float = Field(0.05, description="Мин. доля речевых кадров, иначе окно пропускается (ASR_GATE_MIN_SPEECH_RATIO)")
+    asr_gate_trim_pad_sec: float = Field(0.25, description="Запас при срезании тишины по краям окна, сек (ASR_GATE_TRIM_PAD_SEC)")
 
     # ───────── FFmpeg ─────────
+    pretranscode_on_upload: bool = Field(False, description="Фоновый транскод в WAV 16k mono сразу после загрузки файла (PRETRANSCODE_ON_UPLOAD)")
+    derived_audio_format: str = Field("wav", description="Формат нормализованного аудио: wav | flac (без потерь, меньше на диске) | pcm (raw s16le + JSON-сайдкар) (DERIVED_AUDIO_FORMAT)")
+    audio_decode_path: str = Field("wav", description="Подготовка PCM: wav — WAV 16k на диске (memmap, кэш); pipe — ffmpeg s16le сразу в память (AUDIO_DECODE_PATH)")
+    media_cache_enabled: bool = Field(True, description="Кэш WAV 16k mono по хэшу содержимого исходника (MEDIA_CACHE_ENABLED)")
+    media_cache_dir: str = Field("/data/media_cache", description="Каталог кэша нормализованного аудио (MEDIA_CACHE_DIR)")
+    media_cache_max_bytes: int = Field(20 * 1024**3, description="Квота кэша аудио, байт; сверх неё — LRU-вытеснение; 0 = без лимита (MEDIA_CACHE_MAX_BYTES)")
+    media_cache_min_idle_sec: float = Field(3600, description="Не вытеснять файлы, использованные за последние N сек (MEDIA_CACHE_MIN_IDLE_SEC)")
     ffmpeg_threads: int = Field(..., description="Потоки FFmpeg (0 = auto) (FFMPEG_THREADS)")
     ffmpeg_filter_threads: int = Field(..., description="Потоки фильтров (FFMPEG_FILTER_THREADS)")
     ffmpeg_probesize: str = Field(..., description="Размер пробы контейнера, напр. '1M' (FFMPEG_PROBESIZE)")
     ffmpeg_analyzeduration: str = Field(..., description="Длительность анализа, напр. '0' (FFMPEG_ANALYZEDURATION)")
     ffmpeg_use_soxr: bool = Field(..., description="Ресемплер soxr (FFMPEG_USE_SOXR)")
+    ffmpeg_profile: str = Field("fast", description="Профиль транскода: fast | quality | soxr (FFMPEG_PROFILE)")
+    ffmpeg_max_concurrent: int = Field(2, description="Макс. одновременных транскодов ffmpeg на процесс (FFMPEG_MAX_CONCURRENT)")
 
     # ───────── База данных ─────────
     ollama_db_host: str = Field(..., description="Хост PostgreSQL (OLLAMA_DB_HOST)")
@@ -212,7 +212,92 @@ class MfgFile(Base):
     stored_path = Column(Text, nullable=False)            # путь на диске
     size_bytes  = Column(BigInteger)
     mimetype    = Column(String)
-    duration_s  = Column(Float)                           # если посчитаешь через ffprobe
+    duration_s  = Column(Float)                           # ffprobe после загрузки (media_meta)
+    codec       = Column(String)
+    channels    = Column(Integer)
+    sample_rate = Column(Integer)
+    bitrate     = Column(BigInteger)
+    probed_at   = Column(PG_TIMESTAMP(timezone=True))
+    derived_path = Column(Text)                           # WAV 16k mono после предварительного транскода
     created_at  = Column(PG_TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
 
 Index("ix_mfg_file_user_created", MfgFile.user_id, MfgFile.created_at.desc())
+
+# pyannote/speaker-diarization-3.1 (wespeaker-voxceleb-resnet34-LM)
+SPEAKER_EMBEDDING_DIM = 256
+
+class MfgSpeakerProfile(Base):
+    """
+    Голосовой профиль человека между митингами: центроид эмбеддингов pyannote.
+    По нему новые транскрипты получают display_name в MfgSpeaker автоматически.
+    """
+    __tablename__ = "mfg_speaker_profile"
+
+    id           = Column(BigInteger, primary_key=True, autoincrement=True)
+    user_id      = Column(BigInteger, ForeignKey("mfg_user.id", ondelete="SET NULL"), nullable=True, index=True)
+    display_name = Column(String, nullable=False)
+    color        = Column(String(16), nullable=True)
+    embedding    = Column(Vector(SPEAKER_EMBEDDING_DIM), nullable=False)
+    n_samples    = Column(Integer, nullable=False, server_default="1")   # сколько центроидов усреднено
+    created_at   = Column(PG_TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
+    updated_at   = Column(PG_TIMESTAMP(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+    __table_args__ = (
+        Index(
+            "ix_mfg_speaker_profile_embedding_hnsw", "embedding",
+            postgresql_using="hnsw",
+            postgresql_with={"m": 16, "ef_construction": 64},
+            postgresql_ops={"embedding": "vector_cosine_ops"},
+        ),
+    )
+
+class MfgSpeakerEmbedding(Base):
+    """
+    Центроид спикера конкретного транскрипта (из диаризации) и результат сопоставления с профилем.
+    """
+    __tablename__ = "mfg_speaker_embedding"
+
+    id            = Column(BigInteger, primary_key=True, autoincrement=True)
+    transcript_id = Column(BigInteger, ForeignKey("mfg_transcript.id", ondelete="CASCADE"), nullable=False, index=True)
+    speaker       = Column(String, nullable=False)         # 'SPEAKER_00' и т.п.
+    embedding     = Column(Vector(SPEAKER_EMBEDDING_DIM), nullable=False)
+    profile_id    = Column(BigInteger, ForeignKey("mfg_speaker_profile.id", ondelete="SET NULL"), nullable=True, index=True)
+    distance      = Column(Float, nullable=True)           # косинусное расстояние до профиля
+    enrolled      = Column(Boolean, server_default="false", nullable=False)  # привязан вручную (enroll)
+    created_at    = Column(PG_TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
+    __table_args__ = (
+        UniqueConstraint("transcript_id", "speaker", name="uq_mfg_speaker_embedding_tid_speaker"),
+    )
+
+class MfgDiarizationCache(Base):
+    """
+    Кэш диаризации по содержимому аудио.
+    key = sha256(PCM int16 mono 16k + модель/версия pyannote/гиперпараметры), turns — готовые
+    (после склейки) сегменты без file_path, centroids — эмбеддинги спикеров для профилей.
+    """
+    __tablename__ = "mfg_diarization_cache"
+
+    key         = Column(String(64), primary_key=True)   # sha256 hex
+    turns       = Column(JSONB, nullable=False)          # [{"speaker","start_ts","end_ts"}]
+    centroids   = Column(JSONB, nullable=True)           # {"SPEAKER_00": [..256..]}
+    duration_s  = Column(Float, nullable=True)
+    hits        = Column(Integer, nullable=False, server_default="0")
+    created_at  = Column(PG_TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
+    last_hit_at = Column(PG_TIMESTAMP(timezone=True), server_default=func.now(), nullable=False, index=True)
+
+class MfgAsrCache(Base):
+    """
+    Кэш результатов ASR по содержимому окна.
+    key = sha256(PCM int16 окна + модель + язык + параметры декодирования),
+    поэтому одно и то же аудио в режимах diarize/vad/fixed и при overwrite не декодируется повторно.
+    """
+    __tablename__ = "mfg_asr_cache"
+
+    key         = Column(String(64), primary_key=True)   # sha256 hex
+    model       = Column(String(64), nullable=False)
+    language    = Column(String(16), nullable=True)
+    params      = Column(String(128), nullable=True)     # напр. "beam=2;batch=0"
+    text        = Column(Text, nullable=False)
+    hits        = Column(Integer, nullable=False, server_default="0")
+    created_at  = Column(PG_TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
+    last_hit_at = Column(PG_TIMESTAMP(timezone=True), server_default=func.now(), nullable=False, index=True)
+
@@ -101,6 +101,7 @@ class ProtokolRequest(BaseModel):
     file_id: int = Field(..., ge=1)
     meeting_id: int = Field(..., ge=1)
     seg: Literal["diarize", "vad", "fixed"] = "diarize"
+    asr_model: Optional[str] = None  # тир Whisper (ASR_MODELS); None → ASR_DEFAULT_MODEL
 
 # --- Files API ---
 class FileOut(BaseModel):
@@ -109,6 +110,11 @@ class FileOut(BaseModel):
     size_bytes: Optional[int] = None
     mimetype: Optional[str] = None
     created_at: Optional[str] = None  # ISO строка
+    duration_s: Optional[float] = None
+    codec: Optional[str] = None
+    channels: Optional[int] = None
+    sample_rate: Optional[int] = None
+    bitrate: Optional[int] = None
 
 class FilesListResponse(BaseModel):
     items: List[FileOut]
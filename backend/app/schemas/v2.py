@@ -66,3 +66,25 @@ class TranscriptV2Result(BaseModel):
 
     # опционально: текстовые сегменты (если в БД есть таблица/данные)
     segments: List[SegmentTextItem] = []
+
+# --- speaker profiles ---
+
+class SpeakerProfileOut(BaseModel):
+    id: int
+    display_name: str
+    color: Optional[str] = None
+    n_samples: int = 1
+
+class SpeakerEnrollIn(BaseModel):
+    transcript_id: int = Field(..., ge=1)
+    speaker: str
+    display_name: Optional[str] = None   # обязателен для нового профиля
+    color: Optional[str] = None
+    profile_id: Optional[int] = None     # дополнить существующий профиль
+
+class SpeakerMatchItem(BaseModel):
+    speaker: str
+    profile_id: Optional[int] = None
+    display_name: Optional[str] = None
+    distance: Optional[float] = None
+    matched: bool = False
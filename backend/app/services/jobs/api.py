@@ -6,20 +6,25 @@ from app.services.jobs.steps.pipeline import run as _run_pipe
 from app.services.jobs.steps.embeddings import run as _run_emb
 from app.services.jobs.steps.summary import run as _run_sum
 from app.services.jobs.steps.transcription import run as _run_trans
+from app.services.pipeline import pcm
 
 # Сигнатуры оставлены как раньше в background.py
 
 async def process_protokol(transcript_id: int, audio_path: str, lang: str = "ru",
-                           format_: str = "json", seg_mode: str = "diarize") -> None:
+                           format_: str = "json", seg_mode: str = "diarize",
+                           asr_model: str | None = None) -> None:
     ctx = JobContext(transcript_id=transcript_id, audio_path=audio_path,
-                     lang=lang, fmt=format_, seg_mode=seg_mode)
+                     lang=lang, fmt=format_, seg_mode=seg_mode, asr_model=asr_model)
     await run_protokol(ctx)
 
 async def process_diarization(transcript_id: int, audio_path: str) -> None:
-    await _run_diar(transcript_id, audio_path)
+    # PCM исходника (в т.ч. декодированный в память, AUDIO_DECODE_PATH=pipe) живёт до конца шага
+    with pcm.job_scope():
+        await _run_diar(transcript_id, audio_path)
 
 async def process_segmentation(transcript_id: int, audio_path: str, mode: str = "vad") -> None:
-    await _run_seg(transcript_id, audio_path, mode)
+    with pcm.job_scope():
+        await _run_seg(transcript_id, audio_path, mode)
 
 async def process_pipeline(transcript_id: int) -> None:
     await _run_pipe(transcript_id)
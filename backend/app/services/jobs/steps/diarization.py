@@ -1,13 +1,49 @@
+from app.core.config import settings
 from app.core.logger import get_logger
 from app.db.session import async_session
 from app.db.models import MfgDiarization
 from sqlalchemy.dialects.postgresql import insert as pg_insert
-from app.services.pipeline.diarization import diarize_file
+from app.services.pipeline import diar_cache, pcm
+from app.services.pipeline.diarization import diarize_wav_ex
+from app.services.pipeline.executor import run_inference
+from app.services.pipeline.media import prepare_pcm
+from app.services import speakers
 
 log = get_logger(__name__)
 
+async def _diarize_cached(wav16k: str):
+    """
+    Диаризация с кэшем mfg_diarization_cache: ключ — хэш PCM + параметры пайплайна,
+    так что тот же звук под другим transcript_id тоже берётся из кэша.
+    """
+    if not diar_cache.enabled():
+        return await diarize_wav_ex(wav16k)
+
+    async with pcm.open_pcm_async(wav16k) as store:
+        duration = store.duration
+    key = await run_inference(diar_cache.content_key, wav16k, diar_cache.pipeline_params(duration), name="diar_cache_key")
+    try:
+        async with async_session() as s:
+            cached = await diar_cache.lookup(s, key)
+    except Exception:
+        log.exception("Diarization cache lookup failed for %s", wav16k)
+        cached = None
+    if cached is not None:
+        turns, centroids = cached
+        log.info("Diarization cache hit: %d turns for %s", len(turns), wav16k)
+        return [dict(t, file_path=wav16k) for t in turns], centroids
+
+    chunks, centroids = await diarize_wav_ex(wav16k)
+    try:
+        async with async_session() as s:
+            await diar_cache.store(s, key, chunks, centroids, duration)
+    except Exception:
+        log.exception("Diarization cache store failed for %s", wav16k)
+    return chunks, centroids
+
 async def run(transcript_id: int, audio_path: str) -> int:
-    chunks = await diarize_file(audio_path)
+    wav16k = str(await prepare_pcm(audio_path, threads=0))  # 0 = пусть ffmpeg сам решит
+    chunks, centroids = await _diarize_cached(wav16k)
     async with async_session() as s:
         if not chunks:
             return 0
@@ -27,4 +63,13 @@ async def run(transcript_id: int, audio_path: str) -> int:
         await s.execute(stmt)
         await s.commit()
     log.info("Diarization: upserted %d chunks for tid=%s", len(chunks), transcript_id)
-    return len(chunks)
\ No newline at end of file
+
+    # эмбеддинги спикеров и автоподстановка имён из профилей — не критично для джобы
+    try:
+        async with async_session() as s:
+            saved = await speakers.save_embeddings(s, transcript_id, centroids)
+            if saved and getattr(settings, "speaker_autofill", True):
+                await speakers.match_transcript(s, transcript_id)
+    except Exception:
+        log.exception("Speaker embeddings/match failed for tid=%s", transcript_id)
+    return len(chunks)
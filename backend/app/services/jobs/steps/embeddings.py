@@ -5,7 +5,7 @@ from sqlalchemy import select
 from app.db.session import async_session
 from app.db.models import MfgSegment, MfgEmbedding
 from app.core.logger import get_logger
-from app.services.pipeline.embeddings import embed_text
+from app.services.pipeline.embeddings import embed_texts
 
 log = get_logger(__name__)
 
@@ -25,17 +25,17 @@ async def run(transcript_id: int, mode: str | None = None) -> int:
 
         segs = (await s.execute(q)).scalars().all()
 
-        created = 0
-        for seg in segs:
-            text = (seg.text or "").strip()
-            if not text:
-                continue
+        # пустые сегменты не эмбеддим; остальные — батчами, векторы возвращаются в порядке items
+        items = [(seg.id, (seg.text or "").strip()) for seg in segs]
+        items = [(seg_id, text) for seg_id, text in items if text]
+        vectors = await embed_texts([text for _, text in items])
 
-            emb = await embed_text(text)
+        created = 0
+        for (seg_id, _), emb in zip(items, vectors):
             if emb is None:
                 continue
 
-            s.add(MfgEmbedding(segment_id=seg.id, embedding=emb))
+            s.add(MfgEmbedding(segment_id=seg_id, embedding=emb))
             created += 1
 
         await s.commit()
@@ -1,9 +1,17 @@
 from app.core.logger import get_logger
-from app.services.pipeline.compose import process_pipeline_segments
+from app.services.pipeline.compose import ProgressCallback, process_pipeline_segments
 
 log = get_logger(__name__)
 
-async def run(transcript_id: int, language: str = "ru", mode: str | None = None) -> dict:
-    stats = await process_pipeline_segments(transcript_id, language=language, mode=mode)
+async def run(
+    transcript_id: int,
+    language: str = "ru",
+    mode: str | None = None,
+    model: str | None = None,
+    on_progress: ProgressCallback | None = None,
+) -> dict:
+    stats = await process_pipeline_segments(
+        transcript_id, language=language, mode=mode, model=model, on_progress=on_progress
+    )
     log.info("Pipeline ASR done for tid=%s, mode=%s, stats=%s", transcript_id, mode, stats)
     return stats
\ No newline at end of file
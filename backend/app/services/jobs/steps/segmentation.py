@@ -1,43 +1,34 @@
 from app.core.logger import get_logger
 from app.db.session import async_session
 from app.db.models import MfgDiarization
-from app.services.pipeline.vad import segment_vad, segment_fixed
-from app.services.pipeline.media import convert_to_wav16k_mono
-
-import wave
-import contextlib
-from pathlib import Path
+from app.services.pipeline import pcm
+from app.services.pipeline.vad import segment_vad_stream, segment_fixed
+from app.services.pipeline.media import prepare_pcm
 
 log = get_logger(__name__)
 
-def _wav_duration(path: str) -> float:
-    """Вернуть длительность WAV-файла (сек) через стандартную библиотеку."""
-    p = Path(path)
-    if not p.exists():
-        raise FileNotFoundError(f"WAV not found: {path}")
-    with contextlib.closing(wave.open(str(p), "rb")) as wf:
-        frames = wf.getnframes()
-        rate = wf.getframerate() or 16000
-        return frames / float(rate)
+# VAD-чанки пишем пачками по мере прохода VAD, а не одним списком в конце
+_VAD_COMMIT_EVERY = 64
 
 async def run(transcript_id: int, audio_path: str, mode: str = "vad") -> int:
     """
     Режимы:
       - vad   → webrtcvad
       - fixed → равные окна
-      - full  → один чанк на весь файл
+      - full  → один чанк на весь файл (ASR разбивает его на фразы в long-form, см. compose)
     """
     if mode == "vad":
-        wav16k, chunks = await segment_vad(audio_path)
+        return await _run_vad_stream(transcript_id, audio_path)
 
-    elif mode == "fixed":
+    if mode == "fixed":
         wav16k, chunks = await segment_fixed(audio_path)
 
     elif mode == "full":
-        # 1) конвертируем исходник в WAV 16k mono
-        wav16k = await convert_to_wav16k_mono(audio_path)
-        # 2) считаем длительность получившегося WAV без ffprobe
-        dur = _wav_duration(wav16k)
+        # 1) нормализуем исходник (WAV 16k mono или PCM в памяти, см. AUDIO_DECODE_PATH)
+        wav16k = await prepare_pcm(audio_path)
+        # 2) длительность — по тому же PCM, без ffprobe
+        async with pcm.open_pcm_async(wav16k) as store:
+            dur = store.duration
         # 3) один чанк на весь файл
         chunks = [dict(speaker=None, start_ts=0.0, end_ts=float(dur))]
 
@@ -58,3 +49,25 @@ async def run(transcript_id: int, audio_path: str, mode: str = "vad") -> int:
 
     log.info("Segmentation(%s): saved %d chunks for tid=%s", mode, len(chunks), transcript_id)
     return len(chunks)
+
+
+async def _run_vad_stream(transcript_id: int, audio_path: str) -> int:
+    wav16k, stream = await segment_vad_stream(audio_path)
+    n = 0
+    async with async_session() as s:
+        async for c in stream:
+            s.add(MfgDiarization(
+                transcript_id=transcript_id,
+                speaker=c.get("speaker"),
+                start_ts=float(c["start_ts"]),
+                end_ts=float(c["end_ts"]),
+                file_path=wav16k,
+                mode="vad",
+            ))
+            n += 1
+            if n % _VAD_COMMIT_EVERY == 0:
+                await s.commit()
+        await s.commit()
+
+    log.info("Segmentation(vad): saved %d chunks for tid=%s", n, transcript_id)
+    return n
@@ -5,7 +5,7 @@ from app.services.pipeline.asr import transcribe_file
 
 log = get_logger(__name__)
 
-async def run(transcript_id: int, audio_path: str) -> int:
+async def run(transcript_id: int, audio_path: str, model: str | None = None) -> int:
     """
     Полная транскрипция исходного файла (без диаризации/сегментации).
     Сохраняет текст в MfgTranscript.processed_text (если поле есть).
@@ -16,7 +16,7 @@ async def run(transcript_id: int, audio_path: str) -> int:
         if not tr:
             raise RuntimeError(f"Transcript {transcript_id} not found")
 
-    text = await transcribe_file(audio_path)
+    text = await transcribe_file(audio_path, model=model)
 
     async with async_session() as s:
         tr = await s.get(MfgTranscript, transcript_id)
@@ -22,4 +22,5 @@ class JobContext:
     lang: str = "ru"
     fmt: str = "json"
     seg_mode: str = "diarize"       # diarize | vad | fixed
+    asr_model: Optional[str] = None # тир Whisper из ASR_MODELS; None → ASR_DEFAULT_MODEL
     on_status: Optional[Callable[[JobStatus], Awaitable[None]]] = None
@@ -0,0 +1,178 @@
+# app/services/ollama.py
+"""
+Общий HTTP-клиент Ollama на время жизни приложения.
+
+Эмбеддинги, суммаризация/RAG и health-check ходят через один httpx.AsyncClient:
+пул соединений с keep-alive (OLLAMA_MAX_CONNECTIONS / OLLAMA_MAX_KEEPALIVE /
+OLLAMA_KEEPALIVE_EXPIRY) вместо нового TCP-соединения на каждый вызов.
+Клиент открывается в startup (main.py) и закрывается в shutdown; вне приложения
+(скрипты, тесты) создаётся лениво при первом обращении.
+
+Таймауты — по endpoint'у (timeout()): chat — OLLAMA_*_TIMEOUT, embed —
+OLLAMA_EMBED_TIMEOUT, health — OLLAMA_HEALTH_TIMEOUT; ожидание свободного
+соединения пула — OLLAMA_POOL_TIMEOUT. stats() — запросы, ошибки и заполненность пула.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+
+from app.core.config import settings
+from app.core.logger import get_logger
+
+log = get_logger(__name__)
+
+_client: Optional[httpx.AsyncClient] = None
+
+_metrics_lock = threading.Lock()
+_metrics: Dict[str, Any] = {
+    "requests": 0,
+    "errors": 0,
+    "pool_timeouts": 0,
+    "in_flight": 0,
+    "max_in_flight": 0,
+    "by_endpoint": {},  # endpoint → {"requests", "errors", "wall_sec"}
+}
+
+
+def _max_connections() -> int:
+    return max(1, int(getattr(settings, "ollama_max_connections", 16) or 1))
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=_max_connections(),
+        max_keepalive_connections=max(0, int(getattr(settings, "ollama_max_keepalive", 8) or 0)),
+        keepalive_expiry=float(getattr(settings, "ollama_keepalive_expiry", 60.0) or 0) or None,
+    )
+
+
+def _opt(value) -> Optional[float]:
+    """0/None в .env — без лимита."""
+    return None if not value else float(value)
+
+
+def timeout(endpoint: str) -> httpx.Timeout:
+    """Таймауты запроса по endpoint'у: chat | embed | health."""
+    pool = _opt(getattr(settings, "ollama_pool_timeout", 30.0))
+    if endpoint == "chat":
+        return httpx.Timeout(
+            connect=float(settings.ollama_connect_timeout or 30),
+            read=_opt(settings.ollama_read_timeout),
+            write=_opt(settings.ollama_write_timeout),
+            pool=pool,
+        )
+    if endpoint == "health":
+        t = float(getattr(settings, "ollama_health_timeout", 2.0) or 2.0)
+        return httpx.Timeout(t, pool=t)
+    t = _opt(getattr(settings, "ollama_embed_timeout", 60.0))
+    return httpx.Timeout(t, connect=float(settings.ollama_connect_timeout or 30), pool=pool)
+
+
+def url(path: str) -> str:
+    return settings.ollama_url.rstrip("/") + path
+
+
+async def startup() -> None:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(limits=_limits(), timeout=timeout("embed"))
+        log.info("Ollama client: %s, max_connections=%d", settings.ollama_url, _max_connections())
+
+
+async def shutdown() -> None:
+    global _client
+    client, _client = _client, None
+    if client is not None and not client.is_closed:
+        await client.aclose()
+        log.info("Ollama client closed")
+
+
+def client() -> httpx.AsyncClient:
+    """Общий клиент; без startup (скрипты) — создаётся при первом вызове."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(limits=_limits(), timeout=timeout("embed"))
+    return _client
+
+
+@asynccontextmanager
+async def _tracked(endpoint: str) -> AsyncIterator[None]:
+    with _metrics_lock:
+        _metrics["in_flight"] += 1
+        _metrics["max_in_flight"] = max(_metrics["max_in_flight"], _metrics["in_flight"])
+    t0 = time.monotonic()
+    ok = False
+    try:
+        yield
+        ok = True
+    except httpx.PoolTimeout:
+        with _metrics_lock:
+            _metrics["pool_timeouts"] += 1
+        log.warning("Ollama pool exhausted (%s): no free connection in time", endpoint)
+        raise
+    finally:
+        wall = time.monotonic() - t0
+        with _metrics_lock:
+            _metrics["in_flight"] -= 1
+            _metrics["requests"] += 1
+            _metrics["errors"] += 0 if ok else 1
+            per = _metrics["by_endpoint"].setdefault(endpoint, {"requests": 0, "errors": 0, "wall_sec": 0.0})
+            per["requests"] += 1
+            per["errors"] += 0 if ok else 1
+            per["wall_sec"] += wall
+
+
+async def post(path: str, endpoint: str, **kwargs: Any) -> httpx.Response:
+    """POST в Ollama через общий пул; статус >= 400 — httpx.HTTPStatusError (и ошибка в stats())."""
+    kwargs.setdefault("timeout", timeout(endpoint))
+    async with _tracked(endpoint):
+        resp = await client().post(url(path), **kwargs)
+        resp.raise_for_status()
+        return resp
+
+
+async def get(path: str, endpoint: str, **kwargs: Any) -> httpx.Response:
+    """GET в Ollama через общий пул; как post — статус >= 400 поднимает httpx.HTTPStatusError."""
+    kwargs.setdefault("timeout", timeout(endpoint))
+    async with _tracked(endpoint):
+        resp = await client().get(url(path), **kwargs)
+        resp.raise_for_status()
+        return resp
+
+
+@asynccontextmanager
+async def stream(method: str, path: str, endpoint: str, **kwargs: Any) -> AsyncIterator[httpx.Response]:
+    """Потоковый ответ; соединение занято (и учитывается в in_flight), пока открыт контекст."""
+    kwargs.setdefault("timeout", timeout(endpoint))
+    async with _tracked(endpoint):
+        async with client().stream(method, url(path), **kwargs) as resp:
+            resp.raise_for_status()
+            yield resp
+
+
+def _open_connections() -> Optional[int]:
+    # httpcore не даёт публичного API пула — best effort для метрик
+    try:
+        return len(_client._transport._pool.connections)  # type: ignore[union-attr]
+    except Exception:
+        return None
+
+
+def stats() -> Dict[str, Any]:
+    with _metrics_lock:
+        snap = {k: v for k, v in _metrics.items() if k != "by_endpoint"}
+        snap["by_endpoint"] = {
+            n: {k: (round(v, 3) if isinstance(v, float) else v) for k, v in per.items()}
+            for n, per in _metrics["by_endpoint"].items()
+        }
+    limit = _max_connections()
+    snap["max_connections"] = limit
+    snap["saturation"] = round(snap["in_flight"] / limit, 3)
+    snap["open_connections"] = _open_connections()
+    snap["started"] = _client is not None and not _client.is_closed
+    return snap
@@ -1,41 +1,35 @@
 # asr.py — ФИКС ОКОН
+# Модель берётся из ленивого реестра (registry.py): model=None → ASR_DEFAULT_MODEL.
 import math
 from pathlib import Path
-from typing import Optional, Iterable
+from typing import AsyncIterator, Optional, Iterable, List, Sequence, Tuple
 
+import ctranslate2
 import numpy as np
-import torch
-import torchaudio
-from faster_whisper import WhisperModel
+from faster_whisper.tokenizer import Tokenizer
 
+from app.core.config import settings
 from app.core.logger import get_logger
+from app.services.pipeline import pcm
+from app.services.pipeline.executor import run_inference
+from app.services.pipeline.registry import get_whisper
 
 log = get_logger(__name__)
 
-MODEL_NAME = "large-v3"
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
-COMPUTE_TYPE = "float16" if DEVICE == "cuda" else "int8"
-
-log.info("Инициализация Whisper: model=%s device=%s compute_type=%s",
-         MODEL_NAME, DEVICE, COMPUTE_TYPE)
-
-try:
-    whisper = WhisperModel(MODEL_NAME, device=DEVICE, compute_type=COMPUTE_TYPE)
-    if DEVICE == "cuda":
-        _ = torch.randn(1, device="cuda")
-    log.info("Whisper успешно загружена")
-except Exception:
-    log.exception("Ошибка при инициализации Whisper")
-    raise
-
+# Whisper видит максимум 30 с за проход — длиннее в батч не кладём
+BATCH_MAX_SAMPLES = 30 * pcm.SAMPLE_RATE
+# beam по умолчанию; входит в ключ кэша ASR (asr_cache.make_params)
+BEAM_SIZE = 2
 
 def _transcribe(
     audio_source,
     language: str = "ru",
-    beam_size: int = 2,
+    beam_size: int = BEAM_SIZE,
     vad_filter: bool = False,
     condition_on_previous_text: bool = False,
+    model: Optional[str] = None,
 ) -> str:
+    whisper = get_whisper(model)
     segments, _info = whisper.transcribe(
         audio_source,
         language=language,
@@ -55,13 +49,171 @@ def _transcribe(
     return out
 
 
-async def transcribe_file(audio_path: str) -> str:
+def _transcribe_batch(
+    clips: Sequence[np.ndarray],
+    language: str = "ru",
+    beam_size: int = BEAM_SIZE,
+    model: Optional[str] = None,
+) -> List[str]:
+    """
+    Один батч-вызов CTranslate2 для нескольких коротких окон (≤ 30 с):
+    mel каждого окна дополняется нулями до 30 с, энкодер и декодер
+    отрабатывают на всём батче сразу. Порядок результатов = порядок clips.
+    """
+    if not clips:
+        return []
+    whisper = get_whisper(model)
+    fe = whisper.feature_extractor
+    n_frames = int(getattr(fe, "nb_max_frames", 3000))
+
+    feats = []
+    for clip in clips:
+        mel = fe(clip)[:, :n_frames]
+        if mel.shape[-1] < n_frames:
+            mel = np.pad(mel, ((0, 0), (0, n_frames - mel.shape[-1])))
+        feats.append(mel)
+    batch = np.ascontiguousarray(np.stack(feats).astype(np.float32))
+
+    encoder_output = whisper.model.encode(ctranslate2.StorageView.from_array(batch))
+    tokenizer = Tokenizer(whisper.hf_tokenizer, whisper.model.is_multilingual, task="transcribe", language=language)
+    prompt = whisper.get_prompt(tokenizer, [], without_timestamps=True)
+    results = whisper.model.generate(
+        encoder_output,
+        [prompt] * len(clips),
+        beam_size=beam_size,
+        max_length=whisper.max_length,
+        suppress_blank=True,
+        suppress_tokens=[-1],
+    )
+    return [tokenizer.decode(r.sequences_ids[0]) for r in results]
+
+
+def transcribe_clips(
+    clips: Sequence[np.ndarray],
+    language: str = "ru",
+    batch_size: int = 8,
+    model: Optional[str] = None,
+) -> List[str]:
+    """
+    Батч-ASR для набора окон. Окна ≤ 30 с сортируются по длине и декодируются
+    группами по batch_size (меньше «пустого» декодирования в батче);
+    длинные окна идут обычным _transcribe. Результат выровнен по индексам clips.
+    """
+    out = [""] * len(clips)
+    short = [i for i, c in enumerate(clips) if 0 < c.size <= BATCH_MAX_SAMPLES]
+    long_ = [i for i, c in enumerate(clips) if c.size > BATCH_MAX_SAMPLES]
+    short.sort(key=lambda i: clips[i].size)
+
+    for k in range(0, len(short), max(1, batch_size)):
+        idx = short[k:k + batch_size]
+        try:
+            texts = _transcribe_batch([clips[i] for i in idx], language=language, model=model)
+        except Exception:
+            log.exception("Batched ASR failed (batch=%d) — fallback to per-window", len(idx))
+            texts = [_transcribe(clips[i], language=language, model=model) for i in idx]
+        for i, t in zip(idx, texts):
+            out[i] = t or ""
+        log.debug("ASR batch done: size=%d, max_len=%.1fs", len(idx), clips[idx[-1]].size / pcm.SAMPLE_RATE)
+
+    for i in long_:
+        out[i] = _transcribe(clips[i], language=language, model=model) or ""
+    return out
+
+
+def _transcribe_segments(
+    audio: np.ndarray,
+    language: str = "ru",
+    beam_size: int = BEAM_SIZE,
+    model: Optional[str] = None,
+    initial_prompt: Optional[str] = None,
+) -> List[Tuple[float, float, str]]:
+    """Whisper с внутренними таймстемпами: [(start, end, text), ...] относительно начала audio."""
+    whisper = get_whisper(model)
+    segments, _info = whisper.transcribe(
+        audio,
+        language=language,
+        beam_size=beam_size,
+        vad_filter=False,
+        condition_on_previous_text=True,
+        initial_prompt=initial_prompt or None,
+        task="transcribe",
+    )
+    return [(float(seg.start), float(seg.end), seg.text) for seg in segments]
+
+
+def _transcribe_block(
+    wav_path: str,
+    start_ts: float,
+    end_ts: float,
+    language: str = "ru",
+    model: Optional[str] = None,
+    initial_prompt: Optional[str] = None,
+) -> List[Tuple[float, float, str]]:
+    """Блок [start_ts, end_ts] файла → сегменты Whisper в абсолютном времени файла."""
+    with pcm.open_pcm(wav_path) as store:
+        audio = store.window(start_ts, end_ts)
+    if audio.size == 0:
+        return []
+    return [
+        (start_ts + s, min(end_ts, start_ts + e), t)
+        for s, e, t in _transcribe_segments(audio, language=language, model=model, initial_prompt=initial_prompt)
+    ]
+
+
+async def transcribe_longform(
+    wav_path: str,
+    start_ts: float,
+    end_ts: float,
+    language: str = "ru",
+    model: Optional[str] = None,
+    resume_from: Optional[float] = None,
+) -> AsyncIterator[Tuple[float, List[Tuple[float, float, str]]]]:
+    """
+    Long-form ASR для длинного интервала (режим full): файл идёт блоками по
+    ASR_LONGFORM_BLOCK_SEC, внутри блока — штатное скользящее окно Whisper
+    с таймстемпами. В памяти только текущий блок.
+
+    Стык блоков: сегменты, заканчивающиеся ближе ASR_LONGFORM_CARRY_SEC к концу
+    блока (могли быть обрезаны посередине фразы), отбрасываются, и следующий
+    блок начинается с конца последнего оставленного сегмента. Хвост текста
+    уходит в initial_prompt следующего блока.
+
+    На каждый блок отдаёт (covered_until, [(start, end, text), ...]): до covered_until
+    интервал обработан окончательно. resume_from — продолжить с этой секунды
+    (уже сохранённое не декодируется повторно).
+    """
+    block_sec = max(30.0, float(getattr(settings, "asr_longform_block_sec", 300.0)))
+    carry_sec = max(0.0, float(getattr(settings, "asr_longform_carry_sec", 5.0)))
+    pos = max(start_ts, resume_from if resume_from is not None else start_ts)
+    prompt: Optional[str] = None
+
+    while end_ts - pos > 1e-3:
+        block_end = min(end_ts, pos + block_sec)
+        segs = await run_inference(
+            _transcribe_block, wav_path, pos, block_end,
+            language=language, model=model, initial_prompt=prompt, name="asr_longform",
+        )
+        next_pos = block_end
+        if block_end < end_ts:
+            kept = [sg for sg in segs if sg[1] <= block_end - carry_sec]
+            # без прогресса (одна длинная фраза на весь блок) — берём блок целиком
+            if kept and kept[-1][1] > pos + 1.0:
+                segs, next_pos = kept, kept[-1][1]
+        log.debug("ASR long-form block [%.1f..%.1f] → %d segments, next=%.1f", pos, block_end, len(segs), next_pos)
+
+        if segs:
+            prompt = "".join(t for _s, _e, t in segs)[-200:]
+        yield next_pos, segs
+        pos = next_pos
+
+
+async def transcribe_file(audio_path: str, model: Optional[str] = None) -> str:
     log.info("Транскрипция файла: %s", audio_path)
     if not Path(audio_path).exists():
         log.error("Файл не найден: %s", audio_path)
         raise FileNotFoundError(audio_path)
     try:
-        text = _transcribe(str(audio_path))
+        text = await run_inference(_transcribe, str(audio_path), model=model, name="asr_file")
         log.info("Транскрипция завершена: file=%s, len=%d", audio_path, len(text))
         return text
     except Exception:
@@ -69,43 +221,35 @@ async def transcribe_file(audio_path: str) -> str:
         raise
 
 
-def _load_window_as_numpy(wav_path: str, start_ts: float, end_ts: float) -> np.ndarray:
+async def transcribe_arrays(
+    clips: Sequence[np.ndarray],
+    language: str = "ru",
+    batch_size: int = 1,
+    model: Optional[str] = None,
+) -> List[str]:
     """
-    Загружаем WAV и вырезаем окно [start_ts, end_ts] → np.float32 mono 16k.
-    ВАЖНО: всегда режем ОКНО в обеих ветках dtype.
+    ASR для уже нарезанных окон (float32 mono 16k). batch_size > 1 — батчами
+    (transcribe_clips), иначе по одному окну. Ошибки → "" для окна/батча,
+    порядок результатов = порядок clips.
     """
-    wav, sr = torchaudio.load(wav_path)  # wav: [C, T], обычно float32 в диапазоне [-1, 1]
-    s = max(0, int(round(start_ts * sr)))
-    e = min(wav.shape[-1], int(round(end_ts * sr)))
-    if e <= s:
-        return np.zeros((0,), dtype=np.float32)
-
-    # Моно
-    if wav.shape[0] > 1:
-        wav = wav.mean(dim=0, keepdim=True)
-
-    # РЕЖЕМ окно в любом случае
-    clip = wav[:, s:e].squeeze(0)
-
-    # Приводим к float32
-    if clip.dtype != torch.float32:
-        clip = clip.to(torch.float32)
-
-    # Если вдруг torchaudio вернул int16 (редко, при особых настройках) — нормализуем
-    if wav.dtype == torch.int16:
-        clip = clip / 32768.0
-
-    return clip.cpu().numpy()
-
-
-async def transcribe_window_from_wav(
-    wav_path: str, start_ts: float, end_ts: float, language: str = "ru"
-) -> str:
-    try:
-        audio_np = _load_window_as_numpy(wav_path, start_ts, end_ts)
-        if audio_np.size == 0:
-            return ""
-        return _transcribe(audio_np, language=language) or ""
-    except Exception:
-        log.exception("Ошибка транскрипции окна: %s [%.2f, %.2f]", wav_path, start_ts, end_ts)
-        return ""
+    if batch_size > 1:
+        try:
+            texts = await run_inference(
+                transcribe_clips, list(clips), language=language, batch_size=batch_size, model=model, name="asr_batch"
+            )
+            return [t or "" for t in texts]
+        except Exception:
+            log.exception("Ошибка батч-транскрипции (%d окон)", len(clips))
+            return [""] * len(clips)
+
+    out: List[str] = []
+    for clip in clips:
+        if clip.size == 0:
+            out.append("")
+            continue
+        try:
+            out.append((await run_inference(_transcribe, clip, language=language, model=model, name="asr_window")) or "")
+        except Exception:
+            log.exception("Ошибка транскрипции окна (%.1fs)", clip.size / pcm.SAMPLE_RATE)
+            out.append("")
+    return out
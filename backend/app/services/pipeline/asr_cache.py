@@ -0,0 +1,147 @@
+# app/services/pipeline/asr_cache.py
+"""
+Контентный кэш ASR (таблица mfg_asr_cache).
+
+Ключ — sha256 от PCM int16 окна и параметров распознавания (модель, язык, beam,
+режим декодирования). Один и тот же файл в режимах diarize/vad/fixed и повторные
+прогоны с overwrite=True берут текст из кэша вместо повторного декодирования.
+Размер ограничен ASR_CACHE_MAX_ENTRIES: сверх лимита удаляются записи
+с самым старым last_hit_at (проверка — не чаще раза в 5 минут на процесс,
+так что таблица может ненадолго превышать лимит).
+"""
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.logger import get_logger
+from app.db.models import MfgAsrCache
+from app.services.pipeline import pcm
+
+log = get_logger(__name__)
+
+# count(*) по таблице кэша — полный скан: проверяем квоту не чаще раза в _EVICT_EVERY_SEC
+_EVICT_EVERY_SEC = 300.0
+_last_evict = 0.0
+
+_metrics_lock = threading.Lock()
+_metrics: Dict[str, int] = {"hits": 0, "misses": 0, "stored": 0, "evicted": 0}
+
+
+def enabled() -> bool:
+    return bool(getattr(settings, "asr_cache_enabled", True))
+
+
+def _max_entries() -> int:
+    return max(0, int(getattr(settings, "asr_cache_max_entries", 0) or 0))
+
+
+def make_params(beam_size: int, batched: bool) -> str:
+    """Параметры декодирования, влияющие на текст: входят в ключ и пишутся в строку кэша."""
+    return f"beam={int(beam_size)};batch={int(bool(batched))}"
+
+
+def window_keys(
+    wav_path: str,
+    windows: Sequence[Tuple[float, float]],
+    model: str,
+    language: str,
+    params: str,
+) -> List[str]:
+    """sha256-ключи окон (блокирующая: хэширует PCM, звать через run_inference)."""
+    suffix = f"|{model}|{language}|{params}".encode("utf-8")
+    keys: List[str] = []
+    with pcm.open_pcm(wav_path) as store:
+        for start, end in windows:
+            h = hashlib.sha256()
+            h.update(store.window_int16(start, end).tobytes())
+            h.update(suffix)
+            keys.append(h.hexdigest())
+    return keys
+
+
+def _count(**delta: int) -> None:
+    with _metrics_lock:
+        for k, v in delta.items():
+            _metrics[k] += v
+
+
+async def lookup(session: AsyncSession, keys: Sequence[str]) -> Dict[str, str]:
+    """key → text для найденных ключей; у найденных обновляем hits/last_hit_at."""
+    uniq = list(dict.fromkeys(keys))
+    if not uniq:
+        return {}
+    rows = (await session.execute(
+        select(MfgAsrCache.key, MfgAsrCache.text).where(MfgAsrCache.key.in_(uniq))
+    )).all()
+    found = {k: t for k, t in rows}
+    if found:
+        await session.execute(
+            update(MfgAsrCache)
+            .where(MfgAsrCache.key.in_(list(found)))
+            .values(hits=MfgAsrCache.hits + 1, last_hit_at=func.now())
+        )
+        await session.commit()
+    hits = sum(1 for k in keys if k in found)
+    _count(hits=hits, misses=len(keys) - hits)
+    return found
+
+
+async def store(
+    session: AsyncSession,
+    items: Sequence[Tuple[str, str]],
+    model: str,
+    language: str,
+    params: str,
+) -> int:
+    """Сохранить (key, text); пустые тексты не кэшируем — их не отличить от ошибки декодирования."""
+    payload: Dict[str, dict] = {}
+    for key, text in items:
+        if text and text.strip():
+            payload[key] = dict(key=key, model=model, language=language, params=params, text=text)
+    if not payload:
+        return 0
+    stmt = pg_insert(MfgAsrCache).values(list(payload.values()))
+    await session.execute(stmt.on_conflict_do_nothing(index_elements=["key"]))
+    await session.commit()
+    _count(stored=len(payload))
+    await _evict(session)
+    return len(payload)
+
+
+async def _evict(session: AsyncSession) -> int:
+    global _last_evict
+    limit = _max_entries()
+    if limit <= 0:
+        return 0
+    now = time.monotonic()
+    if now - _last_evict < _EVICT_EVERY_SEC:
+        return 0
+    _last_evict = now
+    total = (await session.execute(select(func.count()).select_from(MfgAsrCache))).scalar_one()
+    extra = int(total) - limit
+    if extra <= 0:
+        return 0
+    oldest = select(MfgAsrCache.key).order_by(MfgAsrCache.last_hit_at.asc()).limit(extra)
+    await session.execute(delete(MfgAsrCache).where(MfgAsrCache.key.in_(oldest.scalar_subquery())))
+    await session.commit()
+    _count(evicted=extra)
+    log.info("ASR cache: evicted %d oldest entries (limit=%d)", extra, limit)
+    return extra
+
+
+def stats() -> Dict[str, Optional[float]]:
+    with _metrics_lock:
+        snap: Dict[str, Optional[float]] = dict(_metrics)
+    total = (snap["hits"] or 0) + (snap["misses"] or 0)
+    snap["hit_ratio"] = round((snap["hits"] or 0) / total, 3) if total else None
+    snap["enabled"] = enabled()
+    snap["max_entries"] = _max_entries()
+    return snap
@@ -0,0 +1,171 @@
+# app/services/pipeline/asr_pool.py
+"""
+Пул ASR-процессов для CPU-нод.
+
+ASR_WORKERS процессов, в каждом своя WhisperModel (через тот же registry)
+с cpu_threads = ASR_WORKER_CPU_THREADS (0 → cpu_count // ASR_WORKERS).
+Окна одного файла режутся на шарды по ASR_WORKER_SHARD_SIZE и раздаются воркерам,
+результаты собираются в исходном порядке. Аудио через pickle не передаётся:
+воркер сам открывает тот же файл через pcm (memmap), по сети идут только (start, end).
+"""
+from __future__ import annotations
+
+import asyncio
+import multiprocessing as mp
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+from app.core.logger import get_logger
+
+log = get_logger(__name__)
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+_metrics: Dict[str, Any] = {"shards": 0, "windows": 0, "failed_shards": 0, "busy_sec": 0.0}
+
+
+def workers() -> int:
+    return max(0, int(getattr(settings, "asr_workers", 0) or 0))
+
+
+def _cpu_threads_per_worker() -> int:
+    n = int(getattr(settings, "asr_worker_cpu_threads", 0) or 0)
+    if n > 0:
+        return n
+    return max(1, (os.cpu_count() or 1) // max(1, workers()))
+
+
+# ─────────────────────────────────────────
+# Код дочернего процесса
+# ─────────────────────────────────────────
+# путь → ((mtime_ns, size), хранилище); реестр pcm ключуется только путём
+_held: "OrderedDict[str, Tuple[Tuple[int, int], Any]]" = OrderedDict()
+
+
+def _worker_init(cpu_threads: int) -> None:
+    # ограничиваем потоки ДО загрузки модели; вложенный пул в воркере не нужен
+    os.environ["OMP_NUM_THREADS"] = str(cpu_threads)
+    settings.asr_cpu_threads = cpu_threads
+    settings.asr_workers = 0
+    settings.inference_processes = 0
+
+
+def _worker_store(wav_path: str):
+    """Держим пару последних файлов открытыми: шарды одного файла не переоткрывают PCM."""
+    from app.services.pipeline import pcm
+
+    # временный wav может быть пересоздан под тем же именем: старое хранилище
+    # отпускаем (в воркере других ссылок нет — реестр его закроет) и открываем заново
+    st = os.stat(wav_path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    held = _held.get(wav_path)
+    if held is not None:
+        if held[0] == stamp:
+            _held.move_to_end(wav_path)
+            return held[1]
+        del _held[wav_path]
+        pcm.release(wav_path)
+    store = pcm.acquire(wav_path)
+    _held[wav_path] = (stamp, store)
+    while len(_held) > 2:
+        old_path, _ = _held.popitem(last=False)
+        pcm.release(old_path)
+    return store
+
+
+def _worker_transcribe(
+    wav_path: str,
+    windows: Sequence[Tuple[float, float]],
+    language: str,
+    model: Optional[str],
+    batch_size: int,
+) -> List[str]:
+    from app.services.pipeline.asr import _transcribe, transcribe_clips
+
+    store = _worker_store(wav_path)
+    clips = [store.window(s, e) for s, e in windows]
+    if batch_size > 1:
+        return transcribe_clips(clips, language=language, batch_size=batch_size, model=model)
+    return [(_transcribe(c, language=language, model=model) or "") if c.size else "" for c in clips]
+
+
+# ─────────────────────────────────────────
+# Родительский процесс
+# ─────────────────────────────────────────
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            n, threads = workers(), _cpu_threads_per_worker()
+            _pool = ProcessPoolExecutor(
+                max_workers=n,
+                mp_context=mp.get_context("spawn"),
+                initializer=_worker_init,
+                initargs=(threads,),
+            )
+            log.info("ASR worker pool started: workers=%d cpu_threads=%d", n, threads)
+        return _pool
+
+
+async def transcribe_windows(
+    wav_path: str,
+    windows: Sequence[Tuple[float, float]],
+    language: str = "ru",
+    model: Optional[str] = None,
+) -> List[str]:
+    """Шардировать окна по воркерам и вернуть тексты в порядке windows ("" для упавших шардов)."""
+    if not windows:
+        return []
+    shard = max(1, int(getattr(settings, "asr_worker_shard_size", 8) or 1))
+    batch_size = int(getattr(settings, "asr_batch_size", 1) or 1)
+    loop = asyncio.get_running_loop()
+    pool = _get_pool()
+
+    bounds = [(k, min(k + shard, len(windows))) for k in range(0, len(windows), shard)]
+    t0 = time.monotonic()
+    futures = [
+        loop.run_in_executor(pool, _worker_transcribe, wav_path, list(windows[a:b]), language, model, batch_size)
+        for a, b in bounds
+    ]
+    results = await asyncio.gather(*futures, return_exceptions=True)
+
+    out: List[str] = [""] * len(windows)
+    failed = 0
+    for (a, b), res in zip(bounds, results):
+        if isinstance(res, BaseException):
+            failed += 1
+            log.error("ASR shard [%d:%d] failed for %s: %r", a, b, wav_path, res)
+            continue
+        out[a:b] = [t or "" for t in res]
+
+    elapsed = time.monotonic() - t0
+    _metrics["shards"] += len(bounds)
+    _metrics["windows"] += len(windows)
+    _metrics["failed_shards"] += failed
+    _metrics["busy_sec"] += elapsed
+    log.info("ASR pool: %d windows in %d shards (%d failed) in %.2fs, file=%s",
+             len(windows), len(bounds), failed, elapsed, wav_path)
+    return out
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        "workers": workers(),
+        "cpu_threads": _cpu_threads_per_worker() if workers() else 0,
+        "started": _pool is not None,
+        **{k: (round(v, 3) if isinstance(v, float) else v) for k, v in _metrics.items()},
+    }
+
+
+def shutdown() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+            log.info("ASR worker pool stopped")
@@ -1,21 +1,51 @@
 from __future__ import annotations
 
-import inspect
+import asyncio
+import os
+import time
 from collections import defaultdict
-from typing import List, Dict, Tuple
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, List, Dict, Tuple
 
-from sqlalchemy import select, func
+import numpy as np
+
+from sqlalchemy import select, func, update
 from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db.session import async_session
-from app.db.models import MfgDiarization, MfgSegment, MfgTranscript
+from app.db.models import MfgDiarization, MfgFile, MfgSegment, MfgTranscript
+from app.core.config import settings
 from app.core.logger import get_logger
-from app.services.pipeline.asr import transcribe_window_from_wav
+from app.services.pipeline import asr_cache, asr_pool, gate, pcm
+from app.services.pipeline.asr import BEAM_SIZE, transcribe_arrays, transcribe_longform
+from app.services.pipeline.executor import run_inference
+from app.services.pipeline.media import prepare_pcm
+from app.services.pipeline.registry import whisper_registry
 
 log = get_logger(__name__)
 
-_IS_ASYNC_ASR = inspect.iscoroutinefunction(transcribe_window_from_wav)
+ProgressCallback = Callable[[float], Awaitable[None]]
+
+
+class _Progress:
+    """Доля обработанного аудио (сек) → on_progress(0..1); сообщаем на каждом flush."""
+
+    def __init__(self, total_sec: float, callback: ProgressCallback | None):
+        self.total = max(0.0, total_sec)
+        self.done = 0.0
+        self.callback = callback
+
+    def advance(self, sec: float) -> None:
+        self.done += max(0.0, sec)
+
+    async def report(self) -> None:
+        if self.callback is None or self.total <= 0:
+            return
+        try:
+            await self.callback(min(1.0, self.done / self.total))
+        except Exception:
+            log.warning("ASR progress callback failed", exc_info=True)
 
 
 async def _load_diar_chunks(session: AsyncSession, transcript_id: int, mode: str | None = None) -> List[MfgDiarization]:
@@ -27,6 +57,34 @@ async def _load_diar_chunks(session: AsyncSession, transcript_id: int, mode: str
     return rows
 
 
+async def _ensure_pcm(session: AsyncSession, transcript_id: int, wav_path: str) -> str:
+    """
+    Путь к PCM чанков транскрипта. Нормализованный файл из media_cache мог быть вытеснен
+    LRU после сегментации — тогда готовим его заново из исходника транскрипта
+    и переписываем file_path чанков.
+    """
+    if pcm.is_open(wav_path) or os.path.exists(wav_path):
+        return wav_path
+    tr = await session.get(MfgTranscript, transcript_id)
+    source = getattr(tr, "file_path", None) if tr is not None else None
+    if not source and tr is not None and getattr(tr, "file_id", None):
+        f = await session.get(MfgFile, tr.file_id)
+        source = f.stored_path if f is not None else None
+    if not source or not os.path.exists(source):
+        raise FileNotFoundError(wav_path)
+
+    fresh = str(await prepare_pcm(source))
+    log.warning("PCM %s is gone (evicted?) — re-derived from %s → %s (tid=%s)", wav_path, source, fresh, transcript_id)
+    if fresh != wav_path:
+        await session.execute(
+            update(MfgDiarization)
+            .where(MfgDiarization.transcript_id == transcript_id, MfgDiarization.file_path == wav_path)
+            .values(file_path=fresh)
+        )
+        await session.commit()
+    return fresh
+
+
 async def _load_existing_segments(session: AsyncSession, transcript_id: int, mode: str | None) -> Dict[Tuple[float, float], int]:
     """
     Ключи уже сохранённых сегментов для заданного режима: (start, end) → 1.
@@ -96,39 +154,277 @@ async def _mark_transcript_done(session: AsyncSession, transcript_id: int) -> No
     await session.commit()
 
 
-async def _call_asr(wav_path: str, start: float, end: float, language: str) -> str:
+@dataclass
+class _Unit:
+    """Порция окон одного файла, проходящая стадии prefetch → decode → write."""
+    chunks: List[MfgDiarization]
+    spans: List[Tuple[float, float]]
+    keys: List[str] = field(default_factory=list)
+    texts: List[str] = field(default_factory=list)
+    miss: List[int] = field(default_factory=list)       # индексы окон без попадания в кэш
+    clips: List[np.ndarray] = field(default_factory=list)  # PCM промахов (in-process декодер)
+
+
+def _slice_clips(wav_path: str, spans: List[Tuple[float, float]]) -> List[np.ndarray]:
+    with pcm.open_pcm(wav_path) as store:
+        return [store.window(s, e) for s, e in spans]
+
+
+async def _transcribe_staged(
+    transcript_id: int,
+    wav_path: str,
+    windows: List[MfgDiarization],
+    spans: List[Tuple[float, float]],
+    language: str,
+    mode: str | None,
+    model: str | None,
+    counters: Dict[str, int],
+    progress: _Progress,
+) -> Tuple[int, int]:
     """
-    Унифицированный вызов ASR: если функция async — ждём, если sync — вызываем напрямую.
-    Возвращаем строку (пустую, если ничего не распознано).
+    ASR окон одного файла тремя стадиями на asyncio-очередях:
+      prefetch — хэш окон + поиск в кэше + нарезка PCM промахов в numpy;
+      decode   — только декодирование (пул процессов / батчи / по одному);
+      write    — upsert сегментов (своя сессия) и запись в кэш микро-батчами.
+    Кэш читается и пишется в отдельных коротких сессиях: rollback после его сбоя
+    не должен expire'ить строки MfgDiarization сессии джобы.
+    Очереди ограничены ASR_PREFETCH_DEPTH / ASR_WRITE_QUEUE_DEPTH порций, так что
+    декодер не ждёт ни нарезку, ни БД, а память не растёт. Возвращает (saved, flushes).
     """
-    if _IS_ASYNC_ASR:
-        txt = await transcribe_window_from_wav(wav_path, start, end, language=language)
-    else:
-        txt = transcribe_window_from_wav(wav_path, start, end, language=language)
+    use_pool = asr_pool.workers() > 0
+    batch_size = max(1, int(getattr(settings, "asr_batch_size", 1) or 1))
+    use_cache = asr_cache.enabled()
+    tier = whisper_registry.resolve(model)
+    params = asr_cache.make_params(BEAM_SIZE, batched=batch_size > 1)
+    flush_every = max(1, int(getattr(settings, "asr_flush_every_windows", 16) or 1))
+    flush_sec = float(getattr(settings, "asr_flush_every_sec", 30.0) or 0.0)
+    unit = _decode_unit()
+
+    to_decode: asyncio.Queue = asyncio.Queue(maxsize=max(1, int(getattr(settings, "asr_prefetch_depth", 2) or 1)))
+    to_write: asyncio.Queue = asyncio.Queue(maxsize=max(1, int(getattr(settings, "asr_write_queue_depth", 4) or 1)))
+    result = {"saved": 0, "flushes": 0}
+
+    async def prefetch() -> None:
+        for k in range(0, len(spans), unit):
+            u = _Unit(chunks=windows[k:k + unit], spans=spans[k:k + unit])
+            u.texts = [""] * len(u.spans)
+            cached: Dict[str, str] = {}
+            if use_cache:
+                u.keys = await run_inference(
+                    asr_cache.window_keys, wav_path, u.spans, tier, language, params, name="asr_cache_keys"
+                )
+                try:
+                    async with async_session() as csession:
+                        cached = await asr_cache.lookup(csession, u.keys)
+                except Exception:
+                    # кэш — оптимизация: при сбое БД просто декодируем всё
+                    log.exception("ASR cache lookup failed, file=%s", wav_path)
+            for i in range(len(u.spans)):
+                if use_cache and u.keys[i] in cached:
+                    u.texts[i] = cached[u.keys[i]]
+                else:
+                    u.miss.append(i)
+            if u.miss and not use_pool:
+                # воркеры пула читают PCM сами — нарезаем только для декодера в этом процессе
+                u.clips = await run_inference(_slice_clips, wav_path, [u.spans[i] for i in u.miss], name="asr_prefetch")
+            await to_decode.put(u)
+        await to_decode.put(None)
+
+    async def decode() -> None:
+        while (u := await to_decode.get()) is not None:
+            if u.miss:
+                if use_pool:
+                    texts = await asr_pool.transcribe_windows(
+                        wav_path, [u.spans[i] for i in u.miss], language=language, model=model
+                    )
+                else:
+                    texts = await transcribe_arrays(u.clips, language=language, batch_size=batch_size, model=model)
+                for i, t in zip(u.miss, texts):
+                    u.texts[i] = t or ""
+                u.clips = []
+            await to_write.put(u)
+        await to_write.put(None)
+
+    async def write() -> None:
+        pending: List[dict] = []
+        cache_items: List[Tuple[str, str]] = []
+        unflushed = 0
+        last_flush = time.monotonic()
+        async with async_session() as wsession:
+            while True:
+                u = await to_write.get()
+                if u is not None:
+                    pending.extend(_window_items(u.chunks, u.texts, language))
+                    if use_cache:
+                        cache_items.extend((u.keys[i], u.texts[i]) for i in u.miss)
+                    unflushed += len(u.spans)
+                    counters["cache_hits"] = counters.get("cache_hits", 0) + len(u.spans) - len(u.miss)
+                    counters["cache_misses"] = counters.get("cache_misses", 0) + len(u.miss)
+                    progress.advance(sum(float(c.end_ts) - float(c.start_ts) for c in u.chunks))
+
+                due = unflushed >= flush_every or (flush_sec > 0 and time.monotonic() - last_flush >= flush_sec)
+                if unflushed and (u is None or due):
+                    log.debug("Persist %d segments via upsert (tid=%s, mode=%s)", len(pending), transcript_id, mode)
+                    result["saved"] += await _persist_segments(wsession, transcript_id, pending, mode)
+                    result["flushes"] += 1
+                    if cache_items:
+                        try:
+                            async with async_session() as csession:
+                                await asr_cache.store(csession, cache_items, tier, language, params)
+                        except Exception:
+                            log.exception("ASR cache store failed, file=%s", wav_path)
+                    pending, cache_items, unflushed, last_flush = [], [], 0, time.monotonic()
+                    await progress.report()
+                if u is None:
+                    return
+
+    tasks = [asyncio.create_task(coro) for coro in (prefetch(), decode(), write())]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    return result["saved"], result["flushes"]
+
+
+def _use_longform(mode: str | None) -> bool:
+    return mode == "full" and bool(getattr(settings, "asr_longform_enabled", True))
+
+
+async def _last_segment_end(
+    session: AsyncSession, transcript_id: int, mode: str | None, start: float, end: float
+) -> float | None:
+    """Конец последнего сохранённого сегмента внутри [start, end] — точка продолжения long-form."""
+    q = select(func.max(MfgSegment.end_ts)).where(
+        MfgSegment.transcript_id == transcript_id,
+        MfgSegment.mode == (mode or "diarize"),
+        MfgSegment.start_ts >= start - 1e-3,
+        MfgSegment.end_ts <= end + 1e-3,
+    )
+    last = (await session.execute(q)).scalar_one_or_none()
+    return float(last) if last is not None else None
 
-    if txt is None:
-        return ""
 
-    if isinstance(txt, str):
-        return txt
+async def _longform_file(
+    session: AsyncSession,
+    transcript_id: int,
+    wav_path: str,
+    chunks: List[MfgDiarization],
+    language: str,
+    mode: str | None,
+    model: str | None,
+    gate_stats: Dict[str, object],
+    progress: _Progress,
+) -> int:
+    """
+    Long-form для чанков режима full: каждый сегмент Whisper сохраняется со своими
+    start_ts/end_ts, блоки пишутся в БД по мере готовности. Уже сохранённое
+    не перерасшифровывается — продолжаем с конца последнего сегмента.
+    """
+    saved = 0
+    async with pcm.open_pcm_async(wav_path):
+        for c in chunks:
+            start, end = float(c.start_ts), float(c.end_ts)
+            if end - start <= 1e-6:
+                continue
+            chunk_start, chunk_end = start, end
+            if gate.enabled_for(mode):
+                (decision,) = await run_inference(gate.gate_windows, wav_path, [(start, end)], name="asr_gate")
+                _merge_gate_stats(gate_stats, gate.summarize([decision], [(start, end)]))
+                if decision.window is None:
+                    log.info("ASR gate: chunk [%.1f..%.1f] skipped (%s), tid=%s", start, end, decision.reason, transcript_id)
+                    progress.advance(end - start)
+                    continue
+                start, end = decision.window
+
+            resume = await _last_segment_end(session, transcript_id, mode, chunk_start, chunk_end)
+            if resume is not None:
+                log.info("Long-form resume from %.1fs (tid=%s, file=%s)", resume, transcript_id, wav_path)
+            mark = max(start, resume) if resume is not None else start
+            progress.advance(mark - chunk_start)
+
+            # каждый блок пишется сразу: после падения продолжаем с последнего сегмента
+            chunk_lang = getattr(c, "lang", None) or language
+            async for covered, segs in transcribe_longform(
+                wav_path, start, end, language=language, model=model, resume_from=resume
+            ):
+                items = [
+                    dict(start_ts=s, end_ts=e, text=t.strip(), speaker=c.speaker, lang=chunk_lang)
+                    for s, e, t in segs
+                    if t.strip()
+                ]
+                saved += await _persist_segments(session, transcript_id, items, mode)
+                progress.advance(covered - mark)
+                mark = covered
+                await progress.report()
+            progress.advance(chunk_end - mark)
+    return saved
+
+
+def _decode_unit() -> int:
+    """
+    Сколько окон отдавать в ASR за раз: не меньше, чем декодер обрабатывает одним заходом,
+    и не меньше ASR_FLUSH_EVERY_WINDOWS — иначе prefetch ходит в кэш/БД на каждое окно.
+    """
+    flush_every = max(1, int(getattr(settings, "asr_flush_every_windows", 16) or 1))
+    if asr_pool.workers() > 0:
+        per_call = asr_pool.workers() * max(1, int(getattr(settings, "asr_worker_shard_size", 8) or 1))
+    else:
+        per_call = max(1, int(getattr(settings, "asr_batch_size", 1) or 1))
+    return max(per_call, flush_every)
+
+
+def _window_items(chunks: List[MfgDiarization], texts: List[str], language: str) -> List[dict]:
+    """Результаты ASR → строки mfg_segment; ключ — границы чанка (даже если гейт обрезал окно)."""
+    items: List[dict] = []
+    for c, txt in zip(chunks, texts):
+        if not txt.strip():
+            continue
+        items.append(
+            dict(
+                start_ts=float(c.start_ts),
+                end_ts=float(c.end_ts),
+                text=txt,
+                speaker=c.speaker,
+                lang=getattr(c, "lang", None) or language,
+            )
+        )
+    return items
 
-    # Фоллбэк: если вернулась структура, пробуем извлечь текст
-    if isinstance(txt, dict):
-        return txt.get("text", "") or ""
-    if isinstance(txt, (list, tuple)) and txt and isinstance(txt[0], str):
-        return txt[0]
 
-    return ""
+def _merge_gate_stats(acc: Dict[str, object], part: Dict[str, object]) -> None:
+    for k, v in part.items():
+        if isinstance(v, dict):
+            bucket = acc.setdefault(k, {})
+            for rk, rv in v.items():
+                bucket[rk] = bucket.get(rk, 0) + rv
+        else:
+            acc[k] = round(acc.get(k, 0) + v, 2)
 
 
-async def process_pipeline_segments(transcript_id: int, language: str = "ru", mode: str | None = None) -> dict:
+async def process_pipeline_segments(
+    transcript_id: int,
+    language: str = "ru",
+    mode: str | None = None,
+    model: str | None = None,
+    on_progress: ProgressCallback | None = None,
+) -> dict:
     """
     Поток:
       1) берём чанки из mfg_diarization по mode,
       2) фильтруем уже записанные интервалы ТОЛЬКО для этого mode,
-      3) транскрибируем каждый чанк,
-      4) UPSERT в mfg_segment с mode,
-      5) переводим транскрипт в transcription_done.
+      3) в режимах из ASR_GATE_MODES отсеиваем тишину/не-речь и срезаем края (gate.py),
+      4) транскрибируем чанки конвейером prefetch → decode → write (_transcribe_staged):
+         сначала кэш mfg_asr_cache, промахи — по одному или батчами, см. ASR_BATCH_SIZE;
+         режим full — long-form с таймстемпами Whisper, см. _longform_file,
+      5) UPSERT в mfg_segment с mode — микро-батчами каждые ASR_FLUSH_EVERY_WINDOWS окон
+         или ASR_FLUSH_EVERY_SEC секунд: после падения повторный запуск продолжает
+         с первого несохранённого окна (шаг 2),
+      6) переводим транскрипт в transcription_done.
+    model — тир Whisper из ASR_MODELS (None → ASR_DEFAULT_MODEL).
+    on_progress(доля 0..1 обработанного аудио) вызывается на каждом flush.
     """
     async with async_session() as session:
         diar_chunks = await _load_diar_chunks(session, transcript_id, mode=mode)
@@ -148,8 +444,30 @@ async def process_pipeline_segments(transcript_id: int, language: str = "ru", mo
             by_file[c.file_path].append(c)
 
         total_saved = 0
+        flushes = 0
+        counters: Dict[str, int] = {}
+        gate_stats: Dict[str, object] = {}
+
+        longform = _use_longform(mode)
+        progress = _Progress(
+            sum(
+                float(c.end_ts) - float(c.start_ts)
+                for c in diar_chunks
+                if longform or (float(c.start_ts), float(c.end_ts)) not in existing_map
+            ),
+            on_progress,
+        )
+
+        for file_path, group in by_file.items():
+            wav_path = await _ensure_pcm(session, transcript_id, file_path)
+            if longform:
+                saved = await _longform_file(
+                    session, transcript_id, wav_path, group, language, mode, model, gate_stats, progress
+                )
+                total_saved += saved
+                log.info("Long-form: сохранено сегментов +%d (tid=%s, file=%s, mode=%s)", saved, transcript_id, wav_path, mode)
+                continue
 
-        for wav_path, group in by_file.items():
             # оставляем только новые интервалы для этого mode
             group = [
                 c
@@ -159,7 +477,7 @@ async def process_pipeline_segments(transcript_id: int, language: str = "ru", mo
             if not group:
                 log.info(
                     "Для файла %s все %d интервалов уже есть в mfg_segment (tid=%s, mode=%s)",
-                    wav_path, len(by_file[wav_path]), transcript_id, mode
+                    wav_path, len(by_file[file_path]), transcript_id, mode
                 )
                 continue
 
@@ -168,45 +486,29 @@ async def process_pipeline_segments(transcript_id: int, language: str = "ru", mo
                 len(group), transcript_id, wav_path, mode
             )
 
-            to_save: List[dict] = []
-
-            for c in group:
-                start = float(c.start_ts)
-                end = float(c.end_ts)
-
-                if end - start <= 1e-6:
-                    continue
-
-                try:
-                    txt = await _call_asr(wav_path, start, end, language=language)
-                except Exception:
-                    log.exception(
-                        "ASR error on window [%s..%s] file=%s tid=%s mode=%s",
-                        start, end, wav_path, transcript_id, mode
-                    )
-                    continue
-
-                if not txt.strip():
-                    continue
-
-                chunk_lang = getattr(c, "lang", None) or language
-                txt_len = len(txt)
-                log.debug("ASR window ok: [%0.2f..%0.2f] → len=%d (tid=%s, mode=%s)", start, end, txt_len, transcript_id, mode)
-
-                to_save.append(
-                    dict(
-                        start_ts=start,
-                        end_ts=end,
-                        text=txt,
-                        speaker=c.speaker,
-                        lang=chunk_lang,
-                    )
+            windows = [c for c in group if float(c.end_ts) - float(c.start_ts) > 1e-6]
+
+            # PCM файла декодируется один раз на всю группу окон
+            async with pcm.open_pcm_async(wav_path):
+                spans = [(float(c.start_ts), float(c.end_ts)) for c in windows]
+                if gate.enabled_for(mode):
+                    # тишина/шум в Whisper не идут; ключи сегментов остаются по границам чанков
+                    decisions = await run_inference(gate.gate_windows, wav_path, spans, name="asr_gate")
+                    _merge_gate_stats(gate_stats, gate.summarize(decisions, spans))
+                    progress.advance(sum(e - s for (s, e), d in zip(spans, decisions) if d.window is None))
+                    windows = [c for c, d in zip(windows, decisions) if d.window is not None]
+                    spans = [d.window for d in decisions if d.window is not None]
+                    log.info("ASR gate: skipped %d of %d windows (tid=%s, file=%s, mode=%s)",
+                             len(decisions) - len(spans), len(decisions), transcript_id, wav_path, mode)
+
+                saved, n_flush = await _transcribe_staged(
+                    transcript_id, wav_path, windows, spans,
+                    language, mode, model, counters, progress,
                 )
+                total_saved += saved
+                flushes += n_flush
 
-            log.debug("Persist %d segments via upsert (tid=%s, mode=%s)", len(to_save), transcript_id, mode)
-            saved = await _persist_segments(session, transcript_id, to_save, mode)
-            total_saved += saved
-            log.info("Сохранено/обновлено сегментов: +%d (tid=%s, file=%s, mode=%s)", saved, transcript_id, wav_path, mode)
+            log.info("Сохранено/обновлено сегментов: всего %d (tid=%s, file=%s, mode=%s)", total_saved, transcript_id, wav_path, mode)
 
         await _mark_transcript_done(session, transcript_id)
 
@@ -214,5 +516,10 @@ async def process_pipeline_segments(transcript_id: int, language: str = "ru", mo
             "found_chunks": len(diar_chunks),
             "existing_segments": len(existing_map),
             "new_segments": total_saved,
+            "flushes": flushes,
             "mode": mode,
+            "model": model,
+            "cache_hits": counters.get("cache_hits", 0),
+            "cache_misses": counters.get("cache_misses", 0),
+            **({"gate": gate_stats} if gate_stats else {}),
         }
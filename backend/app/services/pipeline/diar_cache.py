@@ -0,0 +1,158 @@
+# app/services/pipeline/diar_cache.py
+"""
+Кэш результатов диаризации (таблица mfg_diarization_cache).
+
+Ключ — sha256 от нормализованного PCM (int16 mono 16k) и параметров пайплайна:
+модель, версия pyannote.audio (гиперпараметры заданы конфигом модели),
+настройки чанкования/склейки — только если файл длиннее DIAR_CHUNK_MIN_FILE_SEC.
+Сам пайплайн для ключа не грузится: попадание в кэш обходится без pyannote в памяти.
+Повторная диаризация того же аудио (overwrite=true, повторная загрузка файла,
+другой transcript_id) берёт готовые turns вместо повторного прогона pyannote.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.logger import get_logger
+from app.db.models import MfgDiarizationCache
+from app.services.pipeline import pcm
+
+log = get_logger(__name__)
+
+# сэмплов за один update хэша: память не зависит от длины файла
+_HASH_BLOCK = 1 << 20
+
+# count(*) по таблице кэша — полный скан: проверяем квоту не чаще раза в _EVICT_EVERY_SEC
+_EVICT_EVERY_SEC = 300.0
+_last_evict = 0.0
+
+_metrics_lock = threading.Lock()
+_metrics: Dict[str, int] = {"hits": 0, "misses": 0, "stored": 0, "evicted": 0}
+
+
+def enabled() -> bool:
+    return bool(getattr(settings, "diar_cache_enabled", True))
+
+
+def _max_entries() -> int:
+    return max(0, int(getattr(settings, "diar_cache_max_entries", 0) or 0))
+
+
+def pipeline_params(duration: float) -> str:
+    """Всё, что влияет на результат диаризации файла длиной duration, — каноничным JSON."""
+    import pyannote.audio
+    from app.services.pipeline.diarization import MODEL_NAME
+
+    params = {
+        "model": MODEL_NAME,
+        "pyannote": getattr(pyannote.audio, "__version__", "?"),
+    }
+    min_file = float(getattr(settings, "diar_chunk_min_file_sec", 0) or 0)
+    if min_file > 0 and duration > min_file:
+        params["chunk"] = [
+            float(getattr(settings, "diar_chunk_sec", 0) or 0),
+            float(getattr(settings, "diar_chunk_overlap_sec", 0) or 0),
+            float(getattr(settings, "diar_stitch_threshold", 0) or 0),
+        ]
+    return json.dumps(params, sort_keys=True, default=str)
+
+
+def content_key(wav_path: str, params: str) -> str:
+    """sha256(PCM + params) блоками по memmap (блокирующая: звать через run_inference)."""
+    h = hashlib.sha256()
+    with pcm.open_pcm(wav_path) as store:
+        h.update(f"{store.sample_rate}:{store.num_samples}|".encode())
+        for a in range(0, store.num_samples, _HASH_BLOCK):
+            h.update(np.ascontiguousarray(store.samples[a:a + _HASH_BLOCK]).tobytes())
+    h.update(params.encode("utf-8"))
+    return h.hexdigest()
+
+
+def _count(**delta: int) -> None:
+    with _metrics_lock:
+        for k, v in delta.items():
+            _metrics[k] += v
+
+
+async def lookup(session: AsyncSession, key: str) -> Optional[Tuple[List[Dict[str, Any]], Dict[str, List[float]]]]:
+    """(turns [{speaker,start_ts,end_ts}], centroids) или None."""
+    row = (await session.execute(
+        select(MfgDiarizationCache.turns, MfgDiarizationCache.centroids).where(MfgDiarizationCache.key == key)
+    )).first()
+    if row is None:
+        _count(misses=1)
+        return None
+    await session.execute(
+        update(MfgDiarizationCache)
+        .where(MfgDiarizationCache.key == key)
+        .values(hits=MfgDiarizationCache.hits + 1, last_hit_at=func.now())
+    )
+    await session.commit()
+    _count(hits=1)
+    return list(row[0] or []), dict(row[1] or {})
+
+
+async def store(
+    session: AsyncSession,
+    key: str,
+    chunks: List[Dict[str, Any]],
+    centroids: Dict[str, np.ndarray],
+    duration: float,
+) -> None:
+    turns = [
+        {"speaker": c["speaker"], "start_ts": float(c["start_ts"]), "end_ts": float(c["end_ts"])}
+        for c in chunks
+    ]
+    cents = {
+        spk: np.asarray(v, dtype=np.float32).tolist()
+        for spk, v in centroids.items()
+        if v is not None and np.all(np.isfinite(v))
+    }
+    stmt = pg_insert(MfgDiarizationCache).values(
+        key=key, turns=turns, centroids=cents, duration_s=float(duration),
+    )
+    await session.execute(stmt.on_conflict_do_nothing(index_elements=["key"]))
+    await session.commit()
+    _count(stored=1)
+    await _evict(session)
+
+
+async def _evict(session: AsyncSession) -> int:
+    global _last_evict
+    limit = _max_entries()
+    if limit <= 0:
+        return 0
+    now = time.monotonic()
+    if now - _last_evict < _EVICT_EVERY_SEC:
+        return 0
+    _last_evict = now
+    total = (await session.execute(select(func.count()).select_from(MfgDiarizationCache))).scalar_one()
+    extra = int(total) - limit
+    if extra <= 0:
+        return 0
+    oldest = select(MfgDiarizationCache.key).order_by(MfgDiarizationCache.last_hit_at.asc()).limit(extra)
+    await session.execute(delete(MfgDiarizationCache).where(MfgDiarizationCache.key.in_(oldest.scalar_subquery())))
+    await session.commit()
+    _count(evicted=extra)
+    log.info("Diarization cache: evicted %d oldest entries (limit=%d)", extra, limit)
+    return extra
+
+
+def stats() -> Dict[str, Optional[float]]:
+    with _metrics_lock:
+        snap: Dict[str, Optional[float]] = dict(_metrics)
+    total = (snap["hits"] or 0) + (snap["misses"] or 0)
+    snap["hit_ratio"] = round((snap["hits"] or 0) / total, 3) if total else None
+    snap["enabled"] = enabled()
+    snap["max_entries"] = _max_entries()
+    return snap
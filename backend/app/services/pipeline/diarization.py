@@ -3,10 +3,12 @@ from __future__ import annotations
 import asyncio
 import time
 import warnings
+from contextlib import contextmanager
 from pathlib import Path
-from threading import Lock
-from typing import List, Dict
+from threading import Condition, Lock
+from typing import Iterator, List, Dict, Tuple
 
+import numpy as np
 import torch
 from pyannote.audio import Pipeline
 from pyannote.audio.pipelines import SpeakerDiarization
@@ -14,7 +16,9 @@ from pyannote.audio.utils.reproducibility import ReproducibilityWarning
 
 from app.core.config import settings
 from app.core.logger import get_logger
-from app.services.pipeline.media import convert_to_wav16k_mono
+from app.services.pipeline import pcm
+from app.services.pipeline.executor import run_inference
+from app.services.pipeline.media import prepare_pcm
 
 log = get_logger(__name__)
 warnings.filterwarnings("ignore", category=ReproducibilityWarning)
@@ -45,6 +49,66 @@ def get_pipeline() -> SpeakerDiarization:
                 _pipeline = _load_pipeline_sync()
     return _pipeline
 
+
+# Экземпляр пайплайна (и его модель эмбеддингов) не потокобезопасен: каждый вызов
+# берёт свой в монопольное пользование. Экземпляров не больше DIAR_PARALLEL_CHUNKS,
+# первый — общий get_pipeline(), остальные грузятся по мере надобности.
+_idle: List[SpeakerDiarization] = []
+_instances = 0
+_idle_cond = Condition(Lock())
+
+
+def _max_instances() -> int:
+    return max(1, int(getattr(settings, "diar_parallel_chunks", 1) or 1))
+
+
+@contextmanager
+def _borrow_pipeline() -> Iterator[SpeakerDiarization]:
+    global _instances
+    with _idle_cond:
+        while not _idle and _instances >= _max_instances():
+            _idle_cond.wait()
+        pipe = _idle.pop() if _idle else None
+        if pipe is None:
+            _instances += 1
+            first = _instances == 1
+    if pipe is None:
+        try:
+            pipe = get_pipeline() if first else _load_pipeline_sync()
+        except BaseException:
+            with _idle_cond:
+                _instances -= 1
+                _idle_cond.notify()
+            raise
+    try:
+        yield pipe
+    finally:
+        with _idle_cond:
+            _idle.append(pipe)
+            _idle_cond.notify()
+
+
+_WAVEFORM_BLOCK_SEC = 60.0
+
+
+def _waveform(store: pcm.PcmStore, start: float, end: float) -> torch.Tensor:
+    """
+    Окно [start, end] хранилища → тензор (1, n) float32 для pyannote. Заполняется
+    блоками по _WAVEFORM_BLOCK_SEC прямо из int16 (memmap/FLAC seek): в памяти
+    только сам тензор и один блок, без полной int16-копии и промежуточного массива.
+    """
+    s0 = max(0, int(round(start * store.sample_rate)))
+    e0 = min(store.num_samples, int(round(end * store.sample_rate)))
+    out = torch.empty((1, max(0, e0 - s0)), dtype=torch.float32)
+    step = int(_WAVEFORM_BLOCK_SEC * store.sample_rate)
+    for a in range(s0, e0, step):
+        b = min(e0, a + step)
+        block = store.window_int16(a / store.sample_rate, b / store.sample_rate)
+        n = min(block.shape[0], b - a)
+        out[0, a - s0:a - s0 + n] = torch.from_numpy(np.asarray(block[:n], dtype=np.float32))
+    out.mul_(1.0 / 32768.0)
+    return out
+
 # ─────────────────────────────────────────
 # Helpers
 # ─────────────────────────────────────────
@@ -73,42 +137,191 @@ def _merge_chunks(chunks: List[Dict], min_len: float = 1.0, max_gap: float = 0.3
             out[-1]["end_ts"] = m["end_ts"]
     return out
 
+# ─────────────────────────────────────────
+# Чанкованная диаризация (длинные записи)
+# ─────────────────────────────────────────
+def _plan_chunks(duration: float, chunk_sec: float, overlap_sec: float) -> List[Tuple[float, float]]:
+    """Окна [start, end) длиной chunk_sec с перекрытием overlap_sec, покрывающие [0, duration]."""
+    step = max(1.0, chunk_sec - overlap_sec)
+    out: List[Tuple[float, float]] = []
+    start = 0.0
+    while True:
+        end = min(duration, start + chunk_sec)
+        out.append((start, end))
+        if end >= duration:
+            return out
+        start += step
+
+
+def _diarize_window(wav_path: str, start: float, end: float) -> Tuple[List[Tuple[float, float, str]], Dict[str, np.ndarray]]:
+    """
+    pyannote на окне [start, end] файла (waveform из PCM-хранилища, без записи на диск).
+    → (turns в абсолютном времени, {локальная метка: центроид-эмбеддинг}).
+    """
+    with pcm.open_pcm(wav_path) as store:
+        waveform = _waveform(store, start, end)
+    if waveform.shape[1] == 0:
+        return [], {}
+    with _borrow_pipeline() as pipe:
+        diarization, embeddings = pipe(
+            {"waveform": waveform, "sample_rate": pcm.SAMPLE_RATE}, return_embeddings=True
+        )
+    turns = [
+        (start + float(turn.start), start + float(turn.end), label)
+        for turn, _, label in diarization.itertracks(yield_label=True)
+    ]
+    # строки embeddings идут в порядке diarization.labels()
+    centroids = {label: np.asarray(embeddings[k], dtype=np.float32) for k, label in enumerate(diarization.labels())}
+    return turns, centroids
+
+
+def _stitch_speakers(
+    per_chunk: List[Dict[str, np.ndarray]], threshold: float
+) -> Tuple[List[Dict[str, int]], Dict[int, np.ndarray]]:
+    """
+    Связывание локальных меток чанков: агломеративная кластеризация (average, cosine)
+    центроидов всех чанков, порог — косинусное расстояние. Метки одного чанка pyannote
+    уже развёл, поэтому их слияние отменяем (второй получает свой кластер).
+    → ([{локальная метка: глобальный id}] по чанкам, {глобальный id: центроид}).
+    """
+    from scipy.cluster.hierarchy import fcluster, linkage
+
+    items = [(ci, label, emb) for ci, cents in enumerate(per_chunk) for label, emb in cents.items()]
+    valid = [k for k, (_, _, emb) in enumerate(items) if np.all(np.isfinite(emb)) and np.linalg.norm(emb) > 0]
+
+    cluster_of: Dict[int, int] = {}
+    if len(valid) >= 2:
+        X = np.stack([items[k][2] / np.linalg.norm(items[k][2]) for k in valid])
+        assign = fcluster(linkage(X, method="average", metric="cosine"), t=threshold, criterion="distance")
+        cluster_of = {k: int(c) for k, c in zip(valid, assign)}
+    elif valid:
+        cluster_of = {valid[0]: 1}
+
+    next_id = max(cluster_of.values(), default=0) + 1
+    mapping: List[Dict[str, int]] = [dict() for _ in per_chunk]
+    members: Dict[int, List[np.ndarray]] = {}
+    for k, (ci, label, emb) in enumerate(items):
+        gid = cluster_of.get(k)
+        # без эмбеддинга (слишком мало речи) или конфликт внутри чанка — отдельный спикер
+        if gid is None or gid in mapping[ci].values():
+            gid, next_id = next_id, next_id + 1
+        mapping[ci][label] = gid
+        if k in cluster_of:
+            members.setdefault(gid, []).append(emb)
+
+    centroids = {gid: np.mean(np.stack(embs), axis=0) for gid, embs in members.items()}
+    return mapping, centroids
+
+
+def _split_overlaps(
+    windows: List[Tuple[float, float]],
+    per_chunk_turns: List[List[Tuple[float, float, str]]],
+    mapping: List[Dict[str, int]],
+    duration: float,
+) -> List[Tuple[float, float, int]]:
+    """
+    Turns всех чанков в глобальных id без дублей: в зоне перекрытия граница — середина,
+    левее берём turns чанка i, правее — i+1.
+    """
+    turns: List[Tuple[float, float, int]] = []
+    for i, ((start, end), chunk_turns) in enumerate(zip(windows, per_chunk_turns)):
+        lo = (start + windows[i - 1][1]) / 2 if i > 0 else 0.0
+        hi = (windows[i + 1][0] + end) / 2 if i + 1 < len(windows) else duration
+        for ts, te, label in chunk_turns:
+            ts, te = max(ts, lo), min(te, hi)
+            if te - ts > 1e-3:
+                turns.append((ts, te, mapping[i][label]))
+    turns.sort()
+    return turns
+
+
+async def _diarize_chunked(wav_path: str, duration: float) -> Tuple[List[Dict], Dict[str, np.ndarray]]:
+    chunk_sec = float(getattr(settings, "diar_chunk_sec", 600.0))
+    overlap = float(getattr(settings, "diar_chunk_overlap_sec", 30.0))
+    parallel = max(1, int(getattr(settings, "diar_parallel_chunks", 1) or 1))
+    windows = _plan_chunks(duration, chunk_sec, overlap)
+    log.info("Chunked diarization: %d chunks (%.0fs, overlap %.0fs, parallel=%d) for %s",
+             len(windows), chunk_sec, overlap, parallel, wav_path)
+
+    sem = asyncio.Semaphore(parallel)
+
+    async def one(idx: int, start: float, end: float):
+        async with sem:
+            for attempt in (1, 2):
+                try:
+                    return await run_inference(_diarize_window, wav_path, start, end, name="diarization_chunk")
+                except Exception:
+                    if attempt == 2:
+                        raise
+                    log.warning("Diarization chunk %d [%.0f..%.0f] failed, retrying", idx, start, end, exc_info=True)
+
+    results = await asyncio.gather(*(one(i, s, e) for i, (s, e) in enumerate(windows)))
+    mapping, centroids = _stitch_speakers([cents for _, cents in results], float(getattr(settings, "diar_stitch_threshold", 0.5)))
+
+    turns = _split_overlaps(windows, [chunk_turns for chunk_turns, _ in results], mapping, duration)
+
+    # глобальные метки SPEAKER_NN — в порядке первого появления
+    names: Dict[int, str] = {}
+    for _, _, gid in turns:
+        names.setdefault(gid, f"SPEAKER_{len(names):02d}")
+    chunks = [
+        {"speaker": names[gid], "start_ts": ts, "end_ts": te, "file_path": str(wav_path)}
+        for ts, te, gid in turns
+    ]
+    return chunks, {names[g]: c for g, c in centroids.items() if g in names}
+
+
 # ─────────────────────────────────────────
 # Main
 # ─────────────────────────────────────────
-async def diarize_file(audio_path: str) -> List[Dict]:
+async def diarize_file_ex(audio_path: str) -> Tuple[List[Dict], Dict[str, np.ndarray]]:
     """
-    Диаризация; возвращает список сегментов:
-    [{"speaker": "SPEAKER_00", "start_ts": float, "end_ts": float, "file_path": "<wav16k mono>"}]
-    В file_path кладём единый WAV 16k mono (без нарезки на диск).
+    Как diarize_file, плюс центроид-эмбеддинги спикеров: {speaker: np.ndarray}.
+    Записи длиннее DIAR_CHUNK_MIN_FILE_SEC обрабатываются окнами DIAR_CHUNK_SEC
+    с перекрытием DIAR_CHUNK_OVERLAP_SEC; метки связываются кластеризацией эмбеддингов.
     """
     # 1) быстрый конверт/нормализация формата
-    wav16k_path = await convert_to_wav16k_mono(audio_path, threads=0)  # 0 = пусть ffmpeg сам решит
+    wav16k_path = await prepare_pcm(audio_path, threads=0)  # 0 = пусть ffmpeg сам решит
+    return await diarize_wav_ex(str(wav16k_path))
+
+
+async def diarize_wav_ex(wav16k_path: str) -> Tuple[List[Dict], Dict[str, np.ndarray]]:
+    """diarize_file_ex для уже нормализованного WAV 16k mono (без конвертации)."""
     log.debug("Using WAV for diarization: %s", wav16k_path)
 
     # 2) лениво получаем пайплайн и считаем
-    loop = asyncio.get_running_loop()
-    pipeline = await loop.run_in_executor(None, get_pipeline)
+    await run_inference(get_pipeline, name="diar_load")
+
+    async with pcm.open_pcm_async(str(wav16k_path)) as store:
+        duration = store.duration
 
     t0 = time.time()
-    # В 3.x корректный вызов — словарь с ключом "audio" (можно и путь, но так надёжнее)
-    diarization = await loop.run_in_executor(None, lambda: pipeline({"audio": wav16k_path}))
+    min_file = float(getattr(settings, "diar_chunk_min_file_sec", 0) or 0)
+    if min_file > 0 and duration > min_file:
+        chunks, centroids = await _diarize_chunked(str(wav16k_path), duration)
+    else:
+        turns, centroids = await run_inference(_diarize_window, str(wav16k_path), 0.0, duration, name="diarization")
+        # 3) собираем сегменты (без записи чанков на диск)
+        chunks = [
+            {"speaker": label, "start_ts": ts, "end_ts": te, "file_path": str(wav16k_path)}
+            for ts, te, label in turns
+        ]
     elapsed = time.time() - t0
     log.info("pyannote diarization done in %.2fs for %s", elapsed, wav16k_path)
 
-    # 3) собираем сегменты (без записи чанков на диск)
-    chunks: List[Dict] = []
-    for idx, (turn, _, speaker) in enumerate(diarization.itertracks(yield_label=True)):
-        chunks.append({
-            "speaker": speaker,
-            "start_ts": float(turn.start),
-            "end_ts": float(turn.end),
-            "file_path": str(wav16k_path),
-        })
-
     # 4) пост-обработка (склейка)
     before = len(chunks)
     chunks = _merge_chunks(chunks, min_len=1.0, max_gap=0.3)
-    log.info("Diarization produced %d -> %d segments (merged) for %s", before, len(chunks), audio_path)
+    log.info("Diarization produced %d -> %d segments (merged) for %s", before, len(chunks), wav16k_path)
+
+    return chunks, centroids
 
+
+async def diarize_file(audio_path: str) -> List[Dict]:
+    """
+    Диаризация; возвращает список сегментов:
+    [{"speaker": "SPEAKER_00", "start_ts": float, "end_ts": float, "file_path": "<wav16k mono>"}]
+    В file_path кладём единый WAV 16k mono (без нарезки на диск).
+    """
+    chunks, _centroids = await diarize_file_ex(audio_path)
     return chunks
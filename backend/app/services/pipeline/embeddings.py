@@ -1,7 +1,8 @@
 import httpx 
-from typing import List
+from typing import Iterator, List, Optional, Sequence
 from app.core.config import settings
 from app.core.logger import get_logger
+from app.services import ollama
 
 log = get_logger(__name__)
 
@@ -11,21 +12,83 @@ async def embed_text(text: str) -> List[float] | None:
         log.warning("Empty text passed to embed_text – returning None")
         return None
 
-    url = f"{settings.ollama_url}/api/embed"
     payload = {"model": settings.embedding_model, "input": text} 
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        try:
-            # log.debug(f"Requesting embedding: model={settings.embedding_model}")
-            resp = await client.post(url, json=payload, timeout=10.0)
-            resp.raise_for_status()
-            data = resp.json()
-            # /api/embed возвращает "embeddings": [[...]] даже для одного input
-            embeddings = data.get("embeddings")
-            if not (isinstance(embeddings, list) and embeddings and isinstance(embeddings[0], list)):
-                raise ValueError("No 'embeddings'[[...]] in response")
-            vec = embeddings[0]
-            # log.debug(f"Received embedding of length {len(vec)}")
-            return vec
-        except httpx.HTTPError as exc:
-            log.exception(f"HTTP error during embedding request to {url}: {exc}")
-            return None
\ No newline at end of file
+    try:
+        # log.debug(f"Requesting embedding: model={settings.embedding_model}")
+        resp = await ollama.post("/api/embed", "embed", json=payload)
+        data = resp.json()
+        # /api/embed возвращает "embeddings": [[...]] даже для одного input
+        embeddings = data.get("embeddings")
+        if not (isinstance(embeddings, list) and embeddings and isinstance(embeddings[0], list)):
+            raise ValueError("No 'embeddings'[[...]] in response")
+        vec = embeddings[0]
+        # log.debug(f"Received embedding of length {len(vec)}")
+        return vec
+    except httpx.HTTPError as exc:
+        log.exception(f"HTTP error during embedding request to {ollama.url('/api/embed')}: {exc}")
+        return None
+
+
+# ─────────────────────────────────────────
+# Батчи: /api/embed принимает список input
+# ─────────────────────────────────────────
+def _batches(texts: Sequence[str], max_items: int, max_chars: int) -> Iterator[List[int]]:
+    """Индексы texts группами: не больше max_items штук и max_chars символов (длинный текст — один в батче)."""
+    batch: List[int] = []
+    chars = 0
+    for i, text in enumerate(texts):
+        if batch and (len(batch) >= max_items or chars + len(text) > max_chars):
+            yield batch
+            batch, chars = [], 0
+        batch.append(i)
+        chars += len(text)
+    if batch:
+        yield batch
+
+
+async def _post_batch(texts: List[str]) -> List[Optional[List[float]]]:
+    """
+    Один запрос на батч. При отказе Ollama (HTTP-статус) или неполном ответе батч
+    делится пополам и повторяется — так один «плохой» текст не роняет остальные;
+    для него вернётся None. Сетевые ошибки и таймауты не делим: повтор половинами
+    только умножил бы запросы к недоступному серверу — None для всего батча.
+    """
+    payload = {"model": settings.embedding_model, "input": texts}
+    try:
+        resp = await ollama.post("/api/embed", "embed", json=payload)
+        embeddings = resp.json().get("embeddings")
+        if not (isinstance(embeddings, list) and len(embeddings) == len(texts)
+                and all(isinstance(v, list) and v for v in embeddings)):
+            raise ValueError(f"Expected {len(texts)} embeddings in response")
+        return embeddings
+    except httpx.TransportError as exc:
+        log.error(f"Embedding request for a batch of {len(texts)} failed: {exc!r}")
+        return [None] * len(texts)
+    except (httpx.HTTPStatusError, ValueError) as exc:
+        if len(texts) == 1:
+            log.error(f"Embedding request failed for a single text ({len(texts[0])} chars): {exc}")
+            return [None]
+        log.warning(f"Embedding batch of {len(texts)} failed ({exc}) — splitting")
+        mid = len(texts) // 2
+        return await _post_batch(texts[:mid]) + await _post_batch(texts[mid:])
+
+
+async def embed_texts(texts: Sequence[str]) -> List[Optional[List[float]]]:
+    """
+    Эмбеддинги для списка текстов батчами (EMBED_BATCH_MAX_ITEMS / EMBED_BATCH_MAX_CHARS).
+    Результат — в порядке texts; None для пустых и не получившихся.
+    """
+    out: List[Optional[List[float]]] = [None] * len(texts)
+    todo = [i for i, t in enumerate(texts) if t]
+    if not todo:
+        return out
+    max_items = max(1, int(settings.embed_batch_max_items))
+    max_chars = max(1, int(settings.embed_batch_max_chars))
+    requests = 0
+    for batch in _batches([texts[i] for i in todo], max_items, max_chars):
+        vecs = await _post_batch([texts[todo[j]] for j in batch])
+        for j, vec in zip(batch, vecs):
+            out[todo[j]] = vec
+        requests += 1
+    log.debug(f"Embedded {len(todo)} texts in {requests} batches")
+    return out
@@ -0,0 +1,160 @@
+# app/services/pipeline/executor.py
+"""
+Исполнитель для CPU/GPU-инференса (Whisper, pyannote, webrtcvad).
+
+Всё тяжёлое уходит из event loop в выделенные пулы:
+  - kind="thread"  → ThreadPoolExecutor(INFERENCE_THREADS): модели в памяти процесса;
+  - kind="process" → ProcessPoolExecutor(INFERENCE_PROCESSES): чистые функции
+    над numpy/bytes (без моделей). При INFERENCE_PROCESSES=0 — тот же thread-пул.
+
+Backpressure: не больше INFERENCE_MAX_PENDING задач в работе+очереди,
+остальные корутины ждут слот, не раздувая очередь пула.
+"""
+from __future__ import annotations
+
+import asyncio
+import functools
+import multiprocessing as mp
+import threading
+import time
+import weakref
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+from app.core.config import settings
+from app.core.logger import get_logger
+
+log = get_logger(__name__)
+
+T = TypeVar("T")
+
+_thread_pool: Optional[ThreadPoolExecutor] = None
+_process_pool: Optional[ProcessPoolExecutor] = None
+_pools_lock = threading.Lock()
+
+# asyncio.Semaphore привязывается к loop — держим по одному на loop
+_slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+_metrics_lock = threading.Lock()
+_metrics: Dict[str, Any] = {
+    "submitted": 0,
+    "completed": 0,
+    "failed": 0,
+    "waiting": 0,           # ждут слот (backpressure)
+    "running": 0,           # отданы в пул
+    "max_queue_depth": 0,   # пик waiting + running
+    "busy_sec": 0.0,        # суммарное время выполнения
+    "by_name": {},          # name → {"calls", "busy_sec"}
+}
+
+
+def _threads() -> int:
+    return max(1, int(getattr(settings, "inference_threads", 2) or 1))
+
+
+def _processes() -> int:
+    return max(0, int(getattr(settings, "inference_processes", 0) or 0))
+
+
+def process_workers() -> int:
+    """Размер пула процессов (INFERENCE_PROCESSES); 0 — kind="process" уходит в пул потоков."""
+    return _processes()
+
+
+def _max_pending() -> int:
+    return max(1, int(getattr(settings, "inference_max_pending", 64) or 1))
+
+
+def _get_pool(kind: str) -> Executor:
+    global _thread_pool, _process_pool
+    with _pools_lock:
+        if kind == "process" and _processes() > 0:
+            if _process_pool is None:
+                # spawn: CUDA/CTranslate2 не переживают fork
+                _process_pool = ProcessPoolExecutor(max_workers=_processes(), mp_context=mp.get_context("spawn"))
+                log.info("Inference process pool started: workers=%d", _processes())
+            return _process_pool
+        if _thread_pool is None:
+            _thread_pool = ThreadPoolExecutor(max_workers=_threads(), thread_name_prefix="inference")
+            log.info("Inference thread pool started: workers=%d", _threads())
+        return _thread_pool
+
+
+def _get_slots(loop: asyncio.AbstractEventLoop) -> asyncio.Semaphore:
+    sem = _slots.get(loop)
+    if sem is None:
+        sem = asyncio.Semaphore(_max_pending())
+        _slots[loop] = sem
+    return sem
+
+
+def _update(**delta: Any) -> None:
+    with _metrics_lock:
+        for k, v in delta.items():
+            _metrics[k] += v
+        depth = _metrics["waiting"] + _metrics["running"]
+        if depth > _metrics["max_queue_depth"]:
+            _metrics["max_queue_depth"] = depth
+
+
+def _account(name: str, elapsed: float, ok: bool) -> None:
+    with _metrics_lock:
+        _metrics["busy_sec"] += elapsed
+        _metrics["completed" if ok else "failed"] += 1
+        per = _metrics["by_name"].setdefault(name, {"calls": 0, "busy_sec": 0.0})
+        per["calls"] += 1
+        per["busy_sec"] += elapsed
+
+
+async def run_inference(
+    fn: Callable[..., T],
+    *args: Any,
+    kind: str = "thread",
+    name: Optional[str] = None,
+    **kwargs: Any,
+) -> T:
+    """
+    Выполнить блокирующий fn(*args, **kwargs) в пуле инференса и дождаться результата.
+    Для kind="process" fn и аргументы должны пикаться (функции уровня модуля).
+    """
+    loop = asyncio.get_running_loop()
+    label = name or getattr(fn, "__name__", "call")
+    sem = _get_slots(loop)
+
+    _update(submitted=1, waiting=1)
+    await sem.acquire()
+    _update(waiting=-1, running=1)
+    t0 = time.monotonic()
+    ok = False
+    try:
+        result = await loop.run_in_executor(_get_pool(kind), functools.partial(fn, *args, **kwargs))
+        ok = True
+        return result
+    finally:
+        sem.release()
+        _update(running=-1)
+        _account(label, time.monotonic() - t0, ok)
+
+
+def stats() -> Dict[str, Any]:
+    """Снимок метрик для health/логов."""
+    with _metrics_lock:
+        snap = dict(_metrics)
+        snap["by_name"] = {k: dict(v) for k, v in _metrics["by_name"].items()}
+    snap["busy_sec"] = round(snap["busy_sec"], 3)
+    snap["threads"] = _threads()
+    snap["processes"] = _processes()
+    snap["max_pending"] = _max_pending()
+    return snap
+
+
+def shutdown() -> None:
+    global _thread_pool, _process_pool
+    with _pools_lock:
+        if _thread_pool is not None:
+            _thread_pool.shutdown(wait=False, cancel_futures=True)
+            _thread_pool = None
+        if _process_pool is not None:
+            _process_pool.shutdown(wait=False, cancel_futures=True)
+            _process_pool = None
+    log.info("Inference pools stopped")
@@ -0,0 +1,275 @@
+# app/services/pipeline/ffmpeg.py
+"""
+Запуск ffmpeg/ffprobe: сборка команд по профилям, ограничение параллелизма, метрики.
+
+Профили (FFMPEG_PROFILE):
+  - fast    — короткий анализ контейнера (FFMPEG_PROBESIZE / FFMPEG_ANALYZEDURATION),
+              штатный ресемплер swr;
+  - quality — полный анализ контейнера, swr с длинным фильтром;
+  - soxr    — как fast, но ресемплер soxr (FFMPEG_USE_SOXR=true включает его и в fast).
+Потоки: FFMPEG_THREADS (декодер) и FFMPEG_FILTER_THREADS (фильтры).
+
+Не больше FFMPEG_MAX_CONCURRENT транскодов одновременно на процесс: async-запуски
+и run_sync (потоки пула) делят один семафор, остальные ждут слот, не отнимая CPU у ASR. На каждый запуск пишутся ожидание слота, время и CPU
+(utime+stime дочерних процессов: при параллельных запусках — приблизительно).
+"""
+from __future__ import annotations
+
+import asyncio
+import resource
+import shlex
+import subprocess
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from app.core.config import settings
+from app.core.logger import get_logger
+
+log = get_logger(__name__)
+
+PROFILES = ("fast", "quality", "soxr")
+SAMPLE_RATE = 16000
+
+# ожидание слота из event loop — опросом: поток, заблокированный в acquire, не снять при отмене
+_SLOT_POLL_SEC = 0.05
+
+# один семафор на процесс для всех loop и потоков
+_slots: Optional[threading.BoundedSemaphore] = None
+_slots_lock = threading.Lock()
+
+_metrics_lock = threading.Lock()
+_metrics: Dict[str, Any] = {
+    "runs": 0,
+    "failed": 0,
+    "waiting": 0,
+    "running": 0,
+    "max_running": 0,
+    "wait_sec": 0.0,
+    "wall_sec": 0.0,
+    "cpu_sec": 0.0,
+    "by_name": {},  # name → {"runs", "wall_sec", "cpu_sec"}
+}
+
+
+def _max_concurrent() -> int:
+    return max(1, int(getattr(settings, "ffmpeg_max_concurrent", 2) or 1))
+
+
+def profile_name(profile: Optional[str] = None) -> str:
+    name = profile or str(getattr(settings, "ffmpeg_profile", "fast") or "fast")
+    if name not in PROFILES:
+        raise ValueError(f"Unknown ffmpeg profile: {name}")
+    if name == "fast" and bool(getattr(settings, "ffmpeg_use_soxr", False)):
+        return "soxr"
+    return name
+
+
+# ─────────────────────────────────────────
+# Сборка команд
+# ─────────────────────────────────────────
+def _input_opts(profile: str, threads: Optional[int]) -> List[str]:
+    opts: List[str] = []
+    n = int(threads if threads is not None else getattr(settings, "ffmpeg_threads", 0) or 0)
+    if n > 0:
+        opts += ["-threads", str(n)]
+    fn = int(getattr(settings, "ffmpeg_filter_threads", 0) or 0)
+    if fn > 0:
+        opts += ["-filter_threads", str(fn)]
+    if profile != "quality":
+        probesize = str(getattr(settings, "ffmpeg_probesize", "") or "")
+        analyze = str(getattr(settings, "ffmpeg_analyzeduration", "") or "")
+        if probesize:
+            opts += ["-probesize", probesize]
+        if analyze:
+            opts += ["-analyzeduration", analyze]
+    return opts
+
+
+def _resample_opts(profile: str) -> List[str]:
+    if profile == "soxr":
+        return ["-af", f"aresample={SAMPLE_RATE}:resampler=soxr:precision=20"]
+    if profile == "quality":
+        return ["-af", f"aresample={SAMPLE_RATE}:filter_size=64:phase_shift=10:cutoff=0.97"]
+    return []
+
+
+def build_pcm_cmd(
+    src_path: str,
+    dst: str,
+    fmt: str = "wav",
+    profile: Optional[str] = None,
+    threads: Optional[int] = None,
+) -> List[str]:
+    """
+    ffmpeg: первая аудиодорожка src → mono 16k s16le.
+    fmt="wav" — файл dst; fmt="s16le" — raw PCM (dst="-" → stdout); fmt="flac" — FLAC без потерь.
+    """
+    prof = profile_name(profile)
+    return [
+        "ffmpeg", "-nostdin", "-y", "-hide_banner", "-loglevel", "error",
+        *_input_opts(prof, threads),
+        "-i", str(src_path),
+        "-map", "a:0",
+        "-vn", "-sn", "-dn",
+        *_resample_opts(prof),
+        "-ac", "1",
+        "-ar", str(SAMPLE_RATE),
+        "-sample_fmt", "s16",
+        "-acodec", "flac" if fmt == "flac" else "pcm_s16le",
+        "-f", fmt,
+        str(dst),
+    ]
+
+
+def build_probe_cmd(path: str, entries: str = "stream=codec_name,channels,sample_rate") -> List[str]:
+    probesize = str(getattr(settings, "ffmpeg_probesize", "") or "")
+    analyze = str(getattr(settings, "ffmpeg_analyzeduration", "") or "")
+    cmd = ["ffprobe", "-v", "error"]
+    if probesize:
+        cmd += ["-probesize", probesize]
+    if analyze:
+        cmd += ["-analyzeduration", analyze]
+    return cmd + [
+        "-select_streams", "a:0",
+        "-show_entries", entries,
+        "-of", "json", str(path),
+    ]
+
+
+# ─────────────────────────────────────────
+# Запуск
+# ─────────────────────────────────────────
+def _get_slots() -> threading.BoundedSemaphore:
+    global _slots
+    with _slots_lock:
+        if _slots is None:
+            _slots = threading.BoundedSemaphore(_max_concurrent())
+        return _slots
+
+
+async def _acquire(sem: threading.BoundedSemaphore) -> None:
+    while not sem.acquire(blocking=False):
+        await asyncio.sleep(_SLOT_POLL_SEC)
+
+
+def _children_cpu() -> float:
+    ru = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return ru.ru_utime + ru.ru_stime
+
+
+def _update(**delta: Any) -> None:
+    with _metrics_lock:
+        for k, v in delta.items():
+            _metrics[k] += v
+        if _metrics["running"] > _metrics["max_running"]:
+            _metrics["max_running"] = _metrics["running"]
+
+
+def _account(name: str, wait: float, wall: float, cpu: float, ok: bool) -> None:
+    with _metrics_lock:
+        _metrics["runs"] += 1
+        _metrics["failed"] += 0 if ok else 1
+        _metrics["wait_sec"] += wait
+        _metrics["wall_sec"] += wall
+        _metrics["cpu_sec"] += cpu
+        per = _metrics["by_name"].setdefault(name, {"runs": 0, "wall_sec": 0.0, "cpu_sec": 0.0})
+        per["runs"] += 1
+        per["wall_sec"] += wall
+        per["cpu_sec"] += cpu
+    log.info("ffmpeg[%s] %s: wait=%.2fs wall=%.2fs cpu=%.2fs",
+             name, "ok" if ok else "failed", wait, wall, cpu)
+
+
+@asynccontextmanager
+async def spawn(
+    cmd: List[str],
+    name: str,
+    limit: bool = True,
+    nice: int = 0,
+) -> AsyncIterator[asyncio.subprocess.Process]:
+    """
+    Запустить процесс (stdout/stderr — PIPE) под слотом FFMPEG_MAX_CONCURRENT.
+    Слот держится, пока открыт контекст: потоковое чтение stdout тоже считается транскодом.
+    nice > 0 — фоновые задачи: запуск через `nice -n`, планировщик ОС отдаёт CPU сначала джобам.
+    """
+    sem = _get_slots() if limit else None
+    t_wait = time.monotonic()
+    if sem is not None:
+        _update(waiting=1)
+        try:
+            await _acquire(sem)
+        finally:
+            _update(waiting=-1)
+    wait = time.monotonic() - t_wait
+    _update(running=1)
+    if nice > 0:
+        cmd = ["nice", "-n", str(nice), *cmd]
+    log.debug("ffmpeg[%s] → %s", name, " ".join(shlex.quote(x) for x in cmd))
+    cpu0, t0 = _children_cpu(), time.monotonic()
+    ok = False
+    proc = None
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+        )
+        yield proc
+        ok = proc.returncode == 0
+    finally:
+        if proc is not None and proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+        _update(running=-1)
+        if sem is not None:
+            sem.release()
+        _account(name, wait, time.monotonic() - t0, max(0.0, _children_cpu() - cpu0), ok)
+
+
+async def run(cmd: List[str], name: str, limit: bool = True, nice: int = 0) -> bytes:
+    """Запустить и дождаться завершения; вернуть stdout, при rc != 0 — RuntimeError с stderr."""
+    async with spawn(cmd, name, limit=limit, nice=nice) as proc:
+        out, err = await proc.communicate()
+    if proc.returncode != 0:
+        msg = err.decode("utf-8", "ignore").strip()
+        log.error("%s failed rc=%s err=%s", cmd[0], proc.returncode, msg)
+        raise RuntimeError(f"{cmd[0]} {name} failed: {msg}")
+    return out
+
+
+@contextmanager
+def _sync_slot() -> Iterator[float]:
+    sem = _get_slots()
+    t_wait = time.monotonic()
+    with sem:
+        yield time.monotonic() - t_wait
+
+
+def run_sync(cmd: List[str], name: str) -> bytes:
+    """Блокирующий вариант run (потоки/процессы пула): тот же семафор, что у run/spawn."""
+    with _sync_slot() as wait:
+        _update(running=1)
+        cpu0, t0 = _children_cpu(), time.monotonic()
+        ok = False
+        try:
+            proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            ok = proc.returncode == 0
+        finally:
+            _update(running=-1)
+            _account(name, wait, time.monotonic() - t0, max(0.0, _children_cpu() - cpu0), ok)
+    if not ok:
+        msg = proc.stderr.decode("utf-8", "ignore").strip()
+        raise RuntimeError(f"{cmd[0]} {name} failed: {msg}")
+    return proc.stdout
+
+
+def stats() -> Dict[str, Any]:
+    with _metrics_lock:
+        snap = {k: (round(v, 3) if isinstance(v, float) else v) for k, v in _metrics.items() if k != "by_name"}
+        snap["by_name"] = {
+            n: {k: (round(v, 3) if isinstance(v, float) else v) for k, v in per.items()}
+            for n, per in _metrics["by_name"].items()
+        }
+    snap["profile"] = profile_name()
+    snap["max_concurrent"] = _max_concurrent()
+    return snap
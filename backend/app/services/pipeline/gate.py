@@ -0,0 +1,113 @@
+# app/services/pipeline/gate.py
+"""
+Пред-гейт тишины/не-речи перед Whisper (режимы fixed и full).
+
+По PCM окна считаем покадрово (25 мс) RMS в dBFS и спектральную плоскостность
+(geo_mean / arith_mean спектра мощности). Кадр «речевой», если он громче
+ASR_GATE_RMS_DB и его спектр не плоский (плоскостность < ASR_GATE_FLATNESS_MAX:
+шум и тишина дают ~1, голос — заметно меньше). Окна с долей речевых кадров ниже
+ASR_GATE_MIN_SPEECH_RATIO в Whisper не отправляются, у остальных срезаются
+тишина в начале и в конце (с запасом ASR_GATE_TRIM_PAD_SEC).
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.pipeline import pcm
+
+FRAME_SEC = 0.025
+# кадров в одном FFT-блоке: ограничивает память для длинных окон (режим full)
+_BLOCK_FRAMES = 4096
+_EPS = 1e-10
+
+
+@dataclass
+class GateDecision:
+    window: Optional[Tuple[float, float]]  # окно для ASR; None — пропустить
+    reason: Optional[str] = None           # "silence" | "non_speech" | "trimmed" | None
+    speech_ratio: float = 0.0
+
+
+def modes() -> List[str]:
+    raw = getattr(settings, "asr_gate_modes", "") or ""
+    return [m.strip() for m in raw.split(",") if m.strip()]
+
+
+def enabled_for(mode: Optional[str]) -> bool:
+    return bool(mode) and mode in modes()
+
+
+def frame_features(samples: np.ndarray, frame_len: int) -> Tuple[np.ndarray, np.ndarray]:
+    """int16/float PCM → (rms_db[n_frames], flatness[n_frames]); хвост короче кадра отбрасывается."""
+    n = samples.shape[0] // frame_len
+    rms_db = np.empty((n,), np.float32)
+    flat = np.empty((n,), np.float32)
+    if n == 0:
+        return rms_db, flat
+
+    win = np.hanning(frame_len).astype(np.float32)
+    scale = 1.0 / 32768.0 if samples.dtype == np.int16 else 1.0
+    # блоками: в float32 поднимается не больше _BLOCK_FRAMES кадров (окно full — весь файл)
+    for a in range(0, n, _BLOCK_FRAMES):
+        b = min(n, a + _BLOCK_FRAMES)
+        x = np.asarray(samples[a * frame_len: b * frame_len], dtype=np.float32).reshape(b - a, frame_len) * scale
+        rms_db[a:b] = 10.0 * np.log10(np.mean(x * x, axis=1) + _EPS)
+        p = np.abs(np.fft.rfft(x * win, axis=1)) ** 2 + _EPS
+        flat[a:b] = np.exp(np.mean(np.log(p), axis=1)) / np.mean(p, axis=1)
+    return rms_db, flat
+
+
+def decide(samples: np.ndarray, start: float, end: float, sample_rate: int = pcm.SAMPLE_RATE) -> GateDecision:
+    rms_db_min = float(getattr(settings, "asr_gate_rms_db", -45.0))
+    flat_max = float(getattr(settings, "asr_gate_flatness_max", 0.6))
+    min_ratio = float(getattr(settings, "asr_gate_min_speech_ratio", 0.05))
+    pad = float(getattr(settings, "asr_gate_trim_pad_sec", 0.25))
+
+    frame_len = int(sample_rate * FRAME_SEC)
+    rms_db, flat = frame_features(samples, frame_len)
+    if rms_db.size == 0:
+        return GateDecision(window=(start, end))
+
+    loud = rms_db > rms_db_min
+    speech = loud & (flat < flat_max)
+    ratio = float(speech.mean())
+    if ratio < min_ratio:
+        reason = "silence" if float(loud.mean()) < min_ratio else "non_speech"
+        return GateDecision(window=None, reason=reason, speech_ratio=ratio)
+
+    idx = np.flatnonzero(speech)
+    new_start = max(start, start + idx[0] * FRAME_SEC - pad)
+    new_end = min(end, start + (idx[-1] + 1) * FRAME_SEC + pad)
+    if (new_start - start) + (end - new_end) < 2 * pad:
+        return GateDecision(window=(start, end), speech_ratio=ratio)
+    return GateDecision(window=(new_start, new_end), reason="trimmed", speech_ratio=ratio)
+
+
+def gate_windows(wav_path: str, windows: Sequence[Tuple[float, float]]) -> List[GateDecision]:
+    """Решения гейта для окон одного файла (блокирующая: звать через run_inference)."""
+    with pcm.open_pcm(wav_path) as store:
+        return [decide(store.window_int16(s, e), s, e, store.sample_rate) for s, e in windows]
+
+
+def summarize(decisions: Sequence[GateDecision], windows: Sequence[Tuple[float, float]]) -> Dict[str, object]:
+    """Сводка для stats пайплайна: сколько окон пропущено/обрезано и почему."""
+    reasons: Dict[str, int] = {}
+    skipped_sec = trimmed_sec = 0.0
+    for d, (s, e) in zip(decisions, windows):
+        if d.reason:
+            reasons[d.reason] = reasons.get(d.reason, 0) + 1
+        if d.window is None:
+            skipped_sec += e - s
+        elif d.reason == "trimmed":
+            trimmed_sec += (e - s) - (d.window[1] - d.window[0])
+    return {
+        "skipped": sum(1 for d in decisions if d.window is None),
+        "trimmed": reasons.get("trimmed", 0),
+        "reasons": reasons,
+        "skipped_sec": round(skipped_sec, 2),
+        "trimmed_sec": round(trimmed_sec, 2),
+    }
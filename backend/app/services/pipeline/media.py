@@ -1,33 +1,28 @@
 from __future__ import annotations
-import asyncio
 import json
 import shlex
 import time
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import AsyncIterator, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
 from app.core.logger import get_logger
+from app.services.pipeline import ffmpeg, media_cache, media_meta, pcm
 
 log = get_logger(__name__)
 
+_LOW_PRIORITY_NICE = 19
+
 async def probe_audio(path: str) -> Tuple[Optional[str], Optional[int], Optional[int]]:
     """
     Вернёт (codec_name, channels, sample_rate) первой аудиодорожки, либо (None, None, None) при ошибке.
     """
-    cmd = [
-        "ffprobe", "-v", "error",
-        "-select_streams", "a:0",
-        "-show_entries", "stream=codec_name,channels,sample_rate",
-        "-of", "json", path
-    ]
     try:
         t0 = time.monotonic()
-        proc = await asyncio.create_subprocess_exec(
-            *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
-        )
-        out, err = await proc.communicate()
-        if proc.returncode != 0:
-            log.warning("ffprobe failed rc=%s err=%s", proc.returncode, err.decode("utf-8", "ignore"))
-            return None, None, None
+        # ffprobe лёгкий: слот транскода не занимает
+        out = await ffmpeg.run(ffmpeg.build_probe_cmd(path), name="probe", limit=False)
         data = json.loads(out.decode("utf-8"))
         stream = (data.get("streams") or [None])[0] or {}
         codec = stream.get("codec_name")
@@ -40,16 +35,40 @@ async def probe_audio(path: str) -> Tuple[Optional[str], Optional[int], Optional
         return None, None, None
 
 
-async def convert_to_wav16k_mono(src_path: str, dst_path: Optional[str] = None, threads: int = 0) -> str:
+async def convert_to_wav16k_mono(
+    src_path: str,
+    dst_path: Optional[str] = None,
+    threads: int = 0,
+    low_priority: bool = False,
+) -> str:
     """
-    Конвертирует любой вход в WAV 16k mono PCM s16le.
-    Возвращает путь к dst WAV. Если вход уже нужного формата — просто возвращает src_path.
+    Конвертирует любой вход в 16k mono s16: WAV, FLAC или raw .pcm с сайдкаром —
+    по расширению dst_path, без него — по DERIVED_AUDIO_FORMAT (см. pcm).
+    Возвращает путь к dst. Если вход уже WAV 16k mono — просто возвращает src_path.
+    Без dst_path сначала смотрим готовый результат предварительного транскода
+    (mfg_file.derived_path), затем контентный кэш (см. media_cache).
+    low_priority — фоновый транскод после загрузки (nice, см. pretranscode).
     """
+    if dst_path is None:
+        derived = await media_meta.derived_path(src_path)
+        if derived is not None:
+            log.info("Using pre-transcoded audio: %s → %s", src_path, derived)
+            return derived
+    if dst_path is None and media_cache.enabled():
+        return await media_cache.normalized(
+            src_path, lambda tmp: _convert(src_path, tmp, threads, low_priority), low_priority=low_priority,
+        )
     src = Path(src_path)
-    dst = Path(dst_path) if dst_path else (src.with_suffix("").with_name(src.stem + "_16k_mono").with_suffix(".wav"))
+    dst = Path(dst_path) if dst_path else (src.with_suffix("").with_name(src.stem + "_16k_mono").with_suffix(pcm.derived_suffix()))
+    return await _convert(src_path, str(dst), threads, low_priority)
+
+
+async def _convert(src_path: str, dst_path: str, threads: int = 0, low_priority: bool = False) -> str:
+    src, dst = Path(src_path), Path(dst_path)
     dst.parent.mkdir(parents=True, exist_ok=True)
 
-    codec, ch, sr = await probe_audio(str(src))
+    # метаданные сняты при загрузке (mfg_file) — ffprobe повторно не гоняем
+    codec, ch, sr = await media_meta.audio_info(str(src))
     # пропускаем конверт, если уже WAV s16le/mono/16k
     if codec == "pcm_s16le" and ch == 1 and sr == 16000 and src.suffix.lower() == ".wav":
         if dst != src:
@@ -57,35 +76,73 @@ async def convert_to_wav16k_mono(src_path: str, dst_path: Optional[str] = None,
             log.info("Audio already wav/16k/mono — skip convert: %s", src)
             return str(src)
 
-    # быстрый ffmpeg-конверт
-    # важные флаги:
-    # -nostdin -hide_banner -loglevel error : тише и быстрее
-    # -vn -sn -dn : отбросить видео/саб/данные
-    # -ac 1 -ar 16000 -sample_fmt s16 : целевой формат
-    # -map a:0 : берём первую аудиодорожку
-    # -threads N : при желании указать
-    cmd = [
-        "ffmpeg", "-nostdin", "-y", "-hide_banner", "-loglevel", "error",
-        "-i", str(src),
-        "-map", "a:0",
-        "-vn", "-sn", "-dn",
-        "-ac", "1",
-        "-ar", "16000",
-        "-sample_fmt", "s16",
-        "-acodec", "pcm_s16le",
-        str(dst),
-    ]
-    if threads and threads > 0:
-        cmd.insert(1, "-threads"); cmd.insert(2, str(threads))
-
+    # команда — по профилю FFMPEG_PROFILE (см. ffmpeg.build_pcm_cmd)
+    fmt = pcm.format_of(str(dst))
+    cmd = ffmpeg.build_pcm_cmd(str(src), str(dst), fmt="s16le" if fmt == "pcm" else fmt, threads=threads or None)
     log.info("ffmpeg convert → %s", " ".join(shlex.quote(x) for x in cmd))
     t0 = time.monotonic()
-    proc = await asyncio.create_subprocess_exec(
-        *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
-    )
-    _, err = await proc.communicate()
-    if proc.returncode != 0:
-        log.error("ffmpeg failed rc=%s err=%s", proc.returncode, err.decode("utf-8", "ignore"))
-        raise RuntimeError("ffmpeg convert failed")
+    if low_priority:
+        await ffmpeg.run(cmd, name="pretranscode", nice=_LOW_PRIORITY_NICE)
+    else:
+        await ffmpeg.run(cmd, name="convert")
+    if fmt == "pcm":
+        pcm.write_sidecar(str(dst))
     log.info("ffmpeg convert done in %.2fs → %s", time.monotonic() - t0, dst)
     return str(dst)
+
+
+# ─────────────────────────────────────────
+# Декодирование ffmpeg → NumPy без промежуточного WAV
+# ─────────────────────────────────────────
+_PIPE_READ_BYTES = 1 << 20
+
+
+def decode_path() -> str:
+    """AUDIO_DECODE_PATH: wav — WAV 16k на диске (memmap, кэш); pipe — s16le из stdout ffmpeg в память."""
+    return str(getattr(settings, "audio_decode_path", "wav") or "wav")
+
+
+def pcm_decode_cmd(src_path: str, threads: int = 0) -> List[str]:
+    """ffmpeg: первая аудиодорожка → raw s16le mono 16k в stdout."""
+    return ffmpeg.build_pcm_cmd(src_path, "-", fmt="s16le", threads=threads or None)
+
+
+async def _iter_decoded_bytes(src_path: str, threads: int = 0, block: int = _PIPE_READ_BYTES) -> AsyncIterator[bytes]:
+    async with ffmpeg.spawn(pcm_decode_cmd(src_path, threads), name="decode") as proc:
+        while data := await proc.stdout.read(block):
+            yield data
+        err = await proc.stderr.read()
+        if await proc.wait() != 0:
+            log.error("ffmpeg decode failed rc=%s err=%s", proc.returncode, err.decode("utf-8", "ignore"))
+            raise RuntimeError("ffmpeg decode failed")
+
+
+async def decode_to_pcm(src_path: str, threads: int = 0) -> np.ndarray:
+    """Весь исходник → int16 mono 16k в памяти; байты ffmpeg копятся в один буфер без промежуточных массивов."""
+    buf = bytearray()
+    async for data in _iter_decoded_bytes(src_path, threads):
+        buf += data
+    del buf[len(buf) - len(buf) % 2:]
+    return np.frombuffer(buf, dtype="<i2")
+
+
+async def prepare_pcm(src_path: str, threads: int = 0) -> str:
+    """
+    Путь, по которому шаги пайплайна читают PCM через pcm.open_pcm:
+      - wav  → convert_to_wav16k_mono (WAV 16k на диске, memmap);
+      - pipe → исходник декодируется ffmpeg в память и кладётся в реестр pcm
+               под своим путём; VAD/fixed/диаризация/ASR джобы берут его оттуда.
+    """
+    if decode_path() != "pipe":
+        return await convert_to_wav16k_mono(src_path, threads=threads)
+    if pcm.is_open(src_path):
+        return src_path
+    derived = await media_meta.derived_path(src_path)
+    if derived is not None:
+        return derived  # memmap готового WAV дешевле повторного декодирования
+    t0 = time.monotonic()
+    samples = await decode_to_pcm(src_path, threads=threads)
+    pcm.register(src_path, samples)
+    log.info("ffmpeg pipe decode done in %.2fs: %.1fs audio (%.1f MB) ← %s",
+             time.monotonic() - t0, samples.shape[0] / pcm.SAMPLE_RATE, samples.nbytes / 1e6, src_path)
+    return src_path
@@ -0,0 +1,217 @@
+# app/services/pipeline/media_cache.py
+"""
+Контентный кэш нормализованного аудио (16k mono s16; wav/flac/pcm — DERIVED_AUDIO_FORMAT).
+
+Ключ — sha256 содержимого исходника: один и тот же файл в режимах
+diarize/vad/fixed/full и при повторных прогонах конвертируется один раз,
+ffprobe/ffmpeg на попадании не запускаются. Запись атомарная (tmp → os.replace),
+параллельные запросы одного ключа ждут одну конвертацию (in-flight lock).
+Исключение — фоновый транскод с nice (low_priority): джоба его не ждёт, а
+конвертирует сама с обычным приоритетом, иначе она простаивала бы за процессом,
+которому ОС почти не даёт CPU. Результат тот же, os.replace атомарен.
+Размер каталога ограничен MEDIA_CACHE_MAX_BYTES: сверх квоты удаляются файлы
+с самым старым mtime (mtime обновляется на каждом попадании — LRU), кроме
+использованных за последние MEDIA_CACHE_MIN_IDLE_SEC: на них ещё могут ссылаться
+чанки текущих джоб. Вытесненный файл, на который остались ссылки (mfg_diarization.file_path,
+mfg_file.derived_path), готовится заново из исходника: compose._ensure_pcm и
+media_meta.derived_path проверяют наличие файла на диске.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.core.logger import get_logger
+from app.services.pipeline import pcm
+
+log = get_logger(__name__)
+
+_HASH_BLOCK = 1 << 20
+
+# (path, size, mtime_ns) → sha256: шаги одной джобы не хэшируют исходник повторно
+_digests: Dict[Tuple[str, int, int], str] = {}
+# ключи, содержимое которых уже WAV 16k mono: кэшировать нечего, отдаём сам исходник
+_passthrough: Set[str] = set()
+_inflight: Dict[str, asyncio.Lock] = {}
+# ключи, которые сейчас конвертирует фоновый транскод (low_priority)
+_background: Set[str] = set()
+
+_metrics_lock = threading.Lock()
+_metrics: Dict[str, int] = {"hits": 0, "misses": 0, "passthrough": 0, "evicted": 0, "evicted_bytes": 0}
+
+
+def enabled() -> bool:
+    return bool(getattr(settings, "media_cache_enabled", True))
+
+
+def cache_dir() -> Path:
+    return Path(getattr(settings, "media_cache_dir", "/data/media_cache"))
+
+
+def _max_bytes() -> int:
+    return max(0, int(getattr(settings, "media_cache_max_bytes", 0) or 0))
+
+
+def _min_idle_sec() -> float:
+    return max(0.0, float(getattr(settings, "media_cache_min_idle_sec", 3600) or 0))
+
+
+def _count(**delta: int) -> None:
+    with _metrics_lock:
+        for k, v in delta.items():
+            _metrics[k] += v
+
+
+def _file_digest(path: str) -> str:
+    st = os.stat(path)
+    memo = (path, st.st_size, st.st_mtime_ns)
+    digest = _digests.get(memo)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            while block := f.read(_HASH_BLOCK):
+                h.update(block)
+        digest = h.hexdigest()
+        if len(_digests) >= 4096:
+            _digests.clear()
+        _digests[memo] = digest
+    return digest
+
+
+async def normalized(
+    src_path: str,
+    convert: Callable[[str], Awaitable[Optional[str]]],
+    low_priority: bool = False,
+) -> str:
+    """
+    Путь к WAV 16k mono для src_path из кэша; на промахе convert(tmp_dst) пишет файл во
+    временный путь. convert может вернуть исходный путь (вход уже нужного формата) —
+    тогда в кэш ничего не кладём. low_priority — вызов из фонового транскода.
+    """
+    key = await asyncio.to_thread(_file_digest, src_path)
+    suffix = pcm.derived_suffix()
+    dst = cache_dir() / f"{key}{suffix}"
+
+    if not low_priority and key in _background:
+        hit = _hit(key, dst, src_path)
+        if hit is not None:
+            return hit
+        log.info("Media cache: %s is being pre-transcoded in background — convert without waiting", src_path)
+        return await _store(key, dst, src_path, convert)
+
+    lock = _inflight.setdefault(key, asyncio.Lock())
+    async with lock:
+        if low_priority:
+            _background.add(key)
+        try:
+            hit = _hit(key, dst, src_path)
+            if hit is not None:
+                return hit
+            return await _store(key, dst, src_path, convert)
+        finally:
+            _background.discard(key)
+            # ожидающие держат тот же lock и после захвата попадут в кэш через _hit
+            _inflight.pop(key, None)
+
+
+async def _store(
+    key: str,
+    dst: Path,
+    src_path: str,
+    convert: Callable[[str], Awaitable[Optional[str]]],
+) -> str:
+    _count(misses=1)
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dst.with_name(f".{key}.{uuid.uuid4().hex}.tmp{dst.suffix}")
+    try:
+        out = await convert(str(tmp))
+        if out is not None and Path(out) != tmp:
+            _passthrough.add(key)
+            _count(passthrough=1)
+            return out
+        if pcm.sidecar_path(str(tmp)).exists():
+            os.replace(pcm.sidecar_path(str(tmp)), pcm.sidecar_path(str(dst)))
+        os.replace(tmp, dst)  # данные последними: _hit видит файл только вместе с сайдкаром
+    finally:
+        tmp.unlink(missing_ok=True)
+        pcm.sidecar_path(str(tmp)).unlink(missing_ok=True)
+
+    log.info("Media cache: stored %s (%.1f MB) for %s", dst.name, _entry_size(dst) / 1e6, src_path)
+    await asyncio.to_thread(evict)
+    return str(dst)
+
+
+def _hit(key: str, dst: Path, src_path: str) -> Optional[str]:
+    if key in _passthrough:
+        _count(passthrough=1)
+        return src_path
+    if dst.exists():
+        os.utime(dst)  # LRU: mtime = последнее использование
+        _count(hits=1)
+        log.info("Media cache hit: %s → %s", src_path, dst.name)
+        return str(dst)
+    return None
+
+
+def _entry_size(p: Path) -> int:
+    """Размер записи кэша вместе с сайдкаром (.pcm)."""
+    side = pcm.sidecar_path(str(p))
+    return p.stat().st_size + (side.stat().st_size if side.exists() else 0)
+
+
+def evict() -> int:
+    """Удалить самые давно использованные файлы сверх MEDIA_CACHE_MAX_BYTES (блокирующая)."""
+    limit = _max_bytes()
+    root = cache_dir()
+    if limit <= 0 or not root.exists():
+        return 0
+    suffixes = set(pcm.DERIVED_FORMATS.values())
+    entries = []
+    for p in root.iterdir():
+        if p.name.startswith(".") or p.suffix not in suffixes:
+            continue  # незавершённые tmp и сайдкары
+        try:
+            entries.append((p.stat().st_mtime, _entry_size(p), p))
+        except FileNotFoundError:
+            continue
+    total = sum(size for _, size, _ in entries)
+    if total <= limit:
+        return 0
+
+    fresh_after = time.time() - _min_idle_sec()
+    removed = freed = 0
+    for mtime, size, p in sorted(entries, key=lambda e: e[0]):
+        if total <= limit:
+            break
+        if mtime >= fresh_after:
+            break  # дальше только свежие: на них могут ссылаться идущие джобы
+        try:
+            p.unlink()
+        except FileNotFoundError:
+            pass
+        pcm.sidecar_path(str(p)).unlink(missing_ok=True)
+        total -= size
+        removed += 1
+        freed += size
+    if removed:
+        _count(evicted=removed, evicted_bytes=freed)
+        log.info("Media cache: evicted %d files (%.1f MB), now %.1f MB (limit %.1f MB)",
+                 removed, freed / 1e6, total / 1e6, limit / 1e6)
+    return removed
+
+
+def stats() -> Dict[str, object]:
+    with _metrics_lock:
+        snap: Dict[str, object] = dict(_metrics)
+    total = int(snap["hits"]) + int(snap["misses"])
+    snap["hit_ratio"] = round(int(snap["hits"]) / total, 3) if total else None
+    snap["enabled"] = enabled()
+    snap["max_bytes"] = _max_bytes()
+    return snap
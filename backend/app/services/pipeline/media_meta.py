@@ -0,0 +1,146 @@
+# app/services/pipeline/media_meta.py
+"""
+Метаданные загруженного аудио в mfg_file: codec, channels, sample_rate, duration_s, bitrate
+и путь к результату предварительного транскода (derived_path).
+
+ffprobe запускается один раз — в фоне сразу после загрузки (probe_file). Шаги пайплайна
+и API берут метаданные через get(path): память процесса → строка mfg_file по
+stored_path → и только если файла там нет (временные пути, legacy) — ffprobe.
+"""
+from __future__ import annotations
+
+import json
+import os
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import func, select, update
+
+from app.core.logger import get_logger
+from app.db.models import MfgFile
+from app.db.session import async_session
+from app.services.pipeline import ffmpeg
+
+log = get_logger(__name__)
+
+_PROBE_ENTRIES = "stream=codec_name,channels,sample_rate,duration,bit_rate:format=duration,bit_rate"
+_FIELDS = ("codec", "channels", "sample_rate", "duration_s", "bitrate")
+
+# (path, mtime_ns) → метаданные
+_memo: Dict[Tuple[str, int], Dict[str, Any]] = {}
+
+
+def _num(v, cast):
+    try:
+        return cast(v) if v not in (None, "", "N/A") else None
+    except (TypeError, ValueError):
+        return None
+
+
+async def probe_media(path: str) -> Optional[Dict[str, Any]]:
+    """ffprobe первой аудиодорожки и контейнера → {codec, channels, sample_rate, duration_s, bitrate} или None."""
+    try:
+        out = await ffmpeg.run(ffmpeg.build_probe_cmd(path, _PROBE_ENTRIES), name="probe", limit=False)
+        data = json.loads(out.decode("utf-8"))
+    except Exception:
+        log.exception("ffprobe failed for %s", path)
+        return None
+    stream = (data.get("streams") or [None])[0] or {}
+    fmt = data.get("format") or {}
+    if not stream:
+        return None
+    return {
+        "codec": stream.get("codec_name"),
+        "channels": _num(stream.get("channels"), int),
+        "sample_rate": _num(stream.get("sample_rate"), int),
+        "duration_s": _num(fmt.get("duration"), float) or _num(stream.get("duration"), float),
+        "bitrate": _num(fmt.get("bit_rate"), int) or _num(stream.get("bit_rate"), int),
+    }
+
+
+def _memo_key(path: str) -> Optional[Tuple[str, int]]:
+    try:
+        return str(path), os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _remember(key: Optional[Tuple[str, int]], meta: Dict[str, Any]) -> None:
+    if key is None:
+        return
+    if len(_memo) >= 4096:
+        _memo.clear()
+    _memo[key] = meta
+
+
+async def probe_file(file_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Снять метаданные файла и сохранить в mfg_file (фоновая задача после загрузки).
+    Ошибки только логируются: метаданные снимет get() при первом обращении.
+    """
+    try:
+        async with async_session() as s:
+            row = await s.get(MfgFile, file_id)
+            if row is None:
+                return None
+            path = row.stored_path
+        meta = await probe_media(path)
+        if meta is None:
+            return None
+        async with async_session() as s:
+            await s.execute(update(MfgFile).where(MfgFile.id == file_id).values(**meta, probed_at=func.now()))
+            await s.commit()
+    except Exception:
+        log.exception("Media probe failed for file_id=%s", file_id)
+        return None
+    _remember(_memo_key(path), meta)
+    log.info("Media probed: file_id=%s %s", file_id, meta)
+    return meta
+
+
+async def get(path: str) -> Optional[Dict[str, Any]]:
+    """Метаданные по пути файла без повторного ffprobe, если они уже известны."""
+    key = _memo_key(path)
+    if key is not None and key in _memo:
+        return _memo[key]
+
+    async with async_session() as s:
+        row = (await s.execute(
+            select(MfgFile).where(MfgFile.stored_path == str(path), MfgFile.probed_at.isnot(None)).limit(1)
+        )).scalars().first()
+    if row is not None:
+        meta = {f: getattr(row, f) for f in _FIELDS}
+    else:
+        meta = await probe_media(path)
+        if meta is None:
+            return None
+        async with async_session() as s:
+            # файл из mfg_file, который ещё не успели/не смогли пробнуть при загрузке
+            await s.execute(
+                update(MfgFile).where(MfgFile.stored_path == str(path)).values(**meta, probed_at=func.now())
+            )
+            await s.commit()
+    _remember(key, meta)
+    return meta
+
+
+async def audio_info(path: str) -> Tuple[Optional[str], Optional[int], Optional[int]]:
+    """(codec_name, channels, sample_rate) — как media.probe_audio, но из кэша метаданных."""
+    meta = await get(path)
+    if not meta:
+        return None, None, None
+    return meta.get("codec"), meta.get("channels"), meta.get("sample_rate")
+
+
+async def derived_path(path: str) -> Optional[str]:
+    """Готовый WAV 16k mono из предварительного транскода (mfg_file.derived_path), если он ещё на диске."""
+    async with async_session() as s:
+        derived = (await s.execute(
+            select(MfgFile.derived_path).where(MfgFile.stored_path == str(path), MfgFile.derived_path.isnot(None)).limit(1)
+        )).scalar_one_or_none()
+    if not derived:
+        return None
+    try:
+        os.utime(derived)  # derived_path обычно лежит в media_cache: попадание продлевает LRU
+    except OSError:
+        return None
+    return derived
@@ -0,0 +1,423 @@
+# app/services/pipeline/pcm.py
+"""
+Decode-once хранилище PCM для пайплайна.
+
+Нормализованное аудио (результат convert_to_wav16k_mono, DERIVED_AUDIO_FORMAT):
+  - wav  — WAV 16k mono s16le: data-чанк отображается в память (np.memmap int16);
+  - pcm  — «голый» s16le + JSON-сайдкар <file>.pcm.json: memmap с нулевого смещения;
+  - flac — без потерь, ~вдвое меньше на диске: окна читаются с диска через seek
+           (SEEKTABLE, если есть, иначе бисекция по кадрам), целиком файл
+           декодируется только если нужен весь сигнал (VAD).
+Окна wav/pcm — срезы без копирования. Любой другой файл декодируется ffmpeg ОДИН
+раз и держится в памяти как int16; в режиме AUDIO_DECODE_PATH=pipe исходник
+кладётся сюда сразу (media.prepare_pcm).
+
+Хранилища живут в реестре с подсчётом ссылок: пока кто-то держит путь
+(шаг сегментации, ASR-цикл, job_scope всей джобы) — повторного чтения файла нет.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import struct
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import AsyncIterator, Dict, Iterator, Optional, Set, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.logger import get_logger
+
+log = get_logger(__name__)
+
+SAMPLE_RATE = 16000
+_WAVE_FORMAT_PCM = 0x0001
+_WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# DERIVED_AUDIO_FORMAT → расширение файла
+DERIVED_FORMATS = {"wav": ".wav", "flac": ".flac", "pcm": ".pcm"}
+
+
+def derived_format() -> str:
+    fmt = str(getattr(settings, "derived_audio_format", "wav") or "wav")
+    if fmt not in DERIVED_FORMATS:
+        raise ValueError(f"Unknown derived audio format: {fmt}")
+    return fmt
+
+
+def derived_suffix() -> str:
+    return DERIVED_FORMATS[derived_format()]
+
+
+def format_of(path: str) -> str:
+    """Формат нормализованного файла по расширению (всё незнакомое — wav)."""
+    suffix = Path(path).suffix.lower()
+    for fmt, ext in DERIVED_FORMATS.items():
+        if suffix == ext:
+            return fmt
+    return "wav"
+
+
+def sidecar_path(path: str) -> Path:
+    return Path(f"{path}.json")
+
+
+def write_sidecar(path: str) -> None:
+    """JSON-описание raw .pcm: формат, каналы, частота, число сэмплов."""
+    meta = {
+        "format": "s16le",
+        "channels": 1,
+        "sample_rate": SAMPLE_RATE,
+        "num_samples": Path(path).stat().st_size // 2,
+    }
+    sidecar_path(path).write_text(json.dumps(meta))
+
+
+class PcmStore:
+    """PCM одного файла: int16 mono, окна по времени."""
+
+    def __init__(self, path: str, samples: np.ndarray, sample_rate: int = SAMPLE_RATE, mapped: bool = False):
+        self.path = path
+        self.samples = samples          # 1-D int16 (np.memmap или ndarray)
+        self.sample_rate = sample_rate
+        self.mapped = mapped
+        self.refs = 0
+
+    @property
+    def num_samples(self) -> int:
+        return int(self.samples.shape[0])
+
+    @property
+    def duration(self) -> float:
+        return self.num_samples / float(self.sample_rate)
+
+    def _bounds(self, start_ts: float, end_ts: float) -> Tuple[int, int]:
+        s = max(0, int(round(start_ts * self.sample_rate)))
+        e = min(self.num_samples, int(round(end_ts * self.sample_rate)))
+        return s, max(s, e)
+
+    def window_int16(self, start_ts: float, end_ts: float) -> np.ndarray:
+        """Окно [start_ts, end_ts] как int16 — view без копирования."""
+        s, e = self._bounds(start_ts, end_ts)
+        return self.samples[s:e]
+
+    def window(self, start_ts: float, end_ts: float) -> np.ndarray:
+        """Окно [start_ts, end_ts] → np.float32 в [-1, 1] (копируется только само окно)."""
+        clip = self.window_int16(start_ts, end_ts)
+        if clip.size == 0:
+            return np.zeros((0,), dtype=np.float32)
+        out = clip.astype(np.float32)
+        out *= 1.0 / 32768.0
+        return out
+
+    def close(self) -> None:
+        # для memmap достаточно отпустить ссылку — mmap закроется сборщиком
+        self.samples = np.zeros((0,), dtype=np.int16)
+
+
+class FlacStore(PcmStore):
+    """FLAC 16k mono: окна — seek + декодирование только нужного куска; samples — ленивое полное декодирование."""
+
+    def __init__(self, path: str, num_samples: int, sample_rate: int = SAMPLE_RATE):
+        self._num_samples = num_samples
+        self._samples: Optional[np.ndarray] = None
+        self._decode_lock = threading.Lock()
+        super().__init__(path, None, sample_rate, mapped=False)
+
+    @property
+    def samples(self) -> np.ndarray:
+        with self._decode_lock:
+            if self._samples is None:
+                self._samples = _decode_once(self.path).samples
+            return self._samples
+
+    @samples.setter
+    def samples(self, value: Optional[np.ndarray]) -> None:
+        self._samples = value
+
+    @property
+    def num_samples(self) -> int:
+        if self._samples is not None:
+            return int(self._samples.shape[0])
+        return self._num_samples
+
+    def window_int16(self, start_ts: float, end_ts: float) -> np.ndarray:
+        if self._samples is not None:
+            return super().window_int16(start_ts, end_ts)
+        s, e = self._bounds(start_ts, end_ts)
+        if e <= s:
+            return np.zeros((0,), dtype=np.int16)
+        import torchaudio
+
+        wav, _ = torchaudio.load(self.path, frame_offset=s, num_frames=e - s, normalize=False)
+        return wav[0].numpy().astype(np.int16, copy=False)
+
+
+# ─────────────────────────────────────────
+# Чтение WAV
+# ─────────────────────────────────────────
+def _parse_wav_header(path: str) -> Optional[Tuple[int, int, int, int, int, int]]:
+    """
+    Разбор RIFF/WAVE → (format_tag, channels, sample_rate, bits, data_offset, data_size).
+    None — если это не WAV или заголовок битый.
+    """
+    with open(path, "rb") as f:
+        head = f.read(12)
+        if len(head) < 12 or head[:4] != b"RIFF" or head[8:12] != b"WAVE":
+            return None
+        fmt: Optional[Tuple[int, int, int, int]] = None
+        while True:
+            hdr = f.read(8)
+            if len(hdr) < 8:
+                return None
+            cid, size = hdr[:4], struct.unpack("<I", hdr[4:])[0]
+            if cid == b"fmt ":
+                body = f.read(size)
+                tag, ch, sr, _brate, _align, bits = struct.unpack("<HHIIHH", body[:16])
+                if tag == _WAVE_FORMAT_EXTENSIBLE and len(body) >= 26:
+                    tag = struct.unpack("<H", body[24:26])[0]
+                fmt = (tag, ch, sr, bits)
+                if size % 2:
+                    f.seek(1, 1)
+            elif cid == b"data":
+                if fmt is None:
+                    return None
+                return (*fmt, f.tell(), size)
+            else:
+                f.seek(size + (size % 2), 1)
+
+
+def _open_mapped(path: str) -> Optional[PcmStore]:
+    """WAV PCM s16le mono 16k → memmap data-чанка (без декодирования)."""
+    info = _parse_wav_header(path)
+    if info is None:
+        return None
+    tag, ch, sr, bits, offset, size = info
+    if tag != _WAVE_FORMAT_PCM or ch != 1 or sr != SAMPLE_RATE or bits != 16:
+        return None
+    # ffmpeg при записи в pipe оставляет size=0xFFFFFFFF — ограничиваем реальным размером
+    size = min(size, Path(path).stat().st_size - offset)
+    n = size // 2
+    if n <= 0:
+        return PcmStore(path, np.zeros((0,), dtype=np.int16), SAMPLE_RATE, mapped=False)
+    samples = np.memmap(path, dtype="<i2", mode="r", offset=offset, shape=(n,))
+    return PcmStore(path, samples, SAMPLE_RATE, mapped=True)
+
+
+def _open_raw(path: str) -> Optional[PcmStore]:
+    """raw .pcm + сайдкар → memmap всего файла."""
+    side = sidecar_path(path)
+    if not side.exists():
+        return None
+    meta = json.loads(side.read_text())
+    if meta.get("format") != "s16le" or meta.get("channels") != 1 or meta.get("sample_rate") != SAMPLE_RATE:
+        return None
+    n = min(int(meta.get("num_samples", 0)), Path(path).stat().st_size // 2)
+    if n <= 0:
+        return PcmStore(path, np.zeros((0,), dtype=np.int16), SAMPLE_RATE, mapped=False)
+    samples = np.memmap(path, dtype="<i2", mode="r", offset=0, shape=(n,))
+    return PcmStore(path, samples, SAMPLE_RATE, mapped=True)
+
+
+def _open_flac(path: str) -> Optional[PcmStore]:
+    """FLAC 16k mono → FlacStore (длина из STREAMINFO, без декодирования)."""
+    try:
+        import torchaudio
+
+        info = torchaudio.info(path)
+    except Exception:
+        log.warning("PCM: cannot read FLAC header of %s — decode once", path, exc_info=True)
+        return None
+    if info.sample_rate != SAMPLE_RATE or info.num_channels != 1 or info.num_frames <= 0:
+        return None
+    return FlacStore(path, int(info.num_frames), SAMPLE_RATE)
+
+
+def _decode_once(path: str) -> PcmStore:
+    """Фоллбэк для «неканоничных» файлов: один раз декодируем ffmpeg в int16 mono 16k прямо в память."""
+    from app.services.pipeline import ffmpeg
+    from app.services.pipeline.media import pcm_decode_cmd
+
+    data = ffmpeg.run_sync(pcm_decode_cmd(path), name="decode")
+    pcm = np.frombuffer(data[: len(data) - len(data) % 2], dtype="<i2")
+    return PcmStore(path, pcm, SAMPLE_RATE, mapped=False)
+
+
+def _load(path: str) -> PcmStore:
+    if not Path(path).exists():
+        raise FileNotFoundError(path)
+    fmt = format_of(path)
+    if fmt == "pcm":
+        store = _open_raw(path)
+    elif fmt == "flac":
+        store = _open_flac(path)
+    else:
+        store = _open_mapped(path)
+    if store is None:
+        log.info("PCM: %s is not wav/16k/mono/s16 — decode once", path)
+        store = _decode_once(path)
+    log.debug("PCM open: %s samples=%d (%.1fs) mapped=%s", path, store.num_samples, store.duration, store.mapped)
+    return store
+
+
+# ─────────────────────────────────────────
+# Реестр с подсчётом ссылок
+# ─────────────────────────────────────────
+_stores: Dict[str, PcmStore] = {}
+_lock = threading.Lock()
+# путь → событие «загрузка завершена»: файл читается/декодируется вне _lock, один раз
+_loading: Dict[str, threading.Event] = {}
+_job_paths: ContextVar[Optional[Set[str]]] = ContextVar("pcm_job_paths", default=None)
+
+
+def _key(path: str) -> str:
+    return str(Path(path).resolve())
+
+
+def acquire(path: str) -> PcmStore:
+    """Взять хранилище (открыть при первом обращении) и увеличить счётчик ссылок."""
+    key = _key(path)
+    while True:
+        with _lock:
+            store = _stores.get(key)
+            if store is not None:
+                return _take(key, store)
+            loading = _loading.get(key)
+            if loading is None:
+                _loading[key] = threading.Event()
+        if loading is not None:
+            # файл грузит другой поток — ждём его, не держа _lock
+            loading.wait()
+            continue
+
+        # декодирование может идти секунды: остальные пути тем временем открываются и закрываются
+        try:
+            store = _load(path)
+        except BaseException:
+            with _lock:
+                _loading.pop(key).set()
+            raise
+        with _lock:
+            _loading.pop(key).set()
+            current = _stores.get(key)
+            if current is not None:  # пока грузили, буфер положил register
+                store.close()
+                return _take(key, current)
+            _stores[key] = store
+            return _take(key, store)
+
+
+def _acquire_open(path: str) -> Optional[PcmStore]:
+    """+1 ссылка, если путь уже в реестре; иначе None (без чтения файла)."""
+    key = _key(path)
+    with _lock:
+        store = _stores.get(key)
+        return _take(key, store) if store is not None else None
+
+
+def _take(key: str, store: PcmStore) -> PcmStore:
+    """+1 ссылка (под _lock); внутри job_scope первая ссылка на путь удерживается до конца джобы."""
+    store.refs += 1
+    scope = _job_paths.get()
+    if scope is not None and key not in scope:
+        scope.add(key)
+        store.refs += 1
+    return store
+
+
+def register(path: str, samples: np.ndarray, sample_rate: int = SAMPLE_RATE) -> None:
+    """
+    Положить уже декодированный PCM в реестр под path (без чтения файла).
+    Держится job_scope; вне scope его некому отпустить — не регистрируем,
+    тогда open_pcm декодирует исходник сам.
+    """
+    key = _key(path)
+    with _lock:
+        scope = _job_paths.get()
+        if key in _stores:
+            return
+        if scope is None:
+            log.info("PCM register outside job_scope: %s — buffer dropped, open_pcm will decode again", path)
+            return
+        store = PcmStore(path, samples, sample_rate, mapped=False)
+        store.refs = 1
+        _stores[key] = store
+        scope.add(key)
+
+
+def is_open(path: str) -> bool:
+    with _lock:
+        return _key(path) in _stores
+
+
+def release(path: str) -> None:
+    """Отпустить ссылку; на нуле хранилище закрывается."""
+    key = _key(path)
+    with _lock:
+        store = _stores.get(key)
+        if store is None:
+            return
+        store.refs -= 1
+        if store.refs <= 0:
+            _stores.pop(key, None)
+            store.close()
+            log.debug("PCM closed: %s", key)
+
+
+@contextmanager
+def open_pcm(path: str) -> Iterator[PcmStore]:
+    store = acquire(path)
+    try:
+        yield store
+    finally:
+        release(path)
+
+
+@asynccontextmanager
+async def open_pcm_async(path: str) -> AsyncIterator[PcmStore]:
+    """
+    open_pcm для корутин: промах реестра (чтение заголовка, декодирование ffmpeg,
+    ожидание чужой загрузки) уходит в поток и не блокирует event loop.
+    asyncio.to_thread копирует контекст — ссылка попадает в job_scope вызывающего.
+    """
+    store = _acquire_open(path)
+    if store is None:
+        task = asyncio.ensure_future(asyncio.to_thread(acquire, path))
+        try:
+            store = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            # поток всё равно дозагрузит файл — отпускаем его ссылку по готовности
+            task.add_done_callback(lambda t: None if t.cancelled() or t.exception() else release(path))
+            raise
+    try:
+        yield store
+    finally:
+        release(path)
+
+
+@contextmanager
+def job_scope() -> Iterator[None]:
+    """
+    Привязать время жизни хранилищ к джобе: всё, что открыто внутри,
+    живёт до выхода из scope (VAD → ASR не декодируют файл повторно).
+    """
+    paths: Set[str] = set()
+    token = _job_paths.set(paths)
+    try:
+        yield
+    finally:
+        _job_paths.reset(token)
+        for key in paths:
+            release(key)
+
+
+def stats() -> Dict[str, int]:
+    with _lock:
+        return {
+            "open": len(_stores),
+            "mapped": sum(1 for s in _stores.values() if s.mapped),
+            "refs": sum(s.refs for s in _stores.values()),
+        }
@@ -0,0 +1,60 @@
+# app/services/pipeline/pretranscode.py
+"""
+Предварительный транскод после загрузки (PRETRANSCODE_ON_UPLOAD).
+
+Файл сразу приводится к каноническому WAV 16k mono (через тот же
+convert_to_wav16k_mono и media_cache), путь пишется в mfg_file.derived_path.
+Когда по файлу стартует джоба, нормализация — уже поиск готового файла.
+Приоритет низкий: транскоды очереди идут по одному и с nice, а слот
+FFMPEG_MAX_CONCURRENT делят с джобами на общих основаниях.
+
+Инверсия приоритетов: джоба по тому же файлу не ждёт фоновый транскод в
+in-flight lock media_cache, а конвертирует сама (см. media_cache.normalized).
+Остаётся слот: пока фоновый ffmpeg под nice его держит, джобы ждут его
+завершения — при FFMPEG_MAX_CONCURRENT=1 и частых загрузках поднимите лимит
+или выключите PRETRANSCODE_ON_UPLOAD.
+"""
+from __future__ import annotations
+
+import asyncio
+from typing import Optional
+
+from sqlalchemy import update
+
+from app.core.logger import get_logger
+from app.db.models import MfgFile
+from app.db.session import async_session
+from app.services.pipeline.media import convert_to_wav16k_mono
+
+log = get_logger(__name__)
+
+_queue_lock: Optional[asyncio.Lock] = None
+
+
+def _lock() -> asyncio.Lock:
+    global _queue_lock
+    if _queue_lock is None:
+        _queue_lock = asyncio.Lock()
+    return _queue_lock
+
+
+async def enqueue(file_id: int) -> Optional[str]:
+    """Транскодировать файл в фоне и записать derived_path; ошибки не критичны — джоба сделает это сама."""
+    async with _lock():
+        try:
+            async with async_session() as s:
+                row = await s.get(MfgFile, file_id)
+                if row is None:
+                    return None
+                src, done = row.stored_path, row.derived_path
+            if done:
+                return done
+            dst = await convert_to_wav16k_mono(src, low_priority=True)
+            async with async_session() as s:
+                await s.execute(update(MfgFile).where(MfgFile.id == file_id).values(derived_path=dst))
+                await s.commit()
+            log.info("Pre-transcode done: file_id=%s → %s", file_id, dst)
+            return dst
+        except Exception:
+            log.exception("Pre-transcode failed for file_id=%s", file_id)
+            return None
@@ -0,0 +1,207 @@
+# app/services/pipeline/registry.py
+"""
+Ленивый реестр моделей Whisper.
+
+Модель грузится при первом обращении к своему тиру (ASR_MODELS: "tiny:int8,medium:int8,large-v3:auto"),
+одновременно держим не больше ASR_MAX_LOADED_MODELS (LRU), простаивающие дольше
+ASR_MODEL_IDLE_TTL_SEC выгружаются фоновой задачей (idle_sweeper, запускается
+в startup приложения). Импорт модуля ничего не грузит — API-процессы
+не платят ни временем старта, ни памятью.
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+from app.core.config import settings
+from app.core.logger import get_logger
+
+log = get_logger(__name__)
+
+
+@dataclass
+class _Entry:
+    model: Any
+    tier: str
+    device: str
+    compute_type: str
+    load_sec: float
+    loaded_at: float = field(default_factory=time.monotonic)
+    last_used: float = field(default_factory=time.monotonic)
+    uses: int = 0
+
+
+def _parse_tiers(spec: str) -> Dict[str, str]:
+    """'tiny:int8,large-v3:auto' → {'tiny': 'int8', 'large-v3': 'auto'}"""
+    tiers: Dict[str, str] = {}
+    for part in (spec or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, ctype = part.partition(":")
+        tiers[name.strip()] = (ctype.strip() or "auto")
+    return tiers
+
+
+def _device() -> str:
+    import torch
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+class WhisperRegistry:
+    def __init__(self, tiers: Dict[str, str], default: str, max_loaded: int = 1, idle_ttl: float = 0.0):
+        self.tiers = dict(tiers)
+        self.tiers.setdefault(default, "auto")
+        self.default = default
+        self.max_loaded = max(1, int(max_loaded))
+        self.idle_ttl = float(idle_ttl)
+        self._models: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {t: threading.Lock() for t in self.tiers}
+        self._counters = {"loads": 0, "unloads": 0, "hits": 0, "evicted_lru": 0, "evicted_ttl": 0, "load_sec": 0.0}
+
+    def resolve(self, tier: Optional[str] = None) -> str:
+        name = tier or self.default
+        if name not in self.tiers:
+            raise ValueError(f"Unknown ASR model tier: {name!r}; available: {sorted(self.tiers)}")
+        return name
+
+    def _load(self, tier: str) -> _Entry:
+        from faster_whisper import WhisperModel
+
+        device = _device()
+        ctype = self.tiers[tier]
+        if ctype == "auto":
+            ctype = "float16" if device == "cuda" else "int8"
+        cpu_threads = int(getattr(settings, "asr_cpu_threads", 0) or 0)
+
+        log.info("Инициализация Whisper: model=%s device=%s compute_type=%s", tier, device, ctype)
+        t0 = time.monotonic()
+        try:
+            model = WhisperModel(tier, device=device, compute_type=ctype, cpu_threads=cpu_threads)
+            if device == "cuda":
+                import torch
+                _ = torch.randn(1, device="cuda")
+        except Exception:
+            log.exception("Ошибка при инициализации Whisper (%s)", tier)
+            raise
+        load_sec = time.monotonic() - t0
+        log.info("Whisper %s загружена за %.1fs", tier, load_sec)
+        return _Entry(model=model, tier=tier, device=device, compute_type=ctype, load_sec=load_sec)
+
+    def get(self, tier: Optional[str] = None) -> Any:
+        """WhisperModel для тира (по умолчанию ASR_DEFAULT_MODEL); грузится при первом вызове."""
+        name = self.resolve(tier)
+        self.evict_idle(keep=name)
+
+        with self._lock:
+            entry = self._models.get(name)
+            if entry is not None:
+                return self._touch(entry)
+
+        # грузим вне общего лока: другие тиры в это время доступны
+        with self._load_locks[name]:
+            with self._lock:
+                entry = self._models.get(name)
+                if entry is not None:
+                    return self._touch(entry)
+            entry = self._load(name)
+            with self._lock:
+                self._models[name] = entry
+                self._counters["loads"] += 1
+                self._counters["load_sec"] += entry.load_sec
+                while len(self._models) > self.max_loaded:
+                    old, _ = self._models.popitem(last=False)
+                    self._counters["unloads"] += 1
+                    self._counters["evicted_lru"] += 1
+                    log.info("Whisper %s выгружена (LRU, max_loaded=%d)", old, self.max_loaded)
+                return self._touch(entry, hit=False)
+
+    def _touch(self, entry: _Entry, hit: bool = True) -> Any:
+        entry.last_used = time.monotonic()
+        entry.uses += 1
+        self._models.move_to_end(entry.tier)
+        if hit:
+            self._counters["hits"] += 1
+        return entry.model
+
+    def evict_idle(self, keep: Optional[str] = None) -> int:
+        """Выгрузить модели, простаивающие дольше idle_ttl. Возвращает число выгруженных."""
+        if self.idle_ttl <= 0:
+            return 0
+        now = time.monotonic()
+        evicted = 0
+        with self._lock:
+            for name in list(self._models):
+                if name == keep:
+                    continue
+                if now - self._models[name].last_used > self.idle_ttl:
+                    self._models.pop(name)
+                    self._counters["unloads"] += 1
+                    self._counters["evicted_ttl"] += 1
+                    evicted += 1
+                    log.info("Whisper %s выгружена (idle > %.0fs)", name, self.idle_ttl)
+        return evicted
+
+    async def idle_sweeper(self) -> None:
+        """
+        Периодически выгружать простаивающие модели: сам get() последнюю использованную
+        модель не трогает, и на простаивающем узле без sweeper она жила бы вечно.
+        """
+        if self.idle_ttl <= 0:
+            return
+        interval = max(5.0, min(60.0, self.idle_ttl / 2))
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.evict_idle()
+            except Exception:
+                log.exception("Whisper idle sweep failed")
+
+    def unload(self, tier: str) -> bool:
+        with self._lock:
+            if self._models.pop(tier, None) is None:
+                return False
+            self._counters["unloads"] += 1
+        log.info("Whisper %s выгружена вручную", tier)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            loaded = {
+                name: {
+                    "device": e.device,
+                    "compute_type": e.compute_type,
+                    "load_sec": round(e.load_sec, 2),
+                    "uses": e.uses,
+                    "idle_sec": round(now - e.last_used, 1),
+                }
+                for name, e in self._models.items()
+            }
+            counters = dict(self._counters)
+        counters["load_sec"] = round(counters["load_sec"], 2)
+        return {
+            "tiers": dict(self.tiers),
+            "default": self.default,
+            "max_loaded": self.max_loaded,
+            "idle_ttl_sec": self.idle_ttl,
+            "loaded": loaded,
+            **counters,
+        }
+
+
+whisper_registry = WhisperRegistry(
+    tiers=_parse_tiers(getattr(settings, "asr_models", "large-v3:auto")),
+    default=getattr(settings, "asr_default_model", "large-v3"),
+    max_loaded=int(getattr(settings, "asr_max_loaded_models", 1)),
+    idle_ttl=float(getattr(settings, "asr_model_idle_ttl_sec", 0)),
+)
+
+
+def get_whisper(tier: Optional[str] = None) -> Any:
+    return whisper_registry.get(tier)
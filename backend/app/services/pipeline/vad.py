@@ -2,17 +2,18 @@
 from __future__ import annotations
 import asyncio
 import time
-import wave
 from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Optional
+from typing import AsyncIterator, Iterable, Iterator, List, Optional, Tuple
 
 import numpy as np
 import webrtcvad  # pip install webrtcvad
 
 from app.core.logger import get_logger
 from app.core.config import settings
-from app.services.pipeline.media import convert_to_wav16k_mono
+from app.services.pipeline import pcm, vad_energy
+from app.services.pipeline.executor import process_workers, run_inference
+from app.services.pipeline.media import prepare_pcm
 
 log = get_logger(__name__)
 
@@ -21,147 +22,352 @@ class SpeechSeg:
     start_ts: float
     end_ts: float
 
-def _read_pcm16_mono_16k(path: str) -> tuple[bytes, int]:
-    """Считываем WAV 16k mono PCM16 → байты и sample_rate."""
-    with wave.open(path, "rb") as wf:
-        sr = wf.getframerate()
-        ch = wf.getnchannels()
-        sampwidth = wf.getsampwidth()
-        if sr != 16000 or ch != 1 or sampwidth != 2:
-            raise RuntimeError(f"WAV must be 16k/mono/16-bit, got sr={sr}, ch={ch}, w={sampwidth}")
-        pcm = wf.readframes(wf.getnframes())
-    return pcm, sr
-
-def _frame_generator(pcm: bytes, sr: int, frame_ms: int) -> List[bytes]:
-    """Режем на короткие фреймы (10/20/30 ms) для webrtcvad."""
-    bytes_per_sample = 2  # 16-bit
-    frame_size = int(sr * frame_ms / 1000) * bytes_per_sample
-    return [pcm[i:i+frame_size] for i in range(0, len(pcm), frame_size) if i+frame_size <= len(pcm)]
-
-def _collect_speech_regions(
-    frames: List[bytes],
+def _frame_generator(
+    samples: np.ndarray,
+    sr: int,
+    frame_ms: int,
+    start_frame: int = 0,
+    end_frame: Optional[int] = None,
+) -> Iterator[bytes]:
+    """
+    Фреймы (10/20/30 ms) для webrtcvad по одному: срез memmap → bytes.
+    В памяти только текущий фрейм, а не список всех фреймов файла.
+    """
+    frame_size = int(sr * frame_ms / 1000)
+    n = len(samples) // frame_size
+    stop = n if end_frame is None else min(n, end_frame)
+    for i in range(start_frame, stop):
+        yield samples[i*frame_size:(i+1)*frame_size].tobytes()
+
+def _webrtc_runs(
+    samples: np.ndarray,
     sr: int,
     frame_ms: int,
     aggressiveness: int,
+    start_frame: int = 0,
+    end_frame: Optional[int] = None,
+    warmup_frames: int = 0,
+) -> Iterator[Tuple[int, int, bool]]:
+    """Серии речевых кадров webrtcvad (start, end, True) в [start_frame, end_frame), индексы глобальные."""
+    vad = webrtcvad.Vad(aggressiveness)
+    # webrtcvad адаптирует модель шума: прогреваем её на кадрах перед шардом, решения не берём
+    for fr in _frame_generator(samples, sr, frame_ms, max(0, start_frame - warmup_frames), start_frame):
+        vad.is_speech(fr, sr)
+    run_start: Optional[int] = None
+    i = start_frame
+    for i, fr in enumerate(_frame_generator(samples, sr, frame_ms, start_frame, end_frame), start_frame):
+        if vad.is_speech(fr, sr):
+            if run_start is None:
+                run_start = i
+        elif run_start is not None:
+            yield run_start, i, True
+            run_start = None
+    if run_start is not None:
+        yield run_start, i + 1, True
+
+def _fuse_runs(runs: Iterable[Tuple[int, int, bool]]) -> Iterator[Tuple[int, int, bool]]:
+    """Склеить касающиеся серии (границы блоков/шардов); strong — если сильная любая из частей."""
+    cur: Optional[Tuple[int, int, bool]] = None
+    for s, e, strong in runs:
+        if cur is not None and s <= cur[1]:
+            cur = (cur[0], max(cur[1], e), cur[2] or strong)
+            continue
+        if cur is not None:
+            yield cur
+        cur = (s, e, strong)
+    if cur is not None:
+        yield cur
+
+def _regions_from_runs(
+    runs: Iterable[Tuple[int, int, bool]],
+    n_frames: int,
+    frame_ms: int,
     min_speech_ms: int,
     min_silence_ms: int,
-) -> List[SpeechSeg]:
-    vad = webrtcvad.Vad(aggressiveness)
-    segs: List[SpeechSeg] = []
-    in_speech = False
-    seg_start: Optional[float] = None
-    silence_acc = 0
-    for i, fr in enumerate(frames):
-        ts = i * (frame_ms / 1000.0)
-        is_speech = vad.is_speech(fr, sr)
-        if is_speech:
-            if not in_speech:
-                in_speech = True
-                seg_start = ts
-            silence_acc = 0
-        else:
-            if in_speech:
-                silence_acc += frame_ms
-                if silence_acc >= min_silence_ms:
-                    # закрываем сегмент
-                    end_ts = ts
-                    if seg_start is not None and (end_ts - seg_start) * 1000 >= min_speech_ms:
-                        segs.append(SpeechSeg(seg_start, end_ts))
-                    in_speech, seg_start, silence_acc = False, None, 0
-    # хвост
-    if in_speech and seg_start is not None:
-        end_ts = len(frames) * (frame_ms / 1000.0)
-        if (end_ts - seg_start) * 1000 >= min_speech_ms:
-            segs.append(SpeechSeg(seg_start, end_ts))
-    return segs
+    hangover_frames: int = 0,
+) -> Iterator[SpeechSeg]:
+    """
+    Серии речевых кадров → речевые регионы, по мере поступления серий.
+    Семантика автомата речь/тишина: сегмент закрывается на кадре, где набралось
+    min_silence_ms тишины; хвост файла закрывает открытый сегмент; регионы
+    короче min_speech_ms отбрасываются.
+    """
+    frame_sec = frame_ms / 1000.0
+    k_sil = max(1, -(-min_silence_ms // frame_ms))
 
-def _merge_and_chunk(
-    segs: List[SpeechSeg],
+    def close(start: int, end: int) -> Iterator[SpeechSeg]:
+        stop = min(end + k_sil - 1, n_frames)
+        if (stop - start) * frame_ms >= min_speech_ms:
+            yield SpeechSeg(start * frame_sec, stop * frame_sec)
+
+    cur: Optional[Tuple[int, int]] = None
+    for s, e, strong in _fuse_runs(runs):
+        if not strong:
+            continue
+        e = min(n_frames, e + hangover_frames)
+        if cur is not None and s - cur[1] < k_sil:
+            cur = (cur[0], max(cur[1], e))
+            continue
+        if cur is not None:
+            yield from close(*cur)
+        cur = (s, e)
+    if cur is not None:
+        yield from close(*cur)
+
+def _iter_merge_and_chunk(
+    segs: Iterable[SpeechSeg],
     max_gap_sec: float,
     max_len_sec: float,
     overlap_sec: float,
-) -> List[SpeechSeg]:
-    """Склеиваем близкие сегменты и режем длинные в окна с overlap."""
-    if not segs:
-        return []
-    # merge by gap
-    merged: List[SpeechSeg] = [segs[0]]
-    for s in segs[1:]:
-        last = merged[-1]
-        if s.start_ts - last.end_ts <= max_gap_sec:
-            merged[-1] = SpeechSeg(last.start_ts, max(s.end_ts, last.end_ts))
-        else:
-            merged.append(s)
-    # cut long ones
-    out: List[SpeechSeg] = []
-    for s in merged:
+) -> Iterator[SpeechSeg]:
+    """
+    Склеиваем близкие сегменты и режем длинные в окна с overlap — потоково:
+    склеенный регион отдаётся, как только следующий начинается дальше max_gap_sec.
+    """
+    def cut(s: SpeechSeg) -> Iterator[SpeechSeg]:
         cur = s.start_ts
         while cur < s.end_ts:
             end = min(cur + max_len_sec, s.end_ts)
-            out.append(SpeechSeg(cur, end))
+            yield SpeechSeg(cur, end)
             if end >= s.end_ts:
                 break
             cur = end - overlap_sec  # шаг с overlap
-    return out
 
-async def segment_vad(audio_path: str) -> tuple[str, List[dict]]:
+    last: Optional[SpeechSeg] = None
+    for s in segs:
+        if last is not None and s.start_ts - last.end_ts <= max_gap_sec:
+            last = SpeechSeg(last.start_ts, max(s.end_ts, last.end_ts))
+            continue
+        if last is not None:
+            yield from cut(last)
+        last = s
+    if last is not None:
+        yield from cut(last)
+
+def _merge_and_chunk(
+    segs: List[SpeechSeg],
+    max_gap_sec: float,
+    max_len_sec: float,
+    overlap_sec: float,
+) -> List[SpeechSeg]:
+    """Склеиваем близкие сегменты и режем длинные в окна с overlap."""
+    return list(_iter_merge_and_chunk(segs, max_gap_sec, max_len_sec, overlap_sec))
+
+def _vad_params() -> dict:
+    frame_ms = int(getattr(settings, "vad_frame_ms", 20))
+    backend = str(getattr(settings, "vad_backend", "webrtc") or "webrtc")
+    hangover_ms = int(getattr(settings, "vad_energy_hangover_ms", 100))
+    return dict(
+        frame_ms=frame_ms,
+        aggr=int(getattr(settings, "vad_aggressiveness", 2)),  # 0–3
+        min_speech_ms=int(getattr(settings, "vad_min_speech_ms", 250)),
+        min_silence_ms=int(getattr(settings, "vad_min_silence_ms", 300)),
+        max_gap_sec=float(getattr(settings, "vad_merge_max_gap_sec", 0.3)),
+        max_len_sec=float(getattr(settings, "vad_max_segment_sec", 30)),
+        overlap_sec=float(getattr(settings, "seg_overlap_sec", 2.0)),
+        backend=backend,
+        # продление речи — только у energy: webrtcvad сглаживает решения сам
+        hangover_frames=(hangover_ms // frame_ms) if backend == "energy" else 0,
+        shard_min_file_sec=float(getattr(settings, "vad_shard_min_file_sec", 0) or 0),
+        shard_sec=float(getattr(settings, "vad_shard_sec", 300) or 300),
+        shard_warmup_sec=float(getattr(settings, "vad_shard_warmup_sec", 1.0) or 0),
+    )
+
+def _backend_runs(
+    samples: np.ndarray,
+    sr: int,
+    p: dict,
+    start_frame: int = 0,
+    end_frame: Optional[int] = None,
+    warmup_frames: int = 0,
+) -> Iterator[Tuple[int, int, bool]]:
+    """Серии речевых кадров выбранным движком (VAD_BACKEND): webrtc — покадрово, energy — NumPy."""
+    if p["backend"] == "energy":
+        return vad_energy.active_runs(samples, sr, p["frame_ms"], start_frame, end_frame)
+    if p["backend"] != "webrtc":
+        raise RuntimeError(f"Unknown VAD backend: {p['backend']}")
+    return _webrtc_runs(samples, sr, p["frame_ms"], p["aggr"], start_frame, end_frame, warmup_frames)
+
+def _n_frames(samples: np.ndarray, sr: int, frame_ms: int) -> int:
+    return len(samples) // int(sr * frame_ms / 1000)
+
+def _iter_raw_regions(samples: np.ndarray, sr: int, p: dict) -> Iterator[SpeechSeg]:
+    """Сырые речевые регионы файла одним последовательным проходом."""
+    return _regions_from_runs(
+        _backend_runs(samples, sr, p),
+        _n_frames(samples, sr, p["frame_ms"]),
+        p["frame_ms"], p["min_speech_ms"], p["min_silence_ms"], p["hangover_frames"],
+    )
+
+def _vad_produce(wav16k: str, p: dict, emit) -> float:
+    """Синхронный проход VAD (в пуле инференса): готовые сегменты отдаются через emit по мере нахождения."""
+    with pcm.open_pcm(wav16k) as store:
+        raw = _iter_raw_regions(store.samples, store.sample_rate, p)
+        for seg in _iter_merge_and_chunk(raw, p["max_gap_sec"], p["max_len_sec"], p["overlap_sec"]):
+            emit(seg)
+        return store.duration
+
+def _plan_shards(n_frames: int, frame_ms: int, shard_sec: float) -> List[Tuple[int, int]]:
+    """Шарды [a, b) по границам кадров."""
+    per = max(1, int(shard_sec * 1000 // frame_ms))
+    return [(a, min(a + per, n_frames)) for a in range(0, n_frames, per)]
+
+def _shard_runs(wav16k: str, p: dict, start_frame: int, end_frame: int) -> List[Tuple[int, int, bool]]:
+    """Серии речевых кадров одного шарда (в процессе пула: аудио не пиклится, воркер открывает memmap сам)."""
+    warmup = int(p["shard_warmup_sec"] * 1000 // p["frame_ms"])
+    with pcm.open_pcm(wav16k) as store:
+        return list(_fuse_runs(_backend_runs(store.samples, store.sample_rate, p, start_frame, end_frame, warmup)))
+
+async def _vad_sharded(wav16k: str, p: dict, n_frames: int) -> List[SpeechSeg]:
     """
-    Возвращает (wav16k_path, список сегментов) без спикеров:
-    [{"speaker":"SPEECH","start_ts":...,"end_ts":...,"file_path":wav16k_path}, ...]
+    VAD длинного файла по шардам параллельно (пул процессов инференса).
+    Серии на стыке шардов склеиваются, дальше — тот же _regions_from_runs, что и
+    в последовательном проходе: для energy результат совпадает побитно, для webrtc
+    расхождения возможны только из-за адаптации модели шума (её греет warmup).
+    """
+    shards = _plan_shards(n_frames, p["frame_ms"], p["shard_sec"])
+    results = await asyncio.gather(*[
+        run_inference(_shard_runs, wav16k, p, a, b, kind="process", name="vad_shard")
+        for a, b in shards
+    ])
+    runs = [r for shard in results for r in shard]
+    raw = _regions_from_runs(runs, n_frames, p["frame_ms"], p["min_speech_ms"], p["min_silence_ms"], p["hangover_frames"])
+    log.info("VAD: %d shards x %.0fs, backend=%s", len(shards), p["shard_sec"], p["backend"])
+    return list(_iter_merge_and_chunk(raw, p["max_gap_sec"], p["max_len_sec"], p["overlap_sec"]))
+
+def _use_shards(p: dict, duration: float) -> bool:
+    # без пула процессов шарды шли бы потоками под GIL — быстрее не станет
+    if process_workers() <= 0:
+        return False
+    return 0 < p["shard_min_file_sec"] <= duration and duration > p["shard_sec"]
+
+async def stream_vad(wav16k: str) -> AsyncIterator[SpeechSeg]:
+    """
+    Потоковый VAD над WAV 16k mono: сегменты (после склейки/нарезки) приходят по мере
+    прохода по файлу, память — O(фрейм + открытый регион). Потребитель (сохранение
+    чанков, ASR) может начинать работу до конца VAD.
+    """
+    p = _vad_params()
+    async with pcm.open_pcm_async(wav16k) as store:
+        duration = store.duration
+        n_frames = _n_frames(store.samples, store.sample_rate, p["frame_ms"])
+        # шарды открывают файл в своих процессах: PCM только в памяти (pipe) каждый декодировал бы заново
+        mapped = store.mapped
+    if mapped and _use_shards(p, duration):
+        # длинный файл: шарды параллельно, сегменты — после сборки всех шардов
+        for seg in await _vad_sharded(wav16k, p, n_frames):
+            yield seg
+        return
+
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    done = object()
+
+    def emit(seg: SpeechSeg) -> None:
+        loop.call_soon_threadsafe(queue.put_nowait, seg)
+
+    async def produce() -> float:
+        try:
+            # webrtcvad — синхронный цикл по фреймам: гоняем в пуле инференса, не в event loop
+            return await run_inference(_vad_produce, wav16k, p, emit, name="vad")
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, done)
+
+    task = asyncio.create_task(produce())
+    try:
+        while (item := await queue.get()) is not done:
+            yield item
+        await task  # пробросить исключение VAD, если было
+    finally:
+        if not task.done():
+            task.cancel()
+
+async def segment_vad_stream(audio_path: str) -> tuple[str, AsyncIterator[dict]]:
+    """
+    Как segment_vad, но чанки отдаются асинхронным итератором по мере работы VAD:
+    (wav16k_path, aiter[{"speaker":"SPEECH","start_ts","end_ts","file_path"}]).
     """
     # 1) конверт (пропускаем, если уже wav16k mono)
-    wav16k = await convert_to_wav16k_mono(audio_path, threads=settings.ffmpeg_threads)
-    pcm, sr = _read_pcm16_mono_16k(wav16k)
+    wav16k = await prepare_pcm(audio_path, threads=settings.ffmpeg_threads)
 
-    frame_ms = int(getattr(settings, "vad_frame_ms", 20))
-    aggr = int(getattr(settings, "vad_aggressiveness", 2))  # 0–3
-    min_speech_ms = int(getattr(settings, "vad_min_speech_ms", 250))
-    min_silence_ms = int(getattr(settings, "vad_min_silence_ms", 300))
-    max_gap_sec = float(getattr(settings, "vad_merge_max_gap_sec", 0.3))
-    max_len_sec = float(getattr(settings, "vad_max_segment_sec", 30))
-    overlap_sec = float(getattr(settings, "seg_overlap_sec", 2.0))
-
-    t0 = time.monotonic()
-    frames = _frame_generator(pcm, sr, frame_ms)
-    raw = _collect_speech_regions(frames, sr, frame_ms, aggr, min_speech_ms, min_silence_ms)
-    segs = _merge_and_chunk(raw, max_gap_sec, max_len_sec, overlap_sec)
-    elapsed = time.monotonic() - t0
-    dur = len(pcm) / (sr * 2)  # bytes → samples → seconds
-
-    log.info(
-        "VAD: found %d raw, %d merged/chunked in %.2fs for %.2fs audio (RTF=%.3f)",
-        len(raw), len(segs), elapsed, dur, elapsed / dur if dur > 0 else 0.0
-    )
+    async def chunks() -> AsyncIterator[dict]:
+        t0 = time.monotonic()
+        n = 0
+        async with pcm.open_pcm_async(wav16k) as store:
+            dur = store.duration
+            async for s in stream_vad(wav16k):
+                n += 1
+                yield {"speaker": "SPEECH", "start_ts": float(s.start_ts), "end_ts": float(s.end_ts), "file_path": wav16k}
+        elapsed = time.monotonic() - t0
+        log.info("VAD: %d merged/chunked in %.2fs for %.2fs audio (RTF=%.3f)",
+                 n, elapsed, dur, elapsed / dur if dur > 0 else 0.0)
 
-    chunks = [{
-        "speaker": "SPEECH",
-        "start_ts": float(s.start_ts),
-        "end_ts": float(s.end_ts),
-        "file_path": wav16k
-    } for s in segs]
-    return wav16k, chunks
+    return wav16k, chunks()
 
-async def segment_fixed(audio_path: str) -> tuple[str, List[dict]]:
+async def segment_vad(audio_path: str) -> tuple[str, List[dict]]:
     """
-    Простая нарезка на окна фиксированной длины, например 30с, с overlap.
+    Возвращает (wav16k_path, список сегментов) без спикеров:
+    [{"speaker":"SPEECH","start_ts":...,"end_ts":...,"file_path":wav16k_path}, ...]
     """
-    wav16k = await convert_to_wav16k_mono(audio_path, threads=settings.ffmpeg_threads)
+    wav16k, stream = await segment_vad_stream(audio_path)
+    return wav16k, [c async for c in stream]
 
-    import torchaudio
-    info = torchaudio.info(wav16k)
-    sr = info.sample_rate
-    total_sec = info.num_frames / sr
-    win = float(getattr(settings, "fixed_window_sec", 30))
-    ovl = float(getattr(settings, "fixed_overlap_sec", 5))
+# огибающая энергии для выбора точек реза в fixed: шаг и сглаживание
+_ENV_HOP_SEC = 0.01
+_ENV_SMOOTH_HOPS = 5
+_ENV_BLOCK_HOPS = 1 << 16
 
+def _energy_envelope(samples: np.ndarray, sr: int) -> np.ndarray:
+    """Средняя мощность по кадрам _ENV_HOP_SEC (блоками по memmap), сглаженная скользящим средним."""
+    hop = int(sr * _ENV_HOP_SEC)
+    n = len(samples) // hop
+    env = np.empty((n,), np.float32)
+    for a in range(0, n, _ENV_BLOCK_HOPS):
+        b = min(n, a + _ENV_BLOCK_HOPS)
+        x = np.asarray(samples[a * hop: b * hop], dtype=np.float32).reshape(b - a, hop)
+        env[a:b] = np.mean(x * x, axis=1)
+    if n >= _ENV_SMOOTH_HOPS:
+        env = np.convolve(env, np.ones(_ENV_SMOOTH_HOPS, np.float32) / _ENV_SMOOTH_HOPS, mode="same")
+    return env
+
+def _fixed_windows(samples: np.ndarray, sr: int, total_sec: float, win: float, ovl: float, snap: float) -> List[SpeechSeg]:
+    """
+    Окна по win секунд с overlap; при snap > 0 каждый рез сдвигается в самую тихую
+    точку огибающей в пределах ±snap от номинального (окно может стать до win + snap).
+    """
+    env = _energy_envelope(samples, sr) if snap > 0 else None
     segs: List[SpeechSeg] = []
     cur = 0.0
     while cur < total_sec:
         end = min(cur + win, total_sec)
+        if env is not None and end < total_sec:
+            # не ближе cur + ovl: следующее окно обязано сдвинуться вперёд
+            # ceil: округление вниз могло вернуть рез ровно в cur + ovl — окно без продвижения
+            lo = int(np.ceil(max(end - snap, cur + ovl + _ENV_HOP_SEC) / _ENV_HOP_SEC - 1e-6))
+            hi = min(int((end + snap) / _ENV_HOP_SEC), len(env) - 1)
+            if lo <= hi:
+                end = min(total_sec, (lo + int(np.argmin(env[lo:hi + 1]))) * _ENV_HOP_SEC)
         segs.append(SpeechSeg(cur, end))
         if end >= total_sec:
             break
         cur = end - ovl
+    return segs
+
+def _fixed_windows_for(wav16k: str, win: float, ovl: float, snap: float) -> tuple[List[SpeechSeg], float]:
+    with pcm.open_pcm(wav16k) as store:
+        return _fixed_windows(store.samples, store.sample_rate, store.duration, win, ovl, snap), store.duration
+
+async def segment_fixed(audio_path: str) -> tuple[str, List[dict]]:
+    """
+    Нарезка на окна фиксированной длины, например 30с, с overlap;
+    резы притягиваются к паузам (FIXED_SNAP_SEC), чтобы не рвать слова.
+    """
+    wav16k = await prepare_pcm(audio_path, threads=settings.ffmpeg_threads)
+
+    win = float(getattr(settings, "fixed_window_sec", 30))
+    ovl = float(getattr(settings, "fixed_overlap_sec", 5))
+    snap = float(getattr(settings, "fixed_snap_sec", 0) or 0)
+    segs, total_sec = await run_inference(_fixed_windows_for, wav16k, win, ovl, snap, name="fixed_snap")
 
     chunks = [{
         "speaker": "SPEECH",
@@ -170,6 +376,6 @@ async def segment_fixed(audio_path: str) -> tuple[str, List[dict]]:
         "file_path": wav16k
     } for s in segs]
 
-    log.info("FIXED: %d segments (win=%.1fs, ovl=%.1fs) for %.1fs audio",
-             len(chunks), win, ovl, total_sec)
+    log.info("FIXED: %d segments (win=%.1fs, ovl=%.1fs, snap=%.1fs) for %.1fs audio",
+             len(chunks), win, ovl, snap, total_sec)
     return wav16k, chunks
@@ -0,0 +1,72 @@
+# app/services/pipeline/vad_energy.py
+"""
+Векторизованный VAD на NumPy (VAD_BACKEND=energy) — альтернатива покадровому webrtcvad.
+
+PCM режется на кадры VAD_FRAME_MS блоками по _BLOCK_FRAMES (матрица-view
+над memmap, без копии всего файла), по кадрам считаются лог-энергия (dBFS) и доля
+пересечений нуля (ZCR). Гистерезис: кадр «активный», если громче
+VAD_ENERGY_LOW_DB; серия активных кадров — речь, если в ней есть хотя бы один
+«сильный» кадр (громче VAD_ENERGY_HIGH_DB и ZCR < VAD_ENERGY_ZCR_MAX: шипение
+и шум дают высокий ZCR). Склейка серий, продление на VAD_ENERGY_HANGOVER_MS и
+min_silence/min_speech — общие с webrtc, см. vad._regions_from_runs.
+"""
+from __future__ import annotations
+
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+
+# кадров в одном блоке: память O(блок), а не O(файл)
+_BLOCK_FRAMES = 8192
+_EPS = 1e-10
+
+
+def _frame_matrix(samples: np.ndarray, frame_len: int, a: int, b: int) -> np.ndarray:
+    """Кадры [a, b) как (b-a, frame_len) float32 в [-1, 1]."""
+    # reshape среза memmap — view с шагом frame_len, копия появляется только при astype
+    x = np.asarray(samples[a * frame_len: b * frame_len]).reshape(b - a, frame_len)
+    scale = 1.0 / 32768.0 if x.dtype == np.int16 else 1.0
+    return x.astype(np.float32) * scale
+
+
+def frame_features(x: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Матрица кадров → (log_energy_db, zcr) по кадрам."""
+    log_e = 10.0 * np.log10(np.mean(x * x, axis=1) + _EPS)
+    sign = np.signbit(x)
+    zcr = np.count_nonzero(sign[:, 1:] != sign[:, :-1], axis=1) / float(max(1, x.shape[1] - 1))
+    return log_e, zcr
+
+
+def active_runs(
+    samples: np.ndarray,
+    sr: int,
+    frame_ms: int,
+    start_frame: int = 0,
+    end_frame: Optional[int] = None,
+) -> Iterator[Tuple[int, int, bool]]:
+    """
+    Серии активных кадров (start, end, strong) в [start_frame, end_frame), индексы глобальные.
+    strong — в серии есть «сильный» кадр; серии, касающиеся границы блока, склеивает вызывающий.
+    """
+    high_db = float(getattr(settings, "vad_energy_high_db", -35.0))
+    low_db = float(getattr(settings, "vad_energy_low_db", -45.0))
+    zcr_max = float(getattr(settings, "vad_energy_zcr_max", 0.35))
+
+    frame_len = int(sr * frame_ms / 1000)
+    n = samples.shape[0] // frame_len
+    stop = n if end_frame is None else min(n, end_frame)
+    for a in range(start_frame, stop, _BLOCK_FRAMES):
+        b = min(stop, a + _BLOCK_FRAMES)
+        log_e, zcr = frame_features(_frame_matrix(samples, frame_len, a, b))
+        active = log_e > low_db
+        strong = active & (log_e > high_db) & (zcr < zcr_max)
+
+        edges = np.diff(np.concatenate(([0], active.astype(np.int8), [0])))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1)
+        cs = np.concatenate(([0], np.cumsum(strong)))
+        has_strong = (cs[ends] - cs[starts]) > 0
+        for s, e, st in zip(starts.tolist(), ends.tolist(), has_strong.tolist()):
+            yield a + s, a + e, st
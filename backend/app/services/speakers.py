@@ -0,0 +1,214 @@
+"""
+Голосовые профили спикеров между митингами.
+
+Диаризация отдаёт центроид-эмбеддинг на каждый speaker-label транскрипта
+(mfg_speaker_embedding). Ближайший профиль пользователя ищется по pgvector
+(HNSW, косинусное расстояние); при расстоянии < SPEAKER_MATCH_THRESHOLD
+MfgSpeaker получает display_name/color профиля. Enrollment — привязать
+спикера транскрипта к новому или существующему профилю (центроид усредняется).
+"""
+from __future__ import annotations
+
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.logger import get_logger
+from app.db.models import (
+    SPEAKER_EMBEDDING_DIM, MfgSpeaker, MfgSpeakerEmbedding, MfgSpeakerProfile, MfgTranscript,
+)
+
+log = get_logger(__name__)
+
+
+def _normalize(vec) -> Optional[List[float]]:
+    v = np.asarray(vec, dtype=np.float32).reshape(-1)
+    if v.shape[0] != SPEAKER_EMBEDDING_DIM or not np.all(np.isfinite(v)):
+        return None
+    n = float(np.linalg.norm(v))
+    if n <= 0:
+        return None
+    return (v / n).tolist()
+
+
+async def save_embeddings(session: AsyncSession, transcript_id: int, centroids: Dict[str, np.ndarray]) -> int:
+    """UPSERT центроидов спикеров транскрипта; битые/пустые эмбеддинги пропускаем."""
+    payload = []
+    for speaker, vec in centroids.items():
+        emb = _normalize(vec)
+        if emb is None:
+            log.debug("Skip speaker embedding %s (tid=%s): empty or wrong dim", speaker, transcript_id)
+            continue
+        payload.append(dict(transcript_id=transcript_id, speaker=speaker, embedding=emb))
+    if not payload:
+        return 0
+    stmt = pg_insert(MfgSpeakerEmbedding).values(payload)
+    stmt = stmt.on_conflict_do_update(
+        constraint="uq_mfg_speaker_embedding_tid_speaker",
+        set_=dict(embedding=stmt.excluded.embedding, profile_id=None, distance=None, enrolled=False),
+    )
+    await session.execute(stmt)
+    await session.commit()
+    return len(payload)
+
+
+async def _nearest_profile(session: AsyncSession, user_id: Optional[int], embedding) -> Optional[tuple]:
+    # профили — только владельца транскрипта; без владельца чужие имена не подставляем
+    if user_id is None:
+        return None
+    # HNSW применяет WHERE уже после обхода индекса и может не найти ни одного профиля
+    # пользователя; профилей у пользователя немного — точный поиск по его подмножеству
+    own = (
+        select(MfgSpeakerProfile.id, MfgSpeakerProfile.embedding)
+        .where(MfgSpeakerProfile.user_id == user_id)
+        .cte("own_profiles")
+        .prefix_with("MATERIALIZED")
+    )
+    dist = own.c.embedding.cosine_distance(embedding)
+    row = (await session.execute(select(own.c.id, dist.label("distance")).order_by(dist).limit(1))).first()
+    if row is None:
+        return None
+    profile = await session.get(MfgSpeakerProfile, row[0])
+    return (profile, float(row[1])) if profile is not None else None
+
+
+async def _fill_speaker(session: AsyncSession, transcript_id: int, speaker: str, profile: MfgSpeakerProfile, force: bool) -> None:
+    sp = (await session.execute(
+        select(MfgSpeaker).where(MfgSpeaker.transcript_id == transcript_id, MfgSpeaker.speaker == speaker)
+    )).scalars().first()
+    if sp is None:
+        session.add(MfgSpeaker(
+            transcript_id=transcript_id, speaker=speaker,
+            display_name=profile.display_name, color=profile.color,
+        ))
+        return
+    # имя, выставленное руками, автосопоставление не перетирает
+    if force or not sp.display_name:
+        sp.display_name = profile.display_name
+        if profile.color and (force or not sp.color):
+            sp.color = profile.color
+        session.add(sp)
+
+
+async def match_transcript(session: AsyncSession, transcript_id: int, threshold: Optional[float] = None) -> List[dict]:
+    """
+    Сопоставить спикеров транскрипта с профилями его владельца.
+    Возвращает [{speaker, profile_id, display_name, distance, matched}] для всех спикеров.
+    """
+    thr = float(threshold if threshold is not None else getattr(settings, "speaker_match_threshold", 0.35))
+    tr = await session.get(MfgTranscript, transcript_id)
+    user_id = tr.user_id if tr else None
+
+    rows = (await session.execute(
+        select(MfgSpeakerEmbedding)
+        .where(MfgSpeakerEmbedding.transcript_id == transcript_id)
+        .order_by(MfgSpeakerEmbedding.speaker.asc())
+    )).scalars().all()
+
+    out: List[dict] = []
+    for row in rows:
+        if row.enrolled and row.profile_id is not None:
+            # ручную привязку (enroll) автосопоставление не пересматривает
+            profile = await session.get(MfgSpeakerProfile, row.profile_id)
+            out.append(dict(
+                speaker=row.speaker,
+                profile_id=row.profile_id,
+                display_name=profile.display_name if profile else None,
+                distance=round(row.distance, 4) if row.distance is not None else None,
+                matched=True,
+            ))
+            continue
+        hit = await _nearest_profile(session, user_id, row.embedding)
+        matched = hit is not None and hit[1] < thr
+        row.profile_id = hit[0].id if matched else None
+        row.distance = hit[1] if hit else None
+        session.add(row)
+        if matched:
+            await _fill_speaker(session, transcript_id, row.speaker, hit[0], force=False)
+        out.append(dict(
+            speaker=row.speaker,
+            profile_id=hit[0].id if hit else None,
+            display_name=hit[0].display_name if hit else None,
+            distance=round(hit[1], 4) if hit else None,
+            matched=matched,
+        ))
+    await session.commit()
+    log.info("Speaker match tid=%s: %d/%d matched (thr=%.2f)", transcript_id, sum(m["matched"] for m in out), len(out), thr)
+    return out
+
+
+async def list_matches(session: AsyncSession, transcript_id: int) -> List[dict]:
+    """Сохранённый результат сопоставления (без пересчёта и записи)."""
+    rows = (await session.execute(
+        select(MfgSpeakerEmbedding, MfgSpeakerProfile)
+        .outerjoin(MfgSpeakerProfile, MfgSpeakerProfile.id == MfgSpeakerEmbedding.profile_id)
+        .where(MfgSpeakerEmbedding.transcript_id == transcript_id)
+        .order_by(MfgSpeakerEmbedding.speaker.asc())
+    )).all()
+    return [
+        dict(
+            speaker=row.speaker,
+            profile_id=row.profile_id,
+            display_name=profile.display_name if profile else None,
+            distance=round(row.distance, 4) if row.distance is not None else None,
+            matched=row.profile_id is not None,
+        )
+        for row, profile in rows
+    ]
+
+
+async def enroll(
+    session: AsyncSession,
+    transcript_id: int,
+    speaker: str,
+    display_name: Optional[str] = None,
+    color: Optional[str] = None,
+    profile_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+) -> MfgSpeakerProfile:
+    """
+    Привязать спикера транскрипта к профилю: profile_id → центроид профиля усредняется
+    с эмбеддингом спикера, иначе создаётся новый профиль с display_name.
+    """
+    row = (await session.execute(
+        select(MfgSpeakerEmbedding).where(
+            MfgSpeakerEmbedding.transcript_id == transcript_id, MfgSpeakerEmbedding.speaker == speaker
+        )
+    )).scalars().first()
+    if row is None:
+        raise LookupError(f"No embedding for speaker {speaker!r} in transcript {transcript_id}")
+    emb = np.asarray(row.embedding, dtype=np.float32)
+
+    if profile_id is not None:
+        profile = await session.get(MfgSpeakerProfile, profile_id)
+        if profile is None or (user_id is not None and profile.user_id != user_id):
+            raise LookupError(f"Speaker profile {profile_id} not found")
+        n = int(profile.n_samples or 1)
+        profile.embedding = _normalize((np.asarray(profile.embedding, dtype=np.float32) * n + emb) / (n + 1))
+        profile.n_samples = n + 1
+        if display_name:
+            profile.display_name = display_name
+        if color:
+            profile.color = color
+    else:
+        if not display_name:
+            raise ValueError("display_name is required for a new profile")
+        profile = MfgSpeakerProfile(
+            user_id=user_id, display_name=display_name, color=color, embedding=_normalize(emb), n_samples=1,
+        )
+    session.add(profile)
+    await session.flush()
+
+    row.profile_id = profile.id
+    row.distance = 0.0 if profile_id is None else row.distance
+    row.enrolled = True
+    session.add(row)
+    await _fill_speaker(session, transcript_id, speaker, profile, force=True)
+    await session.commit()
+    await session.refresh(profile)
+    log.info("Speaker enrolled: tid=%s %s → profile %s (%s)", transcript_id, speaker, profile.id, profile.display_name)
+    return profile
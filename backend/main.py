@@ -1,3 +1,5 @@
+import asyncio
+
 import uvicorn
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
@@ -10,7 +12,11 @@ from app.api.v1 import meetings as meetings_router
 from app.api.v2 import segment as seg_v2
 from app.api.v2 import transcripts as transcripts_v2
 from app.api.v2 import embedsum as embedsum_v2
+from app.api.v2 import speakers as speakers_v2
 from app.db.session import async_engine
+from app.services import ollama
+from app.services.pipeline import asr_pool, executor as inference_executor
+from app.services.pipeline.registry import whisper_registry
 from app.core.logger import get_logger
 from app.core.errors import install_exception_handlers
 from app.core.config import settings
@@ -56,6 +62,7 @@ app.include_router(meetings_router.router, prefix="/api/v1/meetings", tags=["mee
 app.include_router(seg_v2.router, prefix="/api/v2/segment", tags=["v2-segmentation"])
 app.include_router(transcripts_v2.router, prefix="/api/v2/transcripts", tags=["v2-transcripts"])
 app.include_router(embedsum_v2.router, prefix="/api/v2", tags=["v2"])
+app.include_router(speakers_v2.router, prefix="/api/v2/speakers", tags=["v2-speakers"])
 
 
 # -------------------------------
@@ -64,11 +71,20 @@ app.include_router(embedsum_v2.router, prefix="/api/v2", tags=["v2"])
 @app.on_event("startup")
 async def startup():
     log.info("Application startup")
+    await ollama.startup()
+    app.state.whisper_sweeper = asyncio.create_task(whisper_registry.idle_sweeper())
     # Если Alembic используется, таблицы создаются через миграции
 
 @app.on_event("shutdown")
 async def shutdown():
     log.info("Application shutdown")
+    sweeper = getattr(app.state, "whisper_sweeper", None)
+    if sweeper is not None:
+        sweeper.cancel()
+        await asyncio.gather(sweeper, return_exceptions=True)
+    inference_executor.shutdown()
+    asr_pool.shutdown()
+    await ollama.shutdown()
     await async_engine.dispose()
 
 
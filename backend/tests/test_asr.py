@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+from typing import List, Optional, Tuple
+
+import pytest
+
+from app.services.pipeline import asr
+
+PHRASE_EVERY = 4.0
+PHRASE_LEN = 3.5
+
+
+def _phrases_in(pos: float, block_end: float) -> List[Tuple[float, float, str]]:
+    """«Модель»: фраза k звучит на [4k, 4k + 3.5]; блок видит начатые в нём фразы, хвост обрезан концом блока."""
+    out = []
+    k = int(pos // PHRASE_EVERY)
+    while k * PHRASE_EVERY < block_end:
+        s, e = k * PHRASE_EVERY, k * PHRASE_EVERY + PHRASE_LEN
+        if s >= pos - 1e-6:
+            out.append((s, min(e, block_end), f"p{k} "))
+        k += 1
+    return out
+
+
+@pytest.fixture
+def stub_model(monkeypatch):
+    calls: List[Tuple[float, float, Optional[str]]] = []
+
+    def block(wav_path, start_ts, end_ts, language="ru", model=None, initial_prompt=None):
+        calls.append((start_ts, end_ts, initial_prompt))
+        return _phrases_in(start_ts, end_ts)
+
+    async def run_inline(fn, *args, name=None, **kwargs):
+        return fn(*args, **kwargs)
+
+    monkeypatch.setattr(asr, "_transcribe_block", block)
+    monkeypatch.setattr(asr, "run_inference", run_inline)
+    monkeypatch.setattr(asr.settings, "asr_longform_block_sec", 30.0, raising=False)
+    monkeypatch.setattr(asr.settings, "asr_longform_carry_sec", 5.0, raising=False)
+    return calls
+
+
+async def _collect(**kwargs):
+    out = []
+    async for covered, segs in asr.transcribe_longform("a.wav", **kwargs):
+        out.append((covered, segs))
+    return out
+
+
+def test_longform_blocks_drop_carry_and_chain_prompt(stub_model, run_async):
+    blocks = run_async(_collect(start_ts=0.0, end_ts=70.0))
+
+    # фраза у конца блока (ближе carry) уходит в следующий блок, который начинается с конца оставленной
+    assert [(s, e) for s, e, _ in stub_model] == [(0.0, 30.0), (23.5, 53.5), (47.5, 70.0)]
+    assert [covered for covered, _ in blocks] == [23.5, 47.5, 70.0]
+
+    texts = [t for _, segs in blocks for _, _, t in segs]
+    assert texts == [f"p{k} " for k in range(18)]  # каждая фраза ровно один раз
+    ends = [e for _, segs in blocks for _, e, _ in segs]
+    assert ends == sorted(ends) and max(ends) <= 70.0
+
+    prompts = [p for _, _, p in stub_model]
+    assert prompts[0] is None
+    assert prompts[1].endswith("p5 ") and prompts[2].endswith("p11 ")
+
+
+def test_longform_resumes_from_saved_position(stub_model, run_async):
+    blocks = run_async(_collect(start_ts=0.0, end_ts=70.0, resume_from=40.0))
+
+    assert stub_model[0][:2] == (40.0, 70.0)
+    assert stub_model[0][2] is None
+    assert [t for _, segs in blocks for _, _, t in segs][0] == "p10 "
+
+
+def test_longform_block_without_phrase_end_is_taken_whole(monkeypatch, stub_model, run_async):
+    def one_long_phrase(wav_path, start_ts, end_ts, language="ru", model=None, initial_prompt=None):
+        stub_model.append((start_ts, end_ts, initial_prompt))
+        return [(start_ts, end_ts, "long ")]
+
+    monkeypatch.setattr(asr, "_transcribe_block", one_long_phrase)
+    blocks = run_async(_collect(start_ts=0.0, end_ts=45.0))
+
+    assert [covered for covered, _ in blocks] == [30.0, 45.0]
+    assert [(s, e) for s, e, _ in stub_model] == [(0.0, 30.0), (30.0, 45.0)]
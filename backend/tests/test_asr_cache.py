@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import time
+import wave
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import numpy as np
+import pytest
+from sqlalchemy import select
+
+from app.db import models
+from app.services.pipeline import asr_cache
+
+SR = 16000
+
+
+def _write_wav(path: Path, samples: np.ndarray) -> None:
+    with wave.open(str(path), "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(SR)
+        wf.writeframes(samples.astype("<i2").tobytes())
+
+
+def _audio(sec: float, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return rng.integers(-3000, 3000, int(sec * SR), dtype=np.int16)
+
+
+def test_make_params():
+    assert asr_cache.make_params(2, False) == "beam=2;batch=0"
+    assert asr_cache.make_params(5, True) == "beam=5;batch=1"
+
+
+def test_same_window_gives_same_key_across_files(tmp_path):
+    speech = _audio(3.0)
+    # одно и то же окно в «файле режима vad» (с 1 с) и «файле режима fixed» (с 0 с)
+    a, b = tmp_path / "vad.wav", tmp_path / "fixed.wav"
+    _write_wav(a, np.concatenate([np.zeros(SR, np.int16), speech]))
+    _write_wav(b, speech)
+
+    params = asr_cache.make_params(2, False)
+    (ka,) = asr_cache.window_keys(str(a), [(1.0, 4.0)], "small", "ru", params)
+    (kb,) = asr_cache.window_keys(str(b), [(0.0, 3.0)], "small", "ru", params)
+    assert ka == kb
+    assert len(ka) == 64
+    assert asr_cache.window_keys(str(b), [(0.0, 3.0)], "small", "ru", params) == [kb]
+
+
+@pytest.mark.parametrize(
+    "model,language,params",
+    [
+        ("medium", "ru", "beam=2;batch=0"),
+        ("small", "en", "beam=2;batch=0"),
+        ("small", "ru", "beam=5;batch=0"),
+        ("small", "ru", "beam=2;batch=1"),
+    ],
+)
+def test_key_depends_on_recognition_params(tmp_path, model, language, params):
+    wav = tmp_path / "a.wav"
+    _write_wav(wav, _audio(2.0))
+    (base,) = asr_cache.window_keys(str(wav), [(0.0, 2.0)], "small", "ru", "beam=2;batch=0")
+    (other,) = asr_cache.window_keys(str(wav), [(0.0, 2.0)], model, language, params)
+    assert base != other
+
+
+def test_key_depends_on_audio(tmp_path):
+    wav = tmp_path / "a.wav"
+    _write_wav(wav, np.concatenate([_audio(2.0, seed=1), _audio(2.0, seed=2)]))
+    k1, k2, k3 = asr_cache.window_keys(str(wav), [(0.0, 2.0), (2.0, 4.0), (0.0, 2.01)], "small", "ru", "p")
+    assert len({k1, k2, k3}) == 3
+
+
+def test_store_then_lookup(session_maker, run_async):
+    async def go():
+        async with session_maker() as s:
+            stored = await asr_cache.store(s, [("k1", "привет"), ("k2", "  "), ("k3", "мир")], "small", "ru", "p")
+        async with session_maker() as s:
+            found = await asr_cache.lookup(s, ["k1", "k2", "k3", "k4", "k1"])
+        async with session_maker() as s:
+            hits = dict((await s.execute(select(models.MfgAsrCache.key, models.MfgAsrCache.hits))).all())
+        return stored, found, hits
+
+    stored, found, hits = run_async(go())
+    assert stored == 2  # пустой текст не кэшируется
+    assert found == {"k1": "привет", "k3": "мир"}
+    assert hits == {"k1": 1, "k3": 1}
+
+
+def test_evict_is_throttled_and_drops_oldest(session_maker, run_async, monkeypatch):
+    monkeypatch.setattr(asr_cache.settings, "asr_cache_max_entries", 3, raising=False)
+    base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+    async def seed():
+        async with session_maker() as s:
+            for i in range(5):
+                s.add(models.MfgAsrCache(
+                    key=f"k{i}", model="small", language="ru", params="p", text=f"t{i}",
+                    hits=0, created_at=base, last_hit_at=base + timedelta(minutes=i),
+                ))
+            await s.commit()
+
+    async def evict():
+        async with session_maker() as s:
+            return await asr_cache._evict(s)
+
+    async def keys():
+        async with session_maker() as s:
+            return sorted((await s.execute(select(models.MfgAsrCache.key))).scalars().all())
+
+    run_async(seed())
+
+    monkeypatch.setattr(asr_cache, "_last_evict", time.monotonic())
+    assert run_async(evict()) == 0  # недавно проверяли — count(*) не гоняем
+    assert len(run_async(keys())) == 5
+
+    monkeypatch.setattr(asr_cache, "_last_evict", time.monotonic() - asr_cache._EVICT_EVERY_SEC - 1.0)
+    assert run_async(evict()) == 2
+    assert run_async(keys()) == ["k2", "k3", "k4"]
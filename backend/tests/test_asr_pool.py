@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import os
+import wave
+from pathlib import Path
+
+import numpy as np
+
+from app.services.pipeline import asr_pool, pcm
+
+SR = 16000
+
+
+def _write_wav(path: Path, samples: np.ndarray) -> None:
+    tmp = path.with_suffix(".tmp")
+    with wave.open(str(tmp), "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(SR)
+        wf.writeframes(samples.astype("<i2").tobytes())
+    os.replace(tmp, path)  # как ffmpeg во временный файл: новый inode под тем же именем
+
+
+def _release_all() -> None:
+    while asr_pool._held:
+        path, _ = asr_pool._held.popitem(last=False)
+        pcm.release(path)
+
+
+def test_worker_store_reuses_open_file(tmp_path):
+    wav = tmp_path / "a.wav"
+    _write_wav(wav, np.full(SR, 100, dtype=np.int16))
+    try:
+        first = asr_pool._worker_store(str(wav))
+        assert asr_pool._worker_store(str(wav)) is first
+        assert first.refs == 1
+    finally:
+        _release_all()
+    assert not pcm.is_open(str(wav))
+
+
+def test_worker_store_reopens_rewritten_file(tmp_path):
+    wav = tmp_path / "a.wav"
+    _write_wav(wav, np.full(SR, 100, dtype=np.int16))
+    try:
+        old = asr_pool._worker_store(str(wav))
+        assert old.num_samples == SR
+
+        _write_wav(wav, np.full(2 * SR, 7, dtype=np.int16))
+        st = os.stat(wav)
+        os.utime(wav, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+
+        new = asr_pool._worker_store(str(wav))
+        assert new is not old
+        assert new.num_samples == 2 * SR
+        assert int(new.window_int16(0.0, 0.1)[0]) == 7
+        assert old.refs == 0  # старое хранилище отпущено и закрыто
+        assert new.refs == 1
+    finally:
+        _release_all()
+    assert not pcm.is_open(str(wav))
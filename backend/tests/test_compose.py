@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import pytest
+from sqlalchemy import select
+
+from app.db import models
+from app.services.pipeline import compose
+
+
+async def _transcript_with_chunks(session_maker, source: str, wav_path: str) -> int:
+    async with session_maker() as session:
+        tr = models.MfgTranscript(meeting_id=1, filename="a.mp3", status="diarization_done", file_path=source, user_id=1)
+        session.add(tr)
+        await session.flush()
+        for start, end in [(0.0, 5.0), (5.0, 10.0)]:
+            session.add(models.MfgDiarization(
+                transcript_id=tr.id, speaker="SPEECH", start_ts=start, end_ts=end, file_path=wav_path, mode="vad",
+            ))
+        await session.commit()
+        return tr.id
+
+
+def test_ensure_pcm_keeps_existing_file(tmp_path, session_maker, run_async, monkeypatch):
+    wav = tmp_path / "cached.wav"
+    wav.write_bytes(b"RIFF")
+
+    async def fail(_):
+        raise AssertionError("prepare_pcm must not run for an existing file")
+
+    monkeypatch.setattr(compose, "prepare_pcm", fail)
+    tid = run_async(_transcript_with_chunks(session_maker, str(tmp_path / "a.mp3"), str(wav)))
+
+    async def go():
+        async with session_maker() as session:
+            return await compose._ensure_pcm(session, tid, str(wav))
+
+    assert run_async(go()) == str(wav)
+
+
+def test_ensure_pcm_rederives_evicted_file(tmp_path, session_maker, run_async, monkeypatch):
+    source = tmp_path / "a.mp3"
+    source.write_bytes(b"ID3")
+    evicted = str(tmp_path / "cache" / "old.wav")
+    fresh = tmp_path / "cache" / "new.wav"
+    calls = []
+
+    async def prepare(path):
+        calls.append(path)
+        fresh.parent.mkdir(exist_ok=True)
+        fresh.write_bytes(b"RIFF")
+        return str(fresh)
+
+    monkeypatch.setattr(compose, "prepare_pcm", prepare)
+    tid = run_async(_transcript_with_chunks(session_maker, str(source), evicted))
+
+    async def go():
+        async with session_maker() as session:
+            path = await compose._ensure_pcm(session, tid, evicted)
+        async with session_maker() as session:
+            rows = (await session.execute(
+                select(models.MfgDiarization.file_path).where(models.MfgDiarization.transcript_id == tid)
+            )).scalars().all()
+        return path, rows
+
+    path, rows = run_async(go())
+    assert path == str(fresh)
+    assert calls == [str(source)]
+    assert rows == [str(fresh), str(fresh)]
+
+
+def test_ensure_pcm_without_source_raises(tmp_path, session_maker, run_async):
+    missing = str(tmp_path / "gone.wav")
+    tid = run_async(_transcript_with_chunks(session_maker, str(tmp_path / "gone.mp3"), missing))
+
+    async def go():
+        async with session_maker() as session:
+            await compose._ensure_pcm(session, tid, missing)
+
+    with pytest.raises(FileNotFoundError):
+        run_async(go())
+
+
+def _write_wav(path, seconds: float) -> None:
+    import wave
+
+    with wave.open(str(path), "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(16000)
+        wf.writeframes(b"\0\0" * int(seconds * 16000))
+
+
+def test_longform_resumes_after_last_saved_segment(tmp_path, session_maker, run_async, monkeypatch):
+    from types import SimpleNamespace
+
+    wav = tmp_path / "full.wav"
+    _write_wav(wav, 1.0)
+    tid = run_async(_transcript_with_chunks(session_maker, str(tmp_path / "a.mp3"), str(wav)))
+
+    async def seed():
+        async with session_maker() as session:
+            for s, e, mode in [(0.0, 12.0, "full"), (12.0, 40.0, "full"), (40.0, 55.0, "vad")]:
+                session.add(models.MfgSegment(transcript_id=tid, start_ts=s, end_ts=e, text="x", mode=mode))
+            await session.commit()
+
+    run_async(seed())
+
+    resumes = []
+
+    async def longform(wav_path, start, end, language="ru", model=None, resume_from=None):
+        resumes.append(resume_from)
+        yield 55.0, [(40.0, 47.0, " a "), (47.0, 54.0, "  ")]
+        yield end, [(55.0, 60.0, "b")]
+
+    persisted = []
+
+    async def persist(session, transcript_id, items, mode):
+        persisted.extend((it["start_ts"], it["end_ts"], it["text"], mode) for it in items)
+        return len(items)
+
+    monkeypatch.setattr(compose, "transcribe_longform", longform)
+    monkeypatch.setattr(compose, "_persist_segments", persist)
+    monkeypatch.setattr(compose.gate.settings, "asr_gate_modes", "", raising=False)
+
+    chunk = SimpleNamespace(start_ts=0.0, end_ts=60.0, speaker=None)
+    progress = compose._Progress(60.0, None)
+
+    async def go():
+        async with session_maker() as session:
+            return await compose._longform_file(session, tid, str(wav), [chunk], "ru", "full", None, {}, progress)
+
+    saved = run_async(go())
+
+    assert resumes == [40.0]  # сегмент режима vad точку продолжения не сдвигает
+    assert saved == 2
+    assert persisted == [(40.0, 47.0, "a", "full"), (55.0, 60.0, "b", "full")]
+    assert progress.done == pytest.approx(60.0)
+
+
+def test_last_segment_end_is_scoped_to_chunk_and_mode(tmp_path, session_maker, run_async):
+    tid = run_async(_transcript_with_chunks(session_maker, str(tmp_path / "a.mp3"), str(tmp_path / "a.wav")))
+
+    async def go():
+        async with session_maker() as session:
+            for s, e, mode in [(0.0, 10.0, "full"), (100.0, 130.0, "full"), (20.0, 50.0, "fixed")]:
+                session.add(models.MfgSegment(transcript_id=tid, start_ts=s, end_ts=e, text="x", mode=mode))
+            await session.commit()
+            return (
+                await compose._last_segment_end(session, tid, "full", 0.0, 60.0),
+                await compose._last_segment_end(session, tid, "full", 60.0, 90.0),
+                await compose._last_segment_end(session, tid, "fixed", 0.0, 60.0),
+            )
+
+    assert run_async(go()) == (10.0, None, 50.0)
@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from app.services.pipeline import diarization
+
+
+def _unit(*xs):
+    v = np.asarray(xs, dtype=np.float32)
+    return v / np.linalg.norm(v)
+
+
+@pytest.mark.parametrize(
+    "duration,chunk,overlap,expected",
+    [
+        (100.0, 600.0, 30.0, [(0.0, 100.0)]),
+        (600.0, 600.0, 30.0, [(0.0, 600.0)]),
+        (1500.0, 600.0, 30.0, [(0.0, 600.0), (570.0, 1170.0), (1140.0, 1500.0)]),
+    ],
+)
+def test_plan_chunks_cover_file_with_overlap(duration, chunk, overlap, expected):
+    windows = diarization._plan_chunks(duration, chunk, overlap)
+    assert windows == expected
+    assert windows[0][0] == 0.0 and windows[-1][1] == duration
+    for (_, e0), (s1, _) in zip(windows, windows[1:]):
+        assert e0 - s1 == pytest.approx(overlap)
+
+
+def test_stitch_links_same_voice_across_chunks():
+    a, b = _unit(1, 0, 0, 0), _unit(0, 1, 0, 0)
+    per_chunk = [
+        {"SPEAKER_00": a, "SPEAKER_01": b},
+        {"SPEAKER_00": _unit(0.05, 1, 0, 0), "SPEAKER_01": _unit(1, 0.05, 0, 0)},
+    ]
+    mapping, centroids = diarization._stitch_speakers(per_chunk, threshold=0.3)
+
+    assert mapping[0]["SPEAKER_00"] != mapping[0]["SPEAKER_01"]
+    assert mapping[1]["SPEAKER_01"] == mapping[0]["SPEAKER_00"]
+    assert mapping[1]["SPEAKER_00"] == mapping[0]["SPEAKER_01"]
+    assert set(centroids) == {mapping[0]["SPEAKER_00"], mapping[0]["SPEAKER_01"]}
+
+
+def test_stitch_keeps_in_chunk_labels_apart():
+    # pyannote развёл метки внутри чанка — даже похожие эмбеддинги не сливаются
+    a = _unit(1, 0, 0, 0)
+    per_chunk = [{"SPEAKER_00": a, "SPEAKER_01": _unit(1, 0.01, 0, 0)}, {"SPEAKER_00": a}]
+    mapping, _ = diarization._stitch_speakers(per_chunk, threshold=0.3)
+
+    assert mapping[0]["SPEAKER_00"] != mapping[0]["SPEAKER_01"]
+    assert mapping[1]["SPEAKER_00"] in mapping[0].values()
+
+
+def test_stitch_label_without_embedding_is_own_speaker():
+    per_chunk = [{"SPEAKER_00": _unit(1, 0, 0, 0), "SPEAKER_01": np.zeros(4, np.float32)}]
+    mapping, centroids = diarization._stitch_speakers(per_chunk, threshold=0.3)
+
+    assert mapping[0]["SPEAKER_00"] != mapping[0]["SPEAKER_01"]
+    assert mapping[0]["SPEAKER_01"] not in centroids
+
+
+def test_split_overlaps_cuts_at_midpoint():
+    windows = [(0.0, 600.0), (570.0, 1000.0)]
+    per_chunk_turns = [
+        [(10.0, 20.0, "A"), (560.0, 600.0, "A")],
+        [(570.0, 590.0, "X"), (590.0, 700.0, "Y")],
+    ]
+    mapping = [{"A": 1}, {"X": 1, "Y": 2}]
+    turns = diarization._split_overlaps(windows, per_chunk_turns, mapping, duration=1000.0)
+
+    assert turns == [
+        (10.0, 20.0, 1),
+        (560.0, 585.0, 1),   # чанк 0 — до середины перекрытия
+        (585.0, 590.0, 1),   # чанк 1 — после
+        (590.0, 700.0, 2),
+    ]
+
+
+def test_split_overlaps_drops_turns_outside_own_half():
+    windows = [(0.0, 600.0), (570.0, 1000.0)]
+    per_chunk_turns = [[(590.0, 600.0, "A")], [(571.0, 580.0, "X")]]
+    turns = diarization._split_overlaps(windows, per_chunk_turns, [{"A": 1}, {"X": 2}], duration=1000.0)
+    assert turns == []
+
+
+class _FakeStore:
+    sample_rate = 16000
+
+    def __init__(self, samples):
+        self.samples = samples
+        self.reads = []
+
+    @property
+    def num_samples(self):
+        return self.samples.shape[0]
+
+    def window_int16(self, start, end):
+        a, b = int(round(start * self.sample_rate)), int(round(end * self.sample_rate))
+        self.reads.append(b - a)
+        return self.samples[a:b]
+
+
+def test_waveform_is_filled_blockwise(monkeypatch):
+    monkeypatch.setattr(diarization, "_WAVEFORM_BLOCK_SEC", 1.0)
+    samples = (np.arange(5 * 16000) % 2000 - 1000).astype(np.int16)
+    store = _FakeStore(samples)
+
+    wave = diarization._waveform(store, 0.5, 4.25)
+
+    assert wave.shape == (1, int(3.75 * 16000))
+    np.testing.assert_allclose(wave[0].numpy(), samples[8000:68000] / 32768.0, rtol=0, atol=1e-7)
+    assert max(store.reads) <= 16000
+
+
+def test_borrowed_pipelines_are_exclusive(monkeypatch):
+    import threading
+
+    created = []
+    monkeypatch.setattr(diarization, "_idle", [])
+    monkeypatch.setattr(diarization, "_instances", 0)
+    monkeypatch.setattr(diarization.settings, "diar_parallel_chunks", 2, raising=False)
+    monkeypatch.setattr(diarization, "get_pipeline", lambda: created.append("main") or "main")
+    monkeypatch.setattr(diarization, "_load_pipeline_sync", lambda: created.append("extra") or "extra")
+
+    with diarization._borrow_pipeline() as a, diarization._borrow_pipeline() as b:
+        assert {a, b} == {"main", "extra"}
+        third = []
+        t = threading.Thread(target=lambda: third.append(diarization._borrow_pipeline().__enter__()))
+        t.start()
+        t.join(0.2)
+        assert t.is_alive()  # лимит DIAR_PARALLEL_CHUNKS: ждёт свободный экземпляр
+    t.join(1.0)
+    assert third and third[0] in {"main", "extra"}
+    assert created == ["main", "extra"]
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+from typing import List
+
+import httpx
+import pytest
+
+from app.services import ollama
+from app.services.pipeline import embeddings
+
+
+class _Resp:
+    def __init__(self, data):
+        self._data = data
+
+    def json(self):
+        return self._data
+
+
+def _status_error(code: int = 500) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "http://ollama/api/embed")
+    return httpx.HTTPStatusError("boom", request=request, response=httpx.Response(code, request=request))
+
+
+def _fake_post(calls: List[List[str]], bad: str = "", error=_status_error):
+    async def post(path, name, json=None, **kwargs):
+        texts = json["input"]
+        calls.append(list(texts))
+        if bad in texts:
+            raise error()
+        return _Resp({"embeddings": [[float(len(t))] for t in texts]})
+
+    return post
+
+
+def test_batches_respect_item_budget():
+    assert list(embeddings._batches(["a"] * 5, max_items=2, max_chars=100)) == [[0, 1], [2, 3], [4]]
+
+
+def test_batches_respect_char_budget():
+    texts = ["aaaa", "bbbb", "cc", "dddddd"]
+    assert list(embeddings._batches(texts, max_items=10, max_chars=8)) == [[0, 1], [2, 3]]
+
+
+def test_oversize_text_goes_alone():
+    texts = ["aa", "x" * 50, "bb"]
+    assert list(embeddings._batches(texts, max_items=10, max_chars=10)) == [[0], [1], [2]]
+
+
+def test_post_batch_splits_around_bad_text(monkeypatch, run_async):
+    calls: List[List[str]] = []
+    monkeypatch.setattr(ollama, "post", _fake_post(calls, bad="bad"))
+
+    out = run_async(embeddings._post_batch(["a", "bb", "bad", "dddd"]))
+
+    assert out == [[1.0], [2.0], None, [4.0]]
+    assert calls[0] == ["a", "bb", "bad", "dddd"]
+    assert ["bad"] in calls
+
+
+def test_post_batch_splits_on_count_mismatch(monkeypatch, run_async):
+    calls: List[List[str]] = []
+
+    async def post(path, name, json=None, **kwargs):
+        texts = json["input"]
+        calls.append(list(texts))
+        vecs = [[1.0] for _ in texts]
+        return _Resp({"embeddings": vecs[:-1] if len(texts) > 1 else vecs})
+
+    monkeypatch.setattr(ollama, "post", post)
+
+    assert run_async(embeddings._post_batch(["a", "b"])) == [[1.0], [1.0]]
+    assert calls == [["a", "b"], ["a"], ["b"]]
+
+
+def test_post_batch_does_not_split_on_transport_error(monkeypatch, run_async):
+    calls: List[List[str]] = []
+    error = lambda: httpx.ConnectError("refused")  # noqa: E731
+    monkeypatch.setattr(ollama, "post", _fake_post(calls, bad="a", error=error))
+
+    assert run_async(embeddings._post_batch(["a", "b", "c"])) == [None, None, None]
+    assert len(calls) == 1
+
+
+@pytest.mark.parametrize("texts", [["", "aa", ""], ["x", "yy", "zzz"]])
+def test_embed_texts_keeps_order_and_skips_empty(monkeypatch, run_async, texts):
+    calls: List[List[str]] = []
+    monkeypatch.setattr(ollama, "post", _fake_post(calls))
+    monkeypatch.setattr(embeddings.settings, "embed_batch_max_items", 2, raising=False)
+    monkeypatch.setattr(embeddings.settings, "embed_batch_max_chars", 100, raising=False)
+
+    out = run_async(embeddings.embed_texts(texts))
+
+    assert out == [[float(len(t))] if t else None for t in texts]
+    assert all("" not in c for c in calls)
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import asyncio
+import copy
+import sys
+
+import pytest
+
+from app.services.pipeline import ffmpeg
+
+
+@pytest.fixture(autouse=True)
+def ffmpeg_settings(monkeypatch):
+    monkeypatch.setattr(ffmpeg.settings, "ffmpeg_profile", "fast", raising=False)
+    monkeypatch.setattr(ffmpeg.settings, "ffmpeg_use_soxr", False, raising=False)
+    monkeypatch.setattr(ffmpeg.settings, "ffmpeg_threads", 0, raising=False)
+    monkeypatch.setattr(ffmpeg.settings, "ffmpeg_filter_threads", 0, raising=False)
+    monkeypatch.setattr(ffmpeg.settings, "ffmpeg_probesize", "1M", raising=False)
+    monkeypatch.setattr(ffmpeg.settings, "ffmpeg_analyzeduration", "0", raising=False)
+    monkeypatch.setattr(ffmpeg.settings, "ffmpeg_max_concurrent", 1, raising=False)
+    monkeypatch.setattr(ffmpeg, "_slots", None)
+    monkeypatch.setattr(ffmpeg, "_metrics", copy.deepcopy(ffmpeg._metrics))
+
+
+def _opt(cmd, flag):
+    return cmd[cmd.index(flag) + 1] if flag in cmd else None
+
+
+def test_fast_profile_command():
+    cmd = ffmpeg.build_pcm_cmd("in.mp3", "out.wav")
+    assert cmd[:2] == ["ffmpeg", "-nostdin"]
+    assert _opt(cmd, "-probesize") == "1M" and _opt(cmd, "-analyzeduration") == "0"
+    assert cmd.index("-probesize") < cmd.index("-i")  # опции входа — до -i
+    assert "-af" not in cmd and "-threads" not in cmd
+    assert (_opt(cmd, "-i"), _opt(cmd, "-map")) == ("in.mp3", "a:0")
+    assert (_opt(cmd, "-ac"), _opt(cmd, "-ar"), _opt(cmd, "-sample_fmt")) == ("1", "16000", "s16")
+    assert (_opt(cmd, "-acodec"), _opt(cmd, "-f")) == ("pcm_s16le", "wav")
+    assert cmd[-1] == "out.wav"
+
+
+def test_quality_profile_command():
+    cmd = ffmpeg.build_pcm_cmd("in.mp3", "out.wav", profile="quality")
+    assert "-probesize" not in cmd and "-analyzeduration" not in cmd
+    assert "filter_size=64" in _opt(cmd, "-af")
+
+
+def test_soxr_profile_and_fast_with_soxr(monkeypatch):
+    cmd = ffmpeg.build_pcm_cmd("in.mp3", "out.wav", profile="soxr")
+    assert "resampler=soxr" in _opt(cmd, "-af") and _opt(cmd, "-probesize") == "1M"
+
+    monkeypatch.setattr(ffmpeg.settings, "ffmpeg_use_soxr", True, raising=False)
+    assert ffmpeg.profile_name() == "soxr"
+    assert ffmpeg.build_pcm_cmd("in.mp3", "out.wav") == cmd
+    assert ffmpeg.profile_name("quality") == "quality"
+
+
+def test_unknown_profile():
+    with pytest.raises(ValueError):
+        ffmpeg.build_pcm_cmd("in.mp3", "out.wav", profile="turbo")
+
+
+def test_threads_and_output_formats(monkeypatch):
+    monkeypatch.setattr(ffmpeg.settings, "ffmpeg_filter_threads", 2, raising=False)
+    cmd = ffmpeg.build_pcm_cmd("in.mp3", "-", fmt="s16le", threads=4)
+    assert _opt(cmd, "-threads") == "4" and _opt(cmd, "-filter_threads") == "2"
+    assert (_opt(cmd, "-acodec"), _opt(cmd, "-f"), cmd[-1]) == ("pcm_s16le", "s16le", "-")
+
+    flac = ffmpeg.build_pcm_cmd("in.mp3", "out.flac", fmt="flac")
+    assert (_opt(flac, "-acodec"), _opt(flac, "-f")) == ("flac", "flac")
+
+
+def test_probe_command():
+    cmd = ffmpeg.build_probe_cmd("in.mp3")
+    assert cmd[0] == "ffprobe" and cmd[-1] == "in.mp3"
+    assert _opt(cmd, "-probesize") == "1M"
+    assert (_opt(cmd, "-select_streams"), _opt(cmd, "-of")) == ("a:0", "json")
+    assert _opt(cmd, "-show_entries") == "stream=codec_name,channels,sample_rate"
+
+
+def _py(code: str):
+    return [sys.executable, "-c", code]
+
+
+def test_run_returns_stdout_and_accounts(run_async):
+    assert run_async(ffmpeg.run(_py("print('ok')"), name="t")) == b"ok\n"
+    s = ffmpeg.stats()
+    assert s["runs"] == 1 and s["failed"] == 0 and s["by_name"]["t"]["runs"] == 1
+    assert s["running"] == 0 and s["waiting"] == 0
+
+
+def test_run_with_nice_prefix(run_async):
+    out = run_async(ffmpeg.run(_py("import os; print(os.nice(0))"), name="bg", nice=5))
+    assert int(out) >= 5
+
+
+def test_run_failure_raises_with_stderr(run_async):
+    with pytest.raises(RuntimeError, match="boom"):
+        run_async(ffmpeg.run(_py("import sys; sys.stderr.write('boom'); sys.exit(3)"), name="bad"))
+    assert ffmpeg.stats()["failed"] == 1
+
+
+def test_async_and_sync_runs_share_slots(run_async):
+    sem = ffmpeg._get_slots()
+    sem.acquire()  # единственный слот занят (как будто run_sync в потоке пула)
+
+    async def scenario():
+        task = asyncio.ensure_future(ffmpeg.run(_py("print(1)"), name="t"))
+        await asyncio.sleep(0.2)
+        waiting = ffmpeg.stats()["waiting"]
+        done_early = task.done()
+        sem.release()
+        await task
+        return waiting, done_early
+
+    waiting, done_early = run_async(scenario())
+    assert waiting == 1 and not done_early
+    assert ffmpeg.stats()["max_running"] == 1
+
+
+def test_run_sync_uses_same_limit():
+    assert ffmpeg.run_sync(_py("print('s')"), name="sync") == b"s\n"
+    assert ffmpeg._get_slots().acquire(blocking=False)  # слот возвращён
+    ffmpeg._get_slots().release()
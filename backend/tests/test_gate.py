@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from app.services.pipeline import gate
+
+SR = 16000
+
+
+@pytest.fixture(autouse=True)
+def gate_settings(monkeypatch):
+    monkeypatch.setattr(gate.settings, "asr_gate_modes", "fixed,full", raising=False)
+    monkeypatch.setattr(gate.settings, "asr_gate_rms_db", -45.0, raising=False)
+    # белый шум даёт плоскостность ~0.56, тон — ~0: порог с запасом в обе стороны
+    monkeypatch.setattr(gate.settings, "asr_gate_flatness_max", 0.3, raising=False)
+    monkeypatch.setattr(gate.settings, "asr_gate_min_speech_ratio", 0.05, raising=False)
+    monkeypatch.setattr(gate.settings, "asr_gate_trim_pad_sec", 0.25, raising=False)
+
+
+def _tone(sec: float, amp: float = 0.3, freq: float = 200.0) -> np.ndarray:
+    t = np.arange(int(sec * SR)) / SR
+    return (amp * 32767 * np.sin(2 * np.pi * freq * t)).astype(np.int16)
+
+
+def _silence(sec: float) -> np.ndarray:
+    return np.zeros(int(sec * SR), dtype=np.int16)
+
+
+def _noise(sec: float, amp: float = 0.3, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return np.clip(rng.normal(0, amp * 32767, int(sec * SR)), -32768, 32767).astype(np.int16)
+
+
+@pytest.mark.parametrize(
+    "modes,mode,expected",
+    [
+        ("fixed,full", "fixed", True),
+        ("fixed,full", "full", True),
+        ("fixed,full", "vad", False),
+        ("fixed,full", "diarize", False),
+        ("fixed,full", None, False),
+        ("", "fixed", False),
+        (" full ", "full", True),
+    ],
+)
+def test_enabled_for_mode(monkeypatch, modes, mode, expected):
+    monkeypatch.setattr(gate.settings, "asr_gate_modes", modes, raising=False)
+    assert gate.enabled_for(mode) is expected
+
+
+def test_frame_features_separate_tone_from_noise():
+    frame = int(SR * gate.FRAME_SEC)
+    rms_tone, flat_tone = gate.frame_features(_tone(1.0), frame)
+    rms_noise, flat_noise = gate.frame_features(_noise(1.0), frame)
+    rms_sil, _ = gate.frame_features(_silence(1.0), frame)
+
+    assert rms_tone.shape == (40,)
+    assert np.all(np.abs(rms_tone - 20 * np.log10(0.3 / np.sqrt(2))) < 0.5)
+    assert np.all(rms_sil < -90)
+    assert np.median(flat_tone) < 0.05
+    assert np.median(flat_noise) > 0.4
+
+
+def test_silence_is_skipped():
+    d = gate.decide(_silence(5.0), 0.0, 5.0)
+    assert d.window is None and d.reason == "silence"
+
+
+def test_loud_noise_is_non_speech():
+    d = gate.decide(_noise(5.0), 0.0, 5.0)
+    assert d.window is None and d.reason == "non_speech"
+
+
+def test_voiced_window_is_kept_whole():
+    d = gate.decide(_tone(5.0), 3.0, 8.0)
+    assert d.window == (3.0, 8.0) and d.reason is None
+    assert d.speech_ratio > 0.95
+
+
+def test_rms_threshold(monkeypatch):
+    quiet = _tone(2.0, amp=0.001)  # ~-63 dBFS
+    assert gate.decide(quiet, 0.0, 2.0).reason == "silence"
+    monkeypatch.setattr(gate.settings, "asr_gate_rms_db", -70.0, raising=False)
+    assert gate.decide(quiet, 0.0, 2.0).window == (0.0, 2.0)
+
+
+def test_trim_leading_and_trailing_silence():
+    samples = np.concatenate([_silence(2.0), _tone(1.0), _silence(2.0)])
+    d = gate.decide(samples, 10.0, 15.0)
+
+    assert d.reason == "trimmed"
+    start, end = d.window
+    assert start == pytest.approx(12.0 - 0.25, abs=gate.FRAME_SEC)
+    assert end == pytest.approx(13.0 + 0.25, abs=gate.FRAME_SEC)
+    assert 10.0 <= start < end <= 15.0
+
+
+def test_trim_never_leaves_window_bounds():
+    samples = np.concatenate([_silence(0.1), _tone(4.0), _silence(0.9)])
+    d = gate.decide(samples, 0.0, 5.0)
+    start, end = d.window
+    assert start == 0.0  # отступ pad не уводит начало за границу окна
+    assert end == pytest.approx(4.1 + 0.25, abs=gate.FRAME_SEC)
+
+
+def test_summarize_counts_skipped_and_trimmed():
+    windows = [(0.0, 5.0), (5.0, 10.0), (10.0, 15.0)]
+    decisions = [
+        gate.GateDecision(window=None, reason="silence"),
+        gate.GateDecision(window=(6.0, 9.0), reason="trimmed"),
+        gate.GateDecision(window=(10.0, 15.0)),
+    ]
+    s = gate.summarize(decisions, windows)
+    assert s["skipped"] == 1 and s["trimmed"] == 1
+    assert s["reasons"] == {"silence": 1, "trimmed": 1}
+    assert s["skipped_sec"] == 5.0 and s["trimmed_sec"] == 2.0
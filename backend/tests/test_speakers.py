@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+from sqlalchemy import select
+
+from app.db import models
+from app.services import speakers
+
+DIM = models.SPEAKER_EMBEDDING_DIM
+
+
+def _axis(i: int, scale: float = 1.0) -> np.ndarray:
+    v = np.zeros(DIM, np.float32)
+    v[i] = scale
+    return v
+
+
+def test_normalize():
+    out = speakers._normalize(_axis(3, 5.0))
+    assert len(out) == DIM and out[3] == pytest.approx(1.0)
+    assert np.linalg.norm(speakers._normalize(np.ones((1, DIM)))) == pytest.approx(1.0)
+
+    bad = _axis(0)
+    bad[1] = np.nan
+    assert speakers._normalize(bad) is None
+    assert speakers._normalize(np.zeros(DIM)) is None
+    assert speakers._normalize(np.ones(DIM - 1)) is None
+
+
+async def _transcript(session_maker, user_id=1) -> int:
+    async with session_maker() as s:
+        tr = models.MfgTranscript(meeting_id=1, filename="a.wav", status="done", user_id=user_id)
+        s.add(tr)
+        await s.commit()
+        return tr.id
+
+
+async def _embedding(session_maker, tid: int, speaker: str, vec: np.ndarray) -> None:
+    async with session_maker() as s:
+        s.add(models.MfgSpeakerEmbedding(
+            transcript_id=tid, speaker=speaker, embedding=speakers._normalize(vec), enrolled=False,
+        ))
+        await s.commit()
+
+
+async def _speaker(session_maker, tid: int, speaker: str):
+    async with session_maker() as s:
+        return (await s.execute(
+            select(models.MfgSpeaker).where(models.MfgSpeaker.transcript_id == tid, models.MfgSpeaker.speaker == speaker)
+        )).scalars().first()
+
+
+def test_fill_speaker_respects_manual_name_unless_forced(session_maker, run_async):
+    profile = models.MfgSpeakerProfile(display_name="Иван", color="#ff0000")
+
+    async def go():
+        tid = await _transcript(session_maker)
+        async with session_maker() as s:
+            s.add(models.MfgSpeaker(transcript_id=tid, speaker="SPEAKER_00", display_name="Маша", is_active=True))
+            s.add(models.MfgSpeaker(transcript_id=tid, speaker="SPEAKER_01", display_name=None, is_active=True))
+            await s.commit()
+        async with session_maker() as s:
+            await speakers._fill_speaker(s, tid, "SPEAKER_00", profile, force=False)
+            await speakers._fill_speaker(s, tid, "SPEAKER_01", profile, force=False)
+            await speakers._fill_speaker(s, tid, "SPEAKER_02", profile, force=False)
+            await s.commit()
+        manual = await _speaker(session_maker, tid, "SPEAKER_00")
+        empty = await _speaker(session_maker, tid, "SPEAKER_01")
+        new = await _speaker(session_maker, tid, "SPEAKER_02")
+        async with session_maker() as s:
+            await speakers._fill_speaker(s, tid, "SPEAKER_00", profile, force=True)
+            await s.commit()
+        forced = await _speaker(session_maker, tid, "SPEAKER_00")
+        return manual, empty, new, forced
+
+    manual, empty, new, forced = run_async(go())
+    assert (manual.display_name, manual.color) == ("Маша", None)  # ручное имя не перетёрто
+    assert (empty.display_name, empty.color) == ("Иван", "#ff0000")
+    assert (new.display_name, new.color) == ("Иван", "#ff0000")
+    assert (forced.display_name, forced.color) == ("Иван", "#ff0000")
+
+
+def test_enroll_creates_profile_and_links_speaker(session_maker, run_async):
+    async def go():
+        tid = await _transcript(session_maker)
+        await _embedding(session_maker, tid, "SPEAKER_00", _axis(0, 3.0))
+        async with session_maker() as s:
+            profile = await speakers.enroll(s, tid, "SPEAKER_00", display_name="Иван", color="#00ff00", user_id=1)
+        async with session_maker() as s:
+            row = (await s.execute(select(models.MfgSpeakerEmbedding))).scalars().one()
+        return profile, row, await _speaker(session_maker, tid, "SPEAKER_00")
+
+    profile, row, sp = run_async(go())
+    assert profile.n_samples == 1 and profile.user_id == 1
+    assert np.asarray(profile.embedding)[0] == pytest.approx(1.0)
+    assert row.profile_id == profile.id and row.enrolled and row.distance == 0.0
+    assert sp.display_name == "Иван"
+
+
+def test_enroll_averages_into_existing_profile(session_maker, run_async):
+    async def go():
+        tid = await _transcript(session_maker)
+        await _embedding(session_maker, tid, "SPEAKER_00", _axis(1))
+        async with session_maker() as s:
+            p = models.MfgSpeakerProfile(user_id=1, display_name="Иван", embedding=speakers._normalize(_axis(0)), n_samples=3)
+            s.add(p)
+            await s.commit()
+            pid = p.id
+        async with session_maker() as s:
+            return await speakers.enroll(s, tid, "SPEAKER_00", profile_id=pid, user_id=1)
+
+    profile = run_async(go())
+    emb = np.asarray(profile.embedding)
+    # (3·e0 + e1) / 4 после нормировки
+    expected = np.array([3.0, 1.0]) / np.sqrt(10.0)
+    assert emb[:2] == pytest.approx(expected, abs=1e-5)
+    assert np.linalg.norm(emb) == pytest.approx(1.0, abs=1e-5)
+    assert profile.n_samples == 4 and profile.display_name == "Иван"
+
+
+def test_enroll_errors(session_maker, run_async):
+    async def go():
+        tid = await _transcript(session_maker)
+        await _embedding(session_maker, tid, "SPEAKER_00", _axis(0))
+        async with session_maker() as s:
+            foreign = models.MfgSpeakerProfile(user_id=2, display_name="Чужой", embedding=speakers._normalize(_axis(0)))
+            s.add(foreign)
+            await s.commit()
+        errors = []
+        for kwargs in (
+            dict(speaker="SPEAKER_09", display_name="X"),
+            dict(speaker="SPEAKER_00"),
+            dict(speaker="SPEAKER_00", profile_id=foreign.id),
+        ):
+            async with session_maker() as s:
+                try:
+                    await speakers.enroll(s, tid, user_id=1, **kwargs)
+                except Exception as exc:  # noqa: BLE001
+                    errors.append(type(exc))
+        return errors
+
+    assert run_async(go()) == [LookupError, ValueError, LookupError]
+
+
+def test_match_transcript_threshold_and_enrolled_rows(session_maker, run_async, monkeypatch):
+    async def go():
+        tid = await _transcript(session_maker)
+        for i, name in enumerate(["SPEAKER_00", "SPEAKER_01", "SPEAKER_02"]):
+            await _embedding(session_maker, tid, name, _axis(i))
+        async with session_maker() as s:
+            near = models.MfgSpeakerProfile(user_id=1, display_name="Иван", embedding=speakers._normalize(_axis(0)))
+            pinned = models.MfgSpeakerProfile(user_id=1, display_name="Пётр", embedding=speakers._normalize(_axis(5)))
+            s.add_all([near, pinned])
+            await s.commit()
+            row = (await s.execute(select(models.MfgSpeakerEmbedding).where(
+                models.MfgSpeakerEmbedding.speaker == "SPEAKER_02"))).scalars().one()
+            row.profile_id, row.enrolled, row.distance = pinned.id, True, 0.0
+            await s.commit()
+
+        distances = {0: 0.2, 1: 0.5, 2: 0.01}
+
+        async def nearest(session, user_id, embedding):
+            assert user_id == 1
+            k = int(np.argmax(np.asarray(embedding)))
+            return near, distances[k]
+
+        monkeypatch.setattr(speakers, "_nearest_profile", nearest)
+        async with session_maker() as s:
+            result = await speakers.match_transcript(s, tid, threshold=0.35)
+        async with session_maker() as s:
+            stored = await speakers.list_matches(s, tid)
+        return result, stored, near.id, pinned.id, await _speaker(session_maker, tid, "SPEAKER_00")
+
+    result, stored, near_id, pinned_id, sp = run_async(go())
+    by = {m["speaker"]: m for m in result}
+    assert by["SPEAKER_00"]["matched"] and by["SPEAKER_00"]["profile_id"] == near_id
+    assert not by["SPEAKER_01"]["matched"] and by["SPEAKER_01"]["distance"] == 0.5
+    # ручная привязка не пересматривается, хоть ближайший профиль и другой
+    assert by["SPEAKER_02"]["matched"] and by["SPEAKER_02"]["profile_id"] == pinned_id
+    assert sp.display_name == "Иван"
+    assert {m["speaker"]: m["profile_id"] for m in stored} == {
+        "SPEAKER_00": near_id, "SPEAKER_01": None, "SPEAKER_02": pinned_id,
+    }
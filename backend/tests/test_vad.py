@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import wave
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from app.services.pipeline import vad
+
+SR = 16000
+
+
+def _reference_regions(mask, frame_ms, min_speech_ms, min_silence_ms):
+    """Покадровый автомат речь/тишина (как в исходном webrtc-цикле) — эталон; длительности в кадрах."""
+    out = []
+    in_speech, start, silence = False, None, 0
+    for i, is_speech in enumerate(mask):
+        if is_speech:
+            if not in_speech:
+                in_speech, start = True, i
+            silence = 0
+        elif in_speech:
+            silence += frame_ms
+            if silence >= min_silence_ms:
+                if (i - start) * frame_ms >= min_speech_ms:
+                    out.append((start * frame_ms / 1000.0, i * frame_ms / 1000.0))
+                in_speech, start, silence = False, None, 0
+    if in_speech and (len(mask) - start) * frame_ms >= min_speech_ms:
+        out.append((start * frame_ms / 1000.0, len(mask) * frame_ms / 1000.0))
+    return out
+
+
+def _mask_runs(mask, bounds):
+    """Серии True из маски, разрезанные по границам шардов bounds."""
+    runs = []
+    for a, b in bounds:
+        start = None
+        for i in range(a, b):
+            if mask[i] and start is None:
+                start = i
+            elif not mask[i] and start is not None:
+                runs.append((start, i, True))
+                start = None
+        if start is not None:
+            runs.append((start, b, True))
+    return runs
+
+
+def _as_tuples(segs):
+    return [(round(s.start_ts, 6), round(s.end_ts, 6)) for s in segs]
+
+
+@pytest.mark.parametrize("shard_frames", [7, 50, 333, 10_000])
+def test_regions_from_runs_match_reference_across_shards(shard_frames):
+    rng = np.random.default_rng(0)
+    mask = rng.random(3000) < 0.35
+    mask[1000:1400] = True  # длинная речь через границы шардов
+    mask[2000:2100] = False
+    n = len(mask)
+    bounds = [(a, min(a + shard_frames, n)) for a in range(0, n, shard_frames)]
+
+    got = vad._regions_from_runs(_mask_runs(mask, bounds), n, 20, 100, 60)
+    ref = [(round(s, 6), round(e, 6)) for s, e in _reference_regions(mask, 20, 100, 60)]
+    assert _as_tuples(got) == ref
+
+
+def _write_wav(path: Path, samples: np.ndarray) -> None:
+    with wave.open(str(path), "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(SR)
+        wf.writeframes(samples.astype("<i2").tobytes())
+
+
+def _synthetic_speech(seconds: float) -> np.ndarray:
+    rng = np.random.default_rng(1)
+    t = np.arange(int(seconds * SR)) / SR
+    x = rng.normal(0, 30, t.shape)  # фоновый шум ~ -60 dBFS
+    for start in np.arange(0.5, seconds - 1.0, 3.7):
+        dur = 0.4 + (start * 7 % 2.5)
+        sl = slice(int(start * SR), int(min(seconds, start + dur) * SR))
+        x[sl] += 6000 * np.sin(2 * np.pi * 180 * t[sl])
+    return np.clip(x, -32768, 32767).astype(np.int16)
+
+
+def test_sharded_energy_vad_matches_serial(tmp_path, run_async, monkeypatch):
+    monkeypatch.setattr(vad.settings, "vad_backend", "energy", raising=False)
+    monkeypatch.setattr(vad.settings, "inference_processes", 0, raising=False)
+    wav = tmp_path / "speech.wav"
+    _write_wav(wav, _synthetic_speech(95.0))
+
+    p = dict(vad._vad_params(), shard_sec=10.0)
+    with vad.pcm.open_pcm(str(wav)) as store:
+        serial = list(vad._iter_merge_and_chunk(
+            vad._iter_raw_regions(store.samples, store.sample_rate, p),
+            p["max_gap_sec"], p["max_len_sec"], p["overlap_sec"],
+        ))
+        n_frames = vad._n_frames(store.samples, store.sample_rate, p["frame_ms"])
+
+    sharded = run_async(vad._vad_sharded(str(wav), p, n_frames))
+    assert serial
+    assert _as_tuples(sharded) == _as_tuples(serial)
+
+
+def _voiced(seconds: float) -> np.ndarray:
+    """Гармонический «голос» (F0 140 Гц, слоговая АМ 4 Гц) фразами 1–3 с с паузами — webrtcvad его видит."""
+    rng = np.random.default_rng(2)
+    t = np.arange(int(seconds * SR)) / SR
+    voice = sum(np.sin(2 * np.pi * 140 * k * t) / k for k in range(1, 16))
+    voice *= 0.6 + 0.4 * np.sin(2 * np.pi * 4 * t)
+    x = rng.normal(0, 30, t.shape)
+    for start in np.arange(0.5, seconds - 3.0, 4.3):
+        dur = 1.0 + (start * 3 % 2.0)
+        sl = slice(int(start * SR), int((start + dur) * SR))
+        x[sl] += 3000 * voice[sl]
+    return np.clip(x, -32768, 32767).astype(np.int16)
+
+
+def _speech_mask(segs, seconds: float) -> np.ndarray:
+    mask = np.zeros(int(seconds * 100) + 1, dtype=bool)
+    for s in segs:
+        mask[int(s.start_ts * 100): int(np.ceil(s.end_ts * 100))] = True
+    return mask
+
+
+def test_sharded_webrtc_vad_close_to_serial(tmp_path, run_async, monkeypatch):
+    """webrtc адаптирует модель шума, поэтому не побитно: речь на стыках шардов не теряется (прогрев)."""
+    monkeypatch.setattr(vad.settings, "vad_backend", "webrtc", raising=False)
+    monkeypatch.setattr(vad.settings, "inference_processes", 0, raising=False)
+    seconds = 95.0
+    wav = tmp_path / "voiced.wav"
+    _write_wav(wav, _voiced(seconds))
+
+    p = dict(vad._vad_params(), shard_sec=10.0)
+    with vad.pcm.open_pcm(str(wav)) as store:
+        serial = list(vad._iter_merge_and_chunk(
+            vad._iter_raw_regions(store.samples, store.sample_rate, p),
+            p["max_gap_sec"], p["max_len_sec"], p["overlap_sec"],
+        ))
+        n_frames = vad._n_frames(store.samples, store.sample_rate, p["frame_ms"])
+
+    sharded = run_async(vad._vad_sharded(str(wav), p, n_frames))
+    assert serial
+    a, b = _speech_mask(serial, seconds), _speech_mask(sharded, seconds)
+    assert np.count_nonzero(a & b) / np.count_nonzero(a | b) >= 0.95
+
+
+def test_no_shards_without_process_pool(monkeypatch):
+    p = dict(vad._vad_params(), shard_min_file_sec=60.0, shard_sec=10.0)
+    monkeypatch.setattr(vad.settings, "inference_processes", 0, raising=False)
+    assert not vad._use_shards(p, 3600.0)
+    monkeypatch.setattr(vad.settings, "inference_processes", 2, raising=False)
+    assert vad._use_shards(p, 3600.0)
+
+
+def _check_fixed_windows(segs, total, win, ovl, snap):
+    assert segs[0].start_ts == 0.0 and segs[-1].end_ts == pytest.approx(total)
+    for s in segs:
+        assert s.end_ts > s.start_ts  # пустых окон нет
+        assert s.end_ts - s.start_ts <= win + snap + 1e-6
+    for a, b in zip(segs, segs[1:]):
+        assert b.start_ts > a.start_ts and b.end_ts > a.end_ts
+        assert a.end_ts - b.start_ts == pytest.approx(ovl)  # перекрытие ровно overlap, не больше
+        # рез сдвинут не дальше snap от номинального конца окна
+        assert abs(a.end_ts - min(a.start_ts + win, total)) <= snap + 1e-6
+
+
+def test_fixed_windows_snap_to_pauses():
+    seconds, win, ovl, snap = 100.0, 30.0, 5.0, 2.0
+    rng = np.random.default_rng(3)
+    samples = rng.normal(0, 3000, int(seconds * SR)).astype(np.int16)
+    pauses = [29.0, 53.5, 80.2]  # в пределах ±snap от номинальных резов 30, 55, 80
+    for p in pauses:
+        samples[int(p * SR): int((p + 0.3) * SR)] = 0
+
+    segs = vad._fixed_windows(samples, SR, seconds, win, ovl, snap)
+
+    _check_fixed_windows(segs, seconds, win, ovl, snap)
+    for p, s in zip(pauses, segs):
+        assert p <= s.end_ts <= p + 0.3  # рез попал в паузу
+
+
+def test_fixed_windows_without_snap_are_a_grid():
+    samples = np.ones(int(70 * SR), dtype=np.int16)
+    segs = vad._fixed_windows(samples, SR, 70.0, 30.0, 5.0, 0.0)
+    assert [(s.start_ts, s.end_ts) for s in segs] == [(0.0, 30.0), (25.0, 55.0), (50.0, 70.0)]
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("win,ovl,snap", [(30.0, 5.0, 2.0), (10.0, 5.0, 5.0), (6.0, 1.0, 8.0), (5.0, 0.0, 1.0)])
+def test_fixed_windows_snap_never_stalls(seed, win, ovl, snap):
+    rng = np.random.default_rng(seed)
+    seconds = float(rng.uniform(20.0, 90.0))
+    samples = (rng.normal(0, 1, int(seconds * SR)) * rng.uniform(0, 5000, int(seconds * SR))).astype(np.int16)
+
+    segs = vad._fixed_windows(samples, SR, seconds, win, ovl, snap)
+
+    _check_fixed_windows(segs, seconds, win, ovl, snap)
@@ -0,0 +1,71 @@
+"""
+Форматы нормализованного аудио (DERIVED_AUDIO_FORMAT): место на диске против задержки чтения окна.
+
+    python -m tools.bench_audio_format path/to/audio [--windows 200] [--win-sec 30]
+
+Исходник конвертируется в каждый формат во временный каталог той же командой ffmpeg,
+что и в пайплайне (ffmpeg.build_pcm_cmd по FFMPEG_PROFILE), без БД и media_cache. Для каждого формата печатается размер (с сайдкаром), МБ на час
+аудио, время конвертации и открытия, задержка случайных окон (p50/p95) — так,
+как их читает ASR через pcm.open_pcm.
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from app.services.pipeline import ffmpeg, pcm
+
+
+def file_size(path: str) -> int:
+    side = pcm.sidecar_path(path)
+    return Path(path).stat().st_size + (side.stat().st_size if side.exists() else 0)
+
+
+def bench_format(src: str, tmpdir: str, fmt: str, windows: int, win_sec: float, seed: int):
+    dst = Path(tmpdir) / f"bench{pcm.DERIVED_FORMATS[fmt]}"
+    t0 = time.perf_counter()
+    cmd = ffmpeg.build_pcm_cmd(src, str(dst), fmt="s16le" if fmt == "pcm" else fmt)
+    asyncio.run(ffmpeg.run(cmd, name="bench"))
+    if fmt == "pcm":
+        pcm.write_sidecar(str(dst))
+    conv = time.perf_counter() - t0
+    out = str(dst)
+
+    t0 = time.perf_counter()
+    with pcm.open_pcm(out) as store:
+        opened = time.perf_counter() - t0
+        dur = store.duration
+        rng = np.random.default_rng(seed)
+        starts = rng.uniform(0.0, max(0.0, dur - win_sec), size=windows)
+        lat = []
+        for s in starts:
+            t0 = time.perf_counter()
+            store.window(float(s), float(s) + win_sec)
+            lat.append(time.perf_counter() - t0)
+    return out, file_size(out), dur, conv, opened, np.asarray(lat)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("audio")
+    ap.add_argument("--windows", type=int, default=200)
+    ap.add_argument("--win-sec", type=float, default=30.0)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for fmt in pcm.DERIVED_FORMATS:
+            _, size, dur, conv, opened, lat = bench_format(
+                args.audio, tmpdir, fmt, args.windows, args.win_sec, args.seed
+            )
+            per_hour = size / 1e6 / (dur / 3600.0) if dur else 0.0
+            print(f"{fmt:5s} size={size / 1e6:.1f}MB ({per_hour:.1f} MB/h) convert={conv:.2f}s "
+                  f"open={opened * 1e3:.1f}ms window p50={np.median(lat) * 1e3:.2f}ms "
+                  f"p95={np.percentile(lat, 95) * 1e3:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Сравнение движков VAD (webrtc vs energy) на одном файле: скорость и согласие.
+
+    python -m tools.bench_vad path/to/audio [--repeat 3]
+
+Файл приводится к WAV 16k mono тем же конвертером, что и пайплайн. Для каждого
+движка печатается время, RTF, число сырых регионов и секунды речи; согласие —
+покадровое (10 мс) совпадение речь/не-речь и IoU речевых масок.
+"""
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.pipeline import pcm
+from app.services.pipeline.media import convert_to_wav16k_mono
+from app.services.pipeline.vad import _iter_raw_regions, _vad_params
+
+RES_SEC = 0.01
+
+
+def run_backend(wav16k: str, backend: str, repeat: int):
+    p = dict(_vad_params(), backend=backend)
+    best = None
+    with pcm.open_pcm(wav16k) as store:
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            segs = list(_iter_raw_regions(store.samples, store.sample_rate, p))
+            dt = time.perf_counter() - t0
+            best = dt if best is None else min(best, dt)
+        return segs, best, store.duration
+
+
+def speech_mask(segs, duration: float) -> np.ndarray:
+    mask = np.zeros(int(np.ceil(duration / RES_SEC)) + 1, dtype=bool)
+    for s in segs:
+        mask[int(s.start_ts / RES_SEC): int(np.ceil(s.end_ts / RES_SEC))] = True
+    return mask
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("audio")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    wav16k = asyncio.run(convert_to_wav16k_mono(args.audio, threads=settings.ffmpeg_threads))
+    masks = {}
+    for backend in ("webrtc", "energy"):
+        segs, dt, dur = run_backend(wav16k, backend, args.repeat)
+        speech = sum(s.end_ts - s.start_ts for s in segs)
+        print(f"{backend:7s} time={dt:.3f}s RTF={dt / dur if dur else 0:.5f} "
+              f"regions={len(segs)} speech={speech:.1f}s of {dur:.1f}s")
+        masks[backend] = speech_mask(segs, dur)
+
+    a, b = masks["webrtc"], masks["energy"]
+    union = np.count_nonzero(a | b)
+    print(f"agreement={np.mean(a == b):.4f} IoU={np.count_nonzero(a & b) / union if union else 1.0:.4f}")
+
+
+if __name__ == "__main__":
+    main()